@@ -12,5 +12,20 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
+# Serve /graphql with the async view (crm.views.AsyncCRMGraphQLView)
+os.environ.setdefault('CRM_ASYNC_GRAPHQL', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once the app registry is ready
+from graphql_crm.schema import schema  # noqa: E402
+from crm.websocket import GraphQLWebSocketApp  # noqa: E402
+
+# GraphQL subscriptions (graphql-transport-ws) share the /graphql path
+websocket_application = GraphQLWebSocketApp(schema, path="/graphql")
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,6 +53,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Drops out of the stack unless CRM_CAPTURE["ENABLED"] is set
+    'crm.capture.GraphQLCaptureMiddleware',
 ]
 
 CRONJOBS = [
@@ -90,8 +93,107 @@ DATABASES = {
     }
 }
 
+# Local read replica: a copy of db.sqlite3 that manage.py crm_replicate keeps
+# refreshing, e.g. CRM_DB_REPLICA=db.replica.sqlite3 (see crm/routing.py)
+CRM_DB_REPLICA = os.environ.get("CRM_DB_REPLICA")
+if CRM_DB_REPLICA:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': CRM_DB_REPLICA,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ["crm.routing.ReplicaRouter"]
+
+# GraphQL query operations read a replica; mutations and their clients' next reads the primary
+CRM_DATABASE_ROUTING = {
+    "REPLICAS": [alias for alias in DATABASES if alias != 'default'],
+    "STICKY_SECONDS": 10,         # after a write, wait this long for replicas to catch up
+}
+
 GRAPHENE = {
-    "SCHEMA": "graphql_crm.schema.schema"  # path to your main schema object
+    "SCHEMA": "graphql_crm.schema.schema",  # path to your main schema object
+    # Setting MIDDLEWARE replaces graphene's default, so keep its debug middleware
+    "MIDDLEWARE": ["crm.metrics.MetricsMiddleware"]
+    + (["graphene_django.debug.DjangoDebugMiddleware"] if DEBUG else []),
+}
+
+# Persisted queries for the /graphql view (see crm/persisted_queries.py)
+CRM_PERSISTED_QUERIES = {
+    "MANIFEST": None,             # JSON file of {sha256: query} registered ahead of time
+    "ALLOW_REGISTRATION": True,   # APQ: register unknown hashes on first use
+    "DOCUMENT_CACHE_SIZE": 256,   # parsed + validated documents kept per process
+}
+
+# Static query cost limits for the /graphql view (see crm/cost.py)
+CRM_QUERY_COST = {
+    "MAX_COST": 10000,            # reject operations estimated above this
+    "MAX_DEPTH": 15,              # deepest field nesting allowed
+    "DEFAULT_LIST_SIZE": 100,     # assumed size of lists without first/last
+    "FIELD_WEIGHTS": {},          # e.g. {"Mutation.createOrder": 10}
+    "THROTTLE_BUDGET": None,      # cost a client may spend per window
+    "THROTTLE_WINDOW": 60,        # seconds
+}
+
+# Serve /graphql with the async view; asgi.py turns this on (see crm/views.py)
+CRM_ASYNC_GRAPHQL = os.environ.get("CRM_ASYNC_GRAPHQL") == "1"
+
+# Opt-in cache of query responses, keyed on per-table write versions (see crm/response_cache.py)
+CRM_RESPONSE_CACHE = {
+    "ENABLED": False,
+    "CACHE": "crm-responses",     # alias below; MAX_ENTRIES bounds the LRU
+    "TIMEOUT": 300,               # seconds an unchanged entry may be served
+}
+
+# GraphQL subscriptions over websockets on the ASGI app (see crm/pubsub.py)
+CRM_SUBSCRIPTIONS = {
+    "QUEUE_SIZE": 100,            # events a subscriber may lag before it is ended
+    "MAX_SUBSCRIPTIONS": 20,      # per websocket connection
+    "CONNECTION_INIT_TIMEOUT": 10,  # seconds to send connection_init
+}
+
+# Latency, error and SQL metrics served at /metrics in Prometheus format (see crm/metrics.py)
+CRM_METRICS = {
+    "ENABLED": True,
+    "SAMPLE_RATE": 0.1,           # fraction of operations timed per field and per statement
+    "TIME_SCALAR_FIELDS": False,  # scalar fields are attribute reads; skip them
+    "MAX_OPERATION_NAMES": 200,   # distinct operation_name labels before "other"
+}
+
+# Dev-mode SQL tracing of GraphQL operations; logs likely N+1s (see crm/query_trace.py)
+CRM_QUERY_TRACE = {
+    "ENABLED": DEBUG,
+    "N_PLUS_ONE_THRESHOLD": 3,    # similar statements per operation that get logged
+}
+
+# Sampled /graphql traffic written as JSON lines for crm_replay (see crm/capture.py)
+CRM_CAPTURE = {
+    "ENABLED": False,
+    "PATH": None,                 # defaults to BASE_DIR/captures/graphql.jsonl
+    "SAMPLE_RATE": 0.1,           # fraction of operations written
+    "MAX_BYTES": 50 * 1024 * 1024,  # rotate the file at this size
+    "BACKUP_COUNT": 5,            # rotated files kept
+}
+
+# Daily order reminders sent by crm_send_order_reminders (see crm/reminders.py)
+CRM_REMINDERS = {
+    "SENDER": "crm.reminders.FileSender",  # or crm.reminders.EmailSender for EMAIL_BACKEND
+    "OUTBOX": "/tmp/order_reminders_outbox.jsonl",
+    "WINDOW_DAYS": 7,             # orders younger than this get a reminder
+    "WORKERS": 8,                 # concurrent sends
+    "RATE_LIMIT": 50,             # sends per second across workers
+    "MAX_ATTEMPTS": 3,            # tries before a reminder waits for the next run
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "crm-responses": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "crm-responses",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
 }
 
 # Password validation
@@ -14,16 +14,22 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
 from graphql_crm.schema import schema
+from crm.views import AsyncCRMGraphQLView, CRMGraphQLView, export_view, metrics_view
 
 
+graphql_view = csrf_exempt(CRMGraphQLView.as_view(graphiql=True, schema=schema))
+async_graphql_view = csrf_exempt(AsyncCRMGraphQLView.as_view(graphiql=True, schema=schema))
 
 
 urlpatterns = [
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema))),
+    path("graphql", async_graphql_view if settings.CRM_ASYNC_GRAPHQL else graphql_view),
+    path("graphql/async", async_graphql_view, name="crm-graphql-async"),
+    path("metrics", metrics_view, name="crm-metrics"),
+    path("export/<str:model_name>.ndjson", export_view, name="crm-export"),
     path('admin/', admin.site.urls),
 ]
@@ -0,0 +1,257 @@
+"""
+Set-based creation of customers, products and orders.
+
+Shared by the bulk mutations and ``manage.py crm_import`` so both apply
+the same validation rules as ``CreateCustomer``/``CreateProduct``/
+``CreateOrder``. Each function takes a sequence of mappings (GraphQL input
+objects or parsed file rows) and returns ``(created, errors)`` where
+``errors`` maps a row's index to its messages. Invalid rows are skipped;
+valid ones are written with ``bulk_create``, which bypasses signals, so the
+dashboard counters are bumped and subscription events queued here.
+"""
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .counters import bump
+from .inventory import ReservationFailed, reserve_stock_bulk
+from .models import Customer, Product, Order
+from .pubsub import orders_created, stock_changed
+from .rollups import fold_late_orders
+
+PHONE_PATTERN = re.compile(r"^(\+\d{1,15}|(\d{3}-\d{3}-\d{4}))$")
+
+# Rows per INSERT; Django lowers it further to fit SQLite's parameter limit
+BULK_CREATE_BATCH_SIZE = 500
+
+
+def existing_emails(emails):
+    """Return which of ``emails`` are already taken, probing in parameter-sized chunks."""
+    emails = list(emails)
+    chunk = connection.features.max_query_params or len(emails) or 1
+    taken = set()
+    for start in range(0, len(emails), chunk):
+        taken.update(
+            Customer.objects.filter(email__in=emails[start:start + chunk])
+            .values_list("email", flat=True)
+        )
+    return taken
+
+
+def _clean(value):
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+def _missing(data, fields):
+    return [f"Missing required field: {name}" for name in fields if not _clean(data.get(name))]
+
+
+def _datetime(value):
+    """``value`` as an aware datetime, or None when blank; raises ``ValueError`` when unparseable."""
+    if not isinstance(value, datetime):
+        text = _clean(value)
+        if text is None:
+            return None
+        # parse_datetime raises ValueError itself for well-formed but impossible dates
+        value = parse_datetime(text)
+        if value is None:
+            raise ValueError(text)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+# -------------------------------
+# Customers
+# -------------------------------
+def bulk_create_customers(rows):
+    errors = {}
+    valid = {}  # email -> (idx, Customer), first occurrence wins
+
+    # 1. Validate each row in memory
+    for idx, data in enumerate(rows):
+        local_errors = _missing(data, ("name", "email"))
+        if local_errors:
+            errors[idx] = local_errors
+            continue
+        email = _clean(data.get("email"))
+        phone = _clean(data.get("phone"))
+        if email in valid:
+            local_errors.append(f"Duplicate email in input: {email}")
+        if phone and not PHONE_PATTERN.match(phone):
+            local_errors.append(f"Invalid phone format for {email}")
+
+        if local_errors:
+            errors[idx] = local_errors
+            continue
+        valid[email] = (idx, Customer(name=_clean(data.get("name")), email=email, phone=phone))
+
+    # 2. One uniqueness probe for the whole payload
+    for email in existing_emails(valid):
+        idx, _ = valid.pop(email)
+        errors.setdefault(idx, []).append(f"Duplicate email: {email}")
+
+    # 3. Insert in batches; a batch that races another writer is re-probed until it goes in
+    created = []
+    pending = [customer for _, customer in sorted(valid.values(), key=lambda row: row[0])]
+    for start in range(0, len(pending), BULK_CREATE_BATCH_SIZE):
+        batch = pending[start:start + BULK_CREATE_BATCH_SIZE]
+        while batch:
+            try:
+                with transaction.atomic():
+                    inserted = Customer.objects.bulk_create(batch)
+                    bump(customers=len(inserted))
+            except IntegrityError as e:
+                taken = existing_emails(c.email for c in batch)
+                if not taken:
+                    # Not an email clash; nothing left to retry, so report the rows
+                    for customer in batch:
+                        idx, _ = valid[customer.email]
+                        errors.setdefault(idx, []).append(f"Could not create customer: {e}")
+                    break
+                for email in taken:
+                    idx, _ = valid[email]
+                    errors.setdefault(idx, []).append(f"Duplicate email: {email}")
+                batch = [c for c in batch if c.email not in taken]
+            else:
+                created += inserted
+                break
+    return created, errors
+
+
+# -------------------------------
+# Products
+# -------------------------------
+def bulk_create_products(rows):
+    errors = {}
+    pending = []
+    for idx, data in enumerate(rows):
+        local_errors = _missing(data, ("name", "price"))
+        if local_errors:
+            errors[idx] = local_errors
+            continue
+
+        try:
+            price = Decimal(str(data.get("price")).strip())
+            if not price.is_finite():
+                raise InvalidOperation
+            if price <= 0:
+                local_errors.append("Price must be a positive number.")
+        except InvalidOperation:
+            local_errors.append("Invalid decimal format for price.")
+
+        stock = data.get("stock")
+        try:
+            stock = int(stock) if _clean(stock) is not None else 0
+            if stock < 0:
+                local_errors.append("Stock cannot be negative.")
+        except (TypeError, ValueError):
+            local_errors.append("Invalid stock value.")
+
+        if local_errors:
+            errors[idx] = local_errors
+            continue
+        pending.append(Product(name=_clean(data.get("name")), price=price, stock=stock))
+
+    created = Product.objects.bulk_create(pending, batch_size=BULK_CREATE_BATCH_SIZE)
+    stock_changed(product.pk for product in created)
+    return created, errors
+
+
+# -------------------------------
+# Orders
+# -------------------------------
+def bulk_create_orders(rows, reserve_stock=True):
+    """
+    Create orders with two IN queries for their references, one stock
+    UPDATE per chunk and two bulk INSERTs (orders, then through rows).
+    A row's ``order_date`` (a datetime or ISO 8601 string) is kept as
+    given and defaults to now; naive values are in the current time zone.
+
+    Raises ``ReservationFailed`` when another writer took stock between the
+    read and the conditional UPDATE; the caller's transaction must roll back.
+    """
+    errors = {}
+    parsed = []  # (idx, customer_id, product_ids, order_date)
+    for idx, data in enumerate(rows):
+        try:
+            customer_id = int(data.get("customer_id"))
+            product_ids = sorted({int(pk) for pk in data.get("product_ids") or []})
+        except (TypeError, ValueError):
+            errors[idx] = ["Invalid customer or product ID."]
+            continue
+        if not product_ids:
+            errors[idx] = ["At least one product ID is required."]
+            continue
+        try:
+            order_date = _datetime(data.get("order_date"))
+        except ValueError:
+            errors[idx] = [f"Invalid order date: {data.get('order_date')}"]
+            continue
+        parsed.append((idx, customer_id, product_ids, order_date))
+
+    with transaction.atomic():
+        # Two IN queries resolve every reference in the batch
+        customers = Customer.objects.in_bulk({item[1] for item in parsed})
+        products = Product.objects.in_bulk({pk for item in parsed for pk in item[2]})
+
+        stock = {pk: product.stock for pk, product in products.items()}
+        taken = {}
+        accepted = []
+        now = timezone.now()
+        for idx, customer_id, product_ids, order_date in parsed:
+            local_errors = []
+            if customer_id not in customers:
+                local_errors.append("Invalid customer ID.")
+            invalid = [str(pk) for pk in product_ids if pk not in products]
+            if invalid:
+                local_errors.append(f"Invalid product IDs: {', '.join(invalid)}")
+            elif reserve_stock:
+                sold_out = [str(pk) for pk in product_ids if stock[pk] < 1]
+                if sold_out:
+                    local_errors.append(f"Insufficient stock for product IDs: {', '.join(sold_out)}")
+            if local_errors:
+                errors[idx] = local_errors
+                continue
+
+            for pk in product_ids:
+                stock[pk] -= 1
+                taken[pk] = taken.get(pk, 0) + 1
+            accepted.append((customer_id, product_ids, order_date or now))
+
+        # The conditional UPDATE re-checks stock in case another writer got there first
+        if reserve_stock and not reserve_stock_bulk(taken):
+            raise ReservationFailed()
+
+        orders = Order.objects.bulk_create(
+            [
+                Order(
+                    customer_id=customer_id,
+                    order_date=order_date,
+                    total_amount=sum(products[pk].price for pk in product_ids),
+                )
+                for customer_id, product_ids, order_date in accepted
+            ],
+            batch_size=BULK_CREATE_BATCH_SIZE,
+        )
+        Order.products.through.objects.bulk_create(
+            [
+                Order.products.through(order_id=order.pk, product_id=pk)
+                for order, (_, product_ids, _) in zip(orders, accepted)
+                for pk in product_ids
+            ],
+            batch_size=BULK_CREATE_BATCH_SIZE,
+        )
+        # bulk_create sends no post_save, so the counters are bumped here
+        bump(orders=len(orders), revenue=sum(order.total_amount for order in orders))
+        if any(item[3] for item in parsed):
+            # Historical dates land behind the rollup watermark
+            fold_late_orders(orders)
+        orders_created(order.pk for order in orders)
+    return orders, errors
@@ -0,0 +1,169 @@
+"""
+Sampled capture of /graphql traffic for ``manage.py crm_replay``.
+
+``GraphQLCaptureMiddleware`` appends one JSON line per sampled operation
+to a rotating file: arrival time, document hash, operation name, query
+text, variables, status and server time. Requests that send only a
+persisted-query hash are resolved against the persisted-query store, so
+every line can be replayed on its own. Lines carry client variables
+verbatim; treat capture files like access logs.
+
+The middleware removes itself at startup unless ``ENABLED`` is set, and
+then costs nothing. Each process writes its own file; give workers
+distinct ``PATH`` values, since rotation is not safe across processes.
+"""
+import json
+import logging
+import os
+import random
+import time
+from logging.handlers import RotatingFileHandler
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, RequestDataTooBig
+
+from .persisted_queries import get_extensions, lookup_query, query_hash
+
+DEFAULTS = {
+    # Off unless turned on; the middleware then drops out of the stack
+    "ENABLED": False,
+    # Capture file; rotated copies get .1, .2, ... suffixes
+    "PATH": None,
+    # Fraction of operations written
+    "SAMPLE_RATE": 0.1,
+    # Rotate when the file reaches this size, keeping BACKUP_COUNT old files
+    "MAX_BYTES": 50 * 1024 * 1024,
+    "BACKUP_COUNT": 5,
+    # Request paths captured
+    "PATHS": ["/graphql", "/graphql/async"],
+}
+
+
+def get_setting(name):
+    return getattr(settings, "CRM_CAPTURE", {}).get(name, DEFAULTS[name])
+
+
+def get_capture_path():
+    return get_setting("PATH") or os.path.join(settings.BASE_DIR, "captures", "graphql.jsonl")
+
+
+def get_capture_logger():
+    """Logger writing bare lines to the rotating capture file; configured once per process."""
+    logger = logging.getLogger("crm.capture.traffic")
+    if not logger.handlers:
+        path = get_capture_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = RotatingFileHandler(
+            path, maxBytes=get_setting("MAX_BYTES"), backupCount=get_setting("BACKUP_COUNT"),
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+# -------------------------------
+# Request Parsing
+# -------------------------------
+def read_operations(request):
+    """The ``(query, variables, operation_name, extensions)`` entries a request carried."""
+    if request.method == "GET":
+        entries = [request.GET]
+    else:
+        try:
+            if request.content_type == "application/json":
+                body = json.loads(request.body or b"{}")
+                entries = body if isinstance(body, list) else [body]
+            else:
+                entries = [request.POST]
+        except (ValueError, RequestDataTooBig):
+            return []
+
+    operations = []
+    for data in entries:
+        if not hasattr(data, "get"):
+            continue
+        variables = data.get("variables")
+        if isinstance(variables, str):
+            try:
+                variables = json.loads(variables)
+            except ValueError:
+                variables = None
+        operations.append((
+            data.get("query"),
+            variables if isinstance(variables, dict) else None,
+            data.get("operationName"),
+            get_extensions(request, data),
+        ))
+    return operations
+
+
+def capture_entry(received, query, variables, operation_name, extensions, status, duration):
+    digest = (extensions.get("persistedQuery") or {}).get("sha256Hash")
+    if not query and digest:
+        query = lookup_query(digest)
+    if not query:
+        return None
+    return {
+        "ts": round(received, 6),
+        "hash": query_hash(query),
+        "operationName": operation_name,
+        "query": query,
+        "variables": variables,
+        "status": status,
+        "duration_ms": round(duration * 1000, 3),
+    }
+
+
+# -------------------------------
+# Middleware
+# -------------------------------
+class GraphQLCaptureMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_setting("ENABLED"):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.paths = {path.rstrip("/") for path in get_setting("PATHS")}
+        self.sample_rate = get_setting("SAMPLE_RATE")
+        self.logger = get_capture_logger()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled(request):
+            return self.get_response(request)
+        received, started = time.time(), time.perf_counter()
+        response = self.get_response(request)
+        self.write(request, response, received, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled(request):
+            return await self.get_response(request)
+        received, started = time.time(), time.perf_counter()
+        response = await self.get_response(request)
+        self.write(request, response, received, time.perf_counter() - started)
+        return response
+
+    def sampled(self, request):
+        return (
+            request.method in ("GET", "POST")
+            and request.path_info.rstrip("/") in self.paths
+            and random.random() < self.sample_rate
+        )
+
+    def write(self, request, response, received, duration):
+        for query, variables, operation_name, extensions in read_operations(request):
+            entry = capture_entry(
+                received, query, variables, operation_name, extensions, response.status_code, duration
+            )
+            if entry is not None:
+                self.logger.info(json.dumps(entry, default=str, separators=(",", ":")))
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.schedules import crontab
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
@@ -13,6 +14,15 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Auto-discover tasks from installed apps
 app.autodiscover_tasks()
 
+# Periodic tasks
+app.conf.beat_schedule = {
+    # Keep revenueByPeriod / topProducts within a few minutes of live data
+    'refresh-revenue-rollups': {
+        'task': 'crm.tasks.refresh_revenue_rollups',
+        'schedule': crontab(minute='*/5'),
+    },
+}
+
 
 @app.task(bind=True)
 def debug_task(self):
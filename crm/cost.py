@@ -0,0 +1,192 @@
+"""
+Static query cost analysis for the /graphql view.
+
+Runs after validation and before execution. Every field has a weight
+(composite fields 1, scalars 0, overridable per ``Type.field``) and every
+list multiplies the cost of its selection by its expected size: the
+``first``/``last`` argument when given (clamped to ``[0, page limit]``),
+otherwise the connection page limit or a default list size. Queries over budget never reach a resolver.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from graphene.validation import depth_limit_validator
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLObjectType,
+    InlineFragmentNode,
+    get_named_type,
+    get_nullable_type,
+    is_composite_type,
+    is_list_type,
+    specified_rules,
+)
+from graphql.execution.values import get_argument_values
+
+THROTTLE_PREFIX = "crm:query-cost:"
+
+DEFAULTS = {
+    # Highest cost a single operation may have; None disables the limit
+    "MAX_COST": 10000,
+    # Deepest field nesting allowed (relay edges/node count as levels)
+    "MAX_DEPTH": 15,
+    # Assumed size of lists that take no first/last argument
+    "DEFAULT_LIST_SIZE": graphene_settings.RELAY_CONNECTION_MAX_LIMIT or 100,
+    # Per-field weights, e.g. {"Mutation.createOrder": 10}
+    "FIELD_WEIGHTS": {},
+    # Total cost a client may spend per window; None disables throttling
+    "THROTTLE_BUDGET": None,
+    "THROTTLE_WINDOW": 60,
+}
+
+
+def get_setting(name):
+    return getattr(settings, "CRM_QUERY_COST", {}).get(name, DEFAULTS[name])
+
+
+def get_validation_rules():
+    """The standard rules plus the configured depth limit."""
+    max_depth = get_setting("MAX_DEPTH")
+    if max_depth is None:
+        return None
+    return (*specified_rules, depth_limit_validator(max_depth=max_depth))
+
+
+class QueryCostError(Exception):
+    def __init__(self, message, code, cost):
+        super().__init__(message)
+        self.code = code
+        self.cost = cost
+
+
+def is_connection(graphql_type):
+    return (
+        isinstance(graphql_type, GraphQLObjectType)
+        and "edges" in graphql_type.fields
+        and "pageInfo" in graphql_type.fields
+    )
+
+
+# -------------------------------
+# Analyzer
+# -------------------------------
+class QueryCostAnalyzer:
+    def __init__(self, schema, document, variables=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if definition.kind == "fragment_definition"
+        }
+        self.weights = get_setting("FIELD_WEIGHTS")
+        self.default_list_size = get_setting("DEFAULT_LIST_SIZE")
+        self.max_list_size = graphene_settings.RELAY_CONNECTION_MAX_LIMIT or float("inf")
+
+    def operation_cost(self, operation):
+        root_type = self.schema.get_root_type(operation.operation)
+        return self.selection_cost(operation.selection_set, root_type, visited=())
+
+    def selection_cost(self, selection_set, parent_type, visited):
+        total = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                total += self.field_cost(selection, parent_type, visited)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value)
+                total += self.selection_cost(selection.selection_set, fragment_type, visited)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                # Validation rejects fragment cycles; this only guards the walk
+                if name in visited or name not in self.fragments:
+                    continue
+                fragment = self.fragments[name]
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                total += self.selection_cost(
+                    fragment.selection_set, fragment_type, visited + (name,)
+                )
+        return total
+
+    def field_cost(self, node, parent_type, visited):
+        name = node.name.value
+        fields = getattr(parent_type, "fields", {})
+        if name.startswith("__") or name not in fields:
+            return 0
+
+        field_def = fields[name]
+        named_type = get_named_type(field_def.type)
+        default_weight = 1 if is_composite_type(named_type) else 0
+        weight = self.weights.get(f"{parent_type.name}.{name}", default_weight)
+        if node.selection_set is None:
+            return weight
+
+        size = self.list_size(node, field_def, parent_type, named_type)
+        return weight + size * self.selection_cost(node.selection_set, named_type, visited)
+
+    def list_size(self, node, field_def, parent_type, named_type):
+        args = get_argument_values(field_def, node, self.variables)
+        requested = [args[key] for key in ("first", "last") if args.get(key) is not None]
+        if requested:
+            # A negative size would subtract from the total; resolvers cap the rest
+            return min(max(max(requested), 0), self.max_list_size)
+        if is_connection(named_type):
+            return self.default_list_size
+        # Edges are already counted by the connection that owns them
+        if is_list_type(get_nullable_type(field_def.type)) and not is_connection(parent_type):
+            return self.default_list_size
+        return 1
+
+
+def query_cost(schema, document, operation, variables):
+    """The cost of ``operation``; ``QueryCostError`` when it is over the per-query limit."""
+    cost = QueryCostAnalyzer(schema, document, variables).operation_cost(operation)
+
+    max_cost = get_setting("MAX_COST")
+    if max_cost is not None and cost > max_cost:
+        raise QueryCostError(
+            f"Query cost {cost} exceeds the maximum of {max_cost}.", "QUERY_TOO_EXPENSIVE", cost
+        )
+    return cost
+
+
+def charge_query_cost(client_id, cost):
+    """Spend ``cost`` from the client's throttle budget; ``QueryCostError`` once it is exhausted."""
+    budget = get_setting("THROTTLE_BUDGET")
+    if budget is None:
+        return
+    key, window = THROTTLE_PREFIX + client_id, get_setting("THROTTLE_WINDOW")
+    cache.add(key, 0, timeout=window)
+    try:
+        spent = cache.incr(key, cost)
+    except ValueError:
+        # The window expired between add() and incr()
+        cache.set(key, cost, timeout=window)
+        spent = cost
+    check_budget(spent, budget, cost)
+
+
+async def acharge_query_cost(client_id, cost):
+    """``charge_query_cost`` through the async cache API."""
+    budget = get_setting("THROTTLE_BUDGET")
+    if budget is None:
+        return
+    key, window = THROTTLE_PREFIX + client_id, get_setting("THROTTLE_WINDOW")
+    await cache.aadd(key, 0, timeout=window)
+    try:
+        spent = await cache.aincr(key, cost)
+    except ValueError:
+        await cache.aset(key, cost, timeout=window)
+        spent = cost
+    check_budget(spent, budget, cost)
+
+
+def check_budget(spent, budget, cost):
+    if spent > budget:
+        raise QueryCostError(
+            f"Query cost budget of {budget} per {get_setting('THROTTLE_WINDOW')}s exhausted.",
+            "QUERY_THROTTLED",
+            cost,
+        )
@@ -1,10 +1,25 @@
 import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from gql import gql
+
+from .local_client import local_client
+
+HEARTBEAT_QUERY = gql("{ hello }")
+RESTOCK_MUTATION = gql("""
+    mutation {
+        updateLowStockProducts {
+            message
+            updatedProducts {
+                id
+                name
+                stock
+            }
+        }
+    }
+""")
 
 
 def log_crm_heartbeat():
-    """Logs a CRM heartbeat and verifies the GraphQL endpoint using gql client."""
+    """Logs a CRM heartbeat and verifies the GraphQL schema answers using gql client."""
     log_file = "/tmp/crm_heartbeat_log.txt"
     timestamp = datetime.datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
     message = f"{timestamp} CRM is alive"
@@ -13,22 +28,12 @@ def log_crm_heartbeat():
     with open(log_file, "a") as f:
         f.write(message + "\n")
 
-    # Configure GraphQL client transport
-    transport = RequestsHTTPTransport(
-        url="http://localhost:8000/graphql",
-        verify=False,         # Disable SSL verification if using localhost
-        retries=3,            # Retry on transient errors
-        timeout=5             # 5-second timeout
-    )
-
-    client = Client(transport=transport, fetch_schema_from_transport=False)
-
-    # Define GraphQL query
-    query = gql("{ hello }")
+    # Runs in-process against the schema; no web worker needed
+    client = local_client()
 
     # Try sending query
     try:
-        response = client.execute(query)
+        response = client.execute(HEARTBEAT_QUERY)
         hello_value = response.get("hello", "No response")
 
         with open(log_file, "a") as f:
@@ -44,31 +49,11 @@ def update_low_stock():
     log_file = "/tmp/low_stock_updates_log.txt"
     timestamp = datetime.datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
 
-    # Setup GraphQL client transport
-    transport = RequestsHTTPTransport(
-        url="http://localhost:8000/graphql",
-        verify=False,
-        retries=3,
-        timeout=5
-    )
-
-    client = Client(transport=transport, fetch_schema_from_transport=False)
-
-    mutation = gql("""
-        mutation {
-            updateLowStockProducts {
-                message
-                updatedProducts {
-                    id
-                    name
-                    stock
-                }
-            }
-        }
-    """)
+    # Runs in-process against the schema; no web worker needed
+    client = local_client()
 
     try:
-        response = client.execute(mutation)
+        response = client.execute(RESTOCK_MUTATION)
         result = response["updateLowStockProducts"]
         message = result["message"]
 
@@ -7,14 +7,9 @@ LOG_FILE="/tmp/customer_cleanup_log.txt"
 # Activate the virtual environment
 source "$PROJECT_DIR/../../cenv/bin/activate"
 
-# Run the Django shell command to delete inactive customers
-COUNT=$(python "$PROJECT_DIR/manage.py" shell -c "
-from datetime import date, timedelta
-from crm.models import Customer
-one_year_ago = date.today() - timedelta(days=365)
-deleted, _ = Customer.objects.filter(order__isnull=True, created_at__lt=one_year_ago).delete()
-print(deleted)
-")
+# Delete customers older than a year with no orders, in short chunked transactions
+COUNT=$(python "$PROJECT_DIR/manage.py" crm_clean_inactive_customers --days 365 --throttle 0.05 --no-color \
+    | sed -n 's/^Deleted \([0-9]*\) inactive customers.*/\1/p')
 
 # Log the count with timestamp
-echo \"$(date '+%Y-%m-%d %H:%M:%S') - Deleted $COUNT inactive customers\" >> \"$LOG_FILE\"
+echo "$(date '+%Y-%m-%d %H:%M:%S') - Deleted $COUNT inactive customers" >> "$LOG_FILE"
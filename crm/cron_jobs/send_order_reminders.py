@@ -1,52 +1,29 @@
 #!/usr/bin/env python3
-import datetime
+import io
 import logging
-# import requests
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+import os
+import sys
 
-# Configure logging
-log_file = "/tmp/order_reminders_log.txt"
-logging.basicConfig(filename=log_file, level=logging.INFO, format="%(asctime)s - %(message)s")
+# Run against the project in-process: no web server has to be up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
 
-# Define GraphQL endpoint
-transport = RequestsHTTPTransport(
-    url="http://localhost:8000/graphql",
-    verify=False,
-    retries=3,
-)
+import django  # noqa: E402
 
-client = Client(transport=transport, fetch_schema_from_transport=True)
+django.setup()
 
-# Calculate date range (orders within last 7 days)
-today = datetime.date.today()
-seven_days_ago = today - datetime.timedelta(days=7)
+from django.core.management import call_command  # noqa: E402
 
-# GraphQL query for pending orders
-query = gql(
-    """
-    query GetRecentOrders($startDate: Date!, $endDate: Date!) {
-      orders(filter: {orderDate_Gte: $startDate, orderDate_Lte: $endDate, status: "PENDING"}) {
-        id
-        customer {
-          email
-        }
-        orderDate
-      }
-    }
-    """
-)
+# Configure logging
+log_file = "/tmp/order_reminders_log.txt"
+logging.basicConfig(filename=log_file, level=logging.INFO, format="%(asctime)s - %(message)s")
 
-# Execute query
-params = {"startDate": str(seven_days_ago), "endDate": str(today)}
+# One reminder per customer with orders in the last 7 days; earlier runs' sends are skipped
+output = io.StringIO()
 try:
-    result = client.execute(query, variable_values=params)
-    orders = result.get("orders", [])
-    for order in orders:
-        order_id = order["id"]
-        email = order["customer"]["email"]
-        logging.info(f"Order ID: {order_id}, Customer Email: {email}")
+    call_command("crm_send_order_reminders", days=7, no_color=True, stdout=output)
+    logging.info(output.getvalue().strip())
 except Exception as e:
-    logging.error(f"Error fetching orders: {e}")
+    logging.error(f"Error sending order reminders: {e}")
 
 print("Order reminders processed!")
@@ -0,0 +1,115 @@
+"""
+Chunked deletion of customers and everything they own.
+
+``Model.delete()`` collects every related object into memory, sends a
+``post_delete`` signal per order (two counter updates each) and holds one
+write transaction for the whole cascade; on SQLite that blocks every other
+writer until it is done. ``delete_customers`` instead walks the matching
+customers in primary-key ranges and cascades with raw ``DELETE ... WHERE
+... IN`` statements: order lines, orders, customer rollups, reminder
+state, customers. Each transaction removes at most ``chunk_size``
+customers or orders, and ``throttle`` sleeps between transactions so
+other writers get the lock.
+
+No signals are sent, so the counters are bumped here inside each chunk's
+transaction (crm/counters.py). Product rollups keep deleted orders until
+``crm_refresh_rollups --rebuild``, as they do for ORM deletes, and the
+response-cache table versions move through their triggers as usual.
+"""
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .counters import bump
+from .models import Customer, CustomerRevenueRollup, Order, OrderReminder
+
+# Customers or orders per transaction; under SQLite's 999 bound parameters
+DELETE_CHUNK_SIZE = 500
+# Seconds between transactions
+DELETE_THROTTLE = 0.0
+
+INACTIVE_DAYS = 365
+
+COUNTS = ("customers", "orders", "order_lines", "rollups")
+
+
+def inactive_customers(days=INACTIVE_DAYS):
+    """Customers older than ``days`` who never placed an order."""
+    return Customer.objects.filter(
+        orders__isnull=True, created_at__lt=timezone.now() - timedelta(days=days)
+    )
+
+
+def delete_customers(queryset, chunk_size=DELETE_CHUNK_SIZE, throttle=DELETE_THROTTLE, progress=None):
+    """
+    Delete the customers in ``queryset`` with their orders; returns counts.
+
+    ``queryset`` is re-evaluated for every chunk, so a customer that stops
+    matching (an inactive one placing an order) before its chunk is reached
+    is kept. ``progress`` is called with the running counts after each
+    chunk of customers.
+    """
+    counts = dict.fromkeys(COUNTS, 0)
+    last = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                queryset.filter(pk__gt=last).order_by("pk").values_list("pk", flat=True)[:chunk_size]
+            )
+            if not ids:
+                return counts
+            done = _delete_chunk(ids, chunk_size, counts)
+        last = ids[-1]
+
+        # Customers with more orders than fit one transaction take several
+        while not done:
+            time.sleep(throttle)
+            with transaction.atomic():
+                remaining = list(queryset.filter(pk__in=ids).values_list("pk", flat=True))
+                done = _delete_chunk(remaining, chunk_size, counts)
+
+        if progress is not None:
+            progress(dict(counts))
+        if len(ids) < chunk_size:
+            return counts
+        time.sleep(throttle)
+
+
+def _delete_chunk(customer_ids, chunk_size, counts):
+    """
+    Delete up to ``chunk_size`` orders of ``customer_ids``; once none are
+    left, the customers themselves. Returns whether the customers are gone.
+    """
+    orders = list(
+        Order.objects.filter(customer_id__in=customer_ids)
+        .order_by("pk")
+        .values_list("pk", "total_amount")[:chunk_size]
+    )
+    order_ids = [pk for pk, _ in orders]
+    deltas = {"orders": -len(orders), "revenue": -sum(amount for _, amount in orders)}
+    counts["order_lines"] += _delete_in(Order.products.through, "order_id", order_ids)
+    counts["orders"] += _delete_in(Order, "id", order_ids)
+
+    done = len(orders) < chunk_size
+    if done:
+        counts["rollups"] += _delete_in(CustomerRevenueRollup, "customer_id", customer_ids)
+        _delete_in(OrderReminder, "customer_id", customer_ids)
+        deleted = _delete_in(Customer, "id", customer_ids)
+        counts["customers"] += deleted
+        deltas["customers"] = -deleted
+    bump(**deltas)
+    return done
+
+
+def _delete_in(model, column, ids):
+    if not ids:
+        return 0
+    quote = connection.ops.quote_name
+    sql = "DELETE FROM {} WHERE {} IN ({})".format(
+        quote(model._meta.db_table), quote(column), ", ".join(["%s"] * len(ids))
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, ids)
+        return cursor.rowcount
@@ -0,0 +1,97 @@
+"""
+Streaming NDJSON export of customers, products and orders.
+
+The GraphQL list fields build the whole result in memory before the first
+byte goes out. ``/export/<model>.ndjson`` instead walks the table in
+keyset batches (``WHERE id > last ORDER BY id LIMIT n``) and yields one
+JSON line per row, so memory stays flat however large the table is. Under
+ASGI the batches come from the async ORM (``aiter_ndjson``). The query
+string accepts the same filters as the relay connections.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .models import Customer, Product, Order
+
+EXPORT_BATCH_SIZE = 2000
+
+EXPORTS = {
+    "customers": (Customer, CustomerFilter, ("id", "name", "email", "phone", "created_at")),
+    "products": (Product, ProductFilter, ("id", "name", "price", "stock")),
+    "orders": (Order, OrderFilter, ("id", "customer_id", "total_amount", "order_date")),
+}
+
+
+def product_ids_by_order(order_ids):
+    """``{order_id: [product_id, ...]}`` for one batch, in a single query."""
+    grouped = {pk: [] for pk in order_ids}
+    for order_id, product_id in order_products(order_ids).iterator(chunk_size=EXPORT_BATCH_SIZE):
+        grouped[order_id].append(product_id)
+    return grouped
+
+
+async def aproduct_ids_by_order(order_ids):
+    grouped = {pk: [] for pk in order_ids}
+    async for order_id, product_id in order_products(order_ids):
+        grouped[order_id].append(product_id)
+    return grouped
+
+
+def order_products(order_ids):
+    return (
+        Order.products.through.objects
+        .filter(order_id__in=order_ids)
+        .order_by("order_id", "product_id")
+        .values_list("order_id", "product_id")
+    )
+
+
+def next_batch(queryset, fields, last_id, batch_size):
+    """The ``batch_size`` rows after ``last_id``, seeking instead of using OFFSET."""
+    page = queryset.order_by("pk")
+    if last_id is not None:
+        page = page.filter(pk__gt=last_id)
+    return page.values(*fields)[:batch_size]
+
+
+def iter_ndjson(model_name, queryset, fields, batch_size=EXPORT_BATCH_SIZE):
+    encoder = DjangoJSONEncoder()
+    last_id = None
+    while True:
+        rows = list(next_batch(queryset, fields, last_id, batch_size).iterator(chunk_size=batch_size))
+        if not rows:
+            return
+        if model_name == "orders":
+            add_product_ids(rows, product_ids_by_order([row["id"] for row in rows]))
+        yield encode(encoder, rows)
+        last_id = rows[-1]["id"]
+        if len(rows) < batch_size:
+            return
+
+
+async def aiter_ndjson(model_name, queryset, fields, batch_size=EXPORT_BATCH_SIZE):
+    """
+    ``iter_ndjson`` for ASGI. Django buffers a sync iterator into a list
+    before sending it to an ASGI server, so this yields from the async ORM.
+    """
+    encoder = DjangoJSONEncoder()
+    last_id = None
+    while True:
+        rows = [row async for row in next_batch(queryset, fields, last_id, batch_size)]
+        if not rows:
+            return
+        if model_name == "orders":
+            add_product_ids(rows, await aproduct_ids_by_order([row["id"] for row in rows]))
+        yield encode(encoder, rows)
+        last_id = rows[-1]["id"]
+        if len(rows) < batch_size:
+            return
+
+
+def add_product_ids(rows, products):
+    for row in rows:
+        row["product_ids"] = products[row["id"]]
+
+
+def encode(encoder, rows):
+    return "".join(encoder.encode(row) + "\n" for row in rows)
@@ -1,6 +1,7 @@
 import django_filters
 from django.db.models import Q
 from .models import Customer, Product, Order
+from .search import search_customers, search_orders, search_products
 
 
 class CustomerFilter(django_filters.FilterSet):
@@ -15,6 +16,12 @@ class CustomerFilter(django_filters.FilterSet):
     # Challenge: Filter by phone number pattern (e.g., starts with +1)
     phone_starts_with = django_filters.CharFilter(method='filter_phone_pattern')
 
+    # Full-text prefix search over name and email (FTS5 on SQLite)
+    search = django_filters.CharFilter(method='filter_search')
+
+    def filter_search(self, queryset, name, value):
+        return search_customers(queryset, value)
+
     def filter_phone_pattern(self, queryset, name, value):
         """Custom filter to match customers whose phone starts with a specific pattern."""
         return queryset.filter(phone__startswith=value)
@@ -37,6 +44,12 @@ class ProductFilter(django_filters.FilterSet):
     # Challenge: Filter products with low stock (e.g., stock < 10)
     low_stock = django_filters.BooleanFilter(method='filter_low_stock')
 
+    # Full-text prefix search over name (FTS5 on SQLite)
+    search = django_filters.CharFilter(method='filter_search')
+
+    def filter_search(self, queryset, name, value):
+        return search_products(queryset, value)
+
     def filter_low_stock(self, queryset, name, value):
         """Return only low-stock products if True."""
         if value:
@@ -62,6 +75,12 @@ class OrderFilter(django_filters.FilterSet):
     # Challenge: Filter orders that include a specific product ID
     product_id = django_filters.NumberFilter(method='filter_by_product_id')
 
+    # Full-text prefix search over the customer's and products' names
+    search = django_filters.CharFilter(method='filter_search')
+
+    def filter_search(self, queryset, name, value):
+        return search_orders(queryset, value)
+
     def filter_by_product_id(self, queryset, name, value):
         """Return orders that include a specific product ID."""
         return queryset.filter(products__id=value).distinct()
@@ -0,0 +1,186 @@
+"""
+Stock reservation for order creation.
+
+Reservation is a single conditional ``UPDATE ... SET stock = stock - 1
+WHERE id IN (...) AND stock >= 1`` so concurrent checkouts can never push
+stock below zero: the database, not Python, decides who gets the last
+unit. On backends with ``RETURNING`` the same statement hands back the
+prices, so the order total costs no extra round trip.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, Exists, F, IntegerField, Value, When
+
+from .models import Customer, Product
+from .pubsub import stock_changed
+
+CENTS = Decimal("0.01")
+
+# Backends whose UPDATE supports RETURNING (SQLite 3.35+, PostgreSQL)
+RETURNING_VENDORS = {"sqlite", "postgresql"}
+
+
+class ReservationFailed(Exception):
+    """Raised inside the order transaction to roll back a partial reservation."""
+
+
+def reserve_stock(customer_id, product_ids):
+    """
+    Take one unit of each product for ``customer_id`` and return ``{id: price}``.
+
+    Only rows that were actually decremented are returned; the caller must
+    roll back when fewer than ``len(product_ids)`` come back. The customer
+    check rides along as an ``EXISTS`` so a bad customer reserves nothing.
+    """
+    if not product_ids:
+        return {}
+    if connection.vendor in RETURNING_VENDORS:
+        prices = _reserve_returning(customer_id, product_ids)
+    else:
+        prices = _reserve_update(customer_id, product_ids)
+    # Announced on commit, so a rolled-back reservation publishes nothing
+    stock_changed(prices)
+    return prices
+
+
+def _reserve_update(customer_id, product_ids):
+    reserved = (
+        Product.objects
+        .filter(pk__in=product_ids, stock__gte=1)
+        .filter(Exists(Customer.objects.filter(pk=customer_id)))
+        .update(stock=F("stock") - 1)
+    )
+    if reserved != len(product_ids):
+        return {}
+    return dict(Product.objects.filter(pk__in=product_ids).values_list("pk", "price"))
+
+
+def _reserve_returning(customer_id, product_ids):
+    qn = connection.ops.quote_name
+    opts = Product._meta
+    pk, stock, price = opts.pk.column, opts.get_field("stock").column, opts.get_field("price").column
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    sql = (
+        f"UPDATE {qn(opts.db_table)} SET {qn(stock)} = {qn(stock)} - 1 "
+        f"WHERE {qn(pk)} IN ({placeholders}) AND {qn(stock)} >= 1 "
+        f"AND EXISTS (SELECT 1 FROM {qn(Customer._meta.db_table)} "
+        f"WHERE {qn(Customer._meta.pk.column)} = %s) "
+        f"RETURNING {qn(pk)}, {qn(price)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*product_ids, customer_id])
+        rows = cursor.fetchall()
+
+    # Raw rows skip Django's converters; SQLite hands decimals back as floats
+    to_decimal = opts.get_field("price").to_python
+    return {row_id: to_decimal(value).quantize(CENTS) for row_id, value in rows}
+
+
+def reserve_stock_bulk(quantities, chunk_size=400):
+    """
+    Take ``quantities[product_id]`` units of each product in set-based UPDATEs.
+
+    One ``stock = stock - CASE id WHEN ... END`` statement per chunk,
+    guarded by the same CASE so no row can go negative. Returns False when
+    any row fell short; the caller must then roll back.
+    """
+    items = sorted(quantities.items())
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        needed = Case(
+            *[When(pk=pk, then=Value(units)) for pk, units in chunk],
+            output_field=IntegerField(),
+        )
+        reserved = (
+            Product.objects
+            .filter(pk__in=[pk for pk, _ in chunk], stock__gte=needed)
+            .update(stock=F("stock") - needed)
+        )
+        if reserved != len(chunk):
+            return False
+    stock_changed(quantities)
+    return True
+
+
+def order_errors(customer_id, product_ids):
+    """Explain a failed reservation as ``(field, message)`` pairs; never empty. Only runs on failure."""
+    errors = []
+    if not Customer.objects.filter(pk=customer_id).exists():
+        errors.append(("customer_id", "Invalid customer ID."))
+
+    stock = dict(Product.objects.filter(pk__in=product_ids).values_list("pk", "stock"))
+    invalid = [str(pk) for pk in product_ids if pk not in stock]
+    if invalid:
+        errors.append(("product_ids", f"Invalid product IDs: {', '.join(invalid)}"))
+    sold_out = [str(pk) for pk in product_ids if pk in stock and stock[pk] < 1]
+    if sold_out:
+        errors.append(("product_ids", f"Insufficient stock for product IDs: {', '.join(sold_out)}"))
+    if not errors:
+        # Another writer changed stock between the UPDATE and these reads
+        errors.append(("product_ids", "Stock changed while the order was placed; retry it."))
+    return errors
+
+
+# -------------------------------
+# Restocking
+# -------------------------------
+# Matching rows per UPDATE; keeps each write transaction short on big tables
+RESTOCK_CHUNK_SIZE = 10000
+
+
+def restock_low_stock(threshold, amount, chunk_size=RESTOCK_CHUNK_SIZE):
+    """
+    Add ``amount`` to every product with ``stock < threshold`` and return them.
+
+    Batches seek over the matching rows (``pk > last ORDER BY pk``), so
+    sparse matches cost one transaction per ``chunk_size`` rows, not per id
+    range. Each batch is one ``UPDATE ... SET stock = stock + amount``; the
+    changed rows come back through ``RETURNING`` or, elsewhere, from a
+    single fetch by id.
+    """
+    low_stock = Product.objects.filter(stock__lt=threshold).order_by("pk")
+    updated = []
+    last = None
+    while True:
+        with transaction.atomic():
+            batch = low_stock if last is None else low_stock.filter(pk__gt=last)
+            ids = list(batch.select_for_update().values_list("pk", flat=True)[:chunk_size])
+            if not ids:
+                return updated
+            if connection.vendor in RETURNING_VENDORS:
+                # These ids are every match between the first and the last
+                restocked = _restock_returning(threshold, amount, ids[0], ids[-1])
+            else:
+                Product.objects.filter(pk__in=ids).update(stock=F("stock") + amount)
+                restocked = list(Product.objects.filter(pk__in=ids).order_by("pk"))
+            stock_changed(product.pk for product in restocked)
+            updated += restocked
+        last = ids[-1]
+        if len(ids) < chunk_size:
+            return updated
+
+
+def _restock_returning(threshold, amount, first, last):
+    qn = connection.ops.quote_name
+    opts = Product._meta
+    fields = opts.concrete_fields
+    pk, stock = qn(opts.pk.column), qn(opts.get_field("stock").column)
+    sql = (
+        f"UPDATE {qn(opts.db_table)} SET {stock} = {stock} + %s "
+        f"WHERE {stock} < %s AND {pk} >= %s AND {pk} <= %s "
+        f"RETURNING {', '.join(qn(f.column) for f in fields)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [amount, threshold, first, last])
+        rows = cursor.fetchall()
+
+    field_names = [f.attname for f in fields]
+    to_python = [f.to_python for f in fields]
+    products = [
+        Product.from_db(connection.alias, field_names, [conv(v) for conv, v in zip(to_python, row)])
+        for row in rows
+    ]
+    for product in products:
+        product.price = product.price.quantize(CENTS)
+    return sorted(products, key=lambda product: product.pk)
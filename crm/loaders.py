@@ -0,0 +1,437 @@
+"""
+Request-scoped batch loaders for the CRM GraphQL types.
+
+Resolvers never hit the database for a single related row. Instead, every
+list of model instances the executor is about to complete queues its
+relation keys on the loaders below, and the first ``load()`` against a
+loader fetches all queued keys in one query. A page of any size therefore
+costs one query per relation, not one per row.
+
+Under the async view (``AsyncContext``) the same loaders run in async
+mode: ``load()`` returns an awaitable, and the loads of one tick of the
+event loop share a batch fetched through the async ORM (``ain_bulk``,
+async iteration). Root querysets and connection pages are read the same
+way, so an operation never blocks the event loop on the database.
+"""
+import asyncio
+from collections import defaultdict
+from functools import partial
+from inspect import isawaitable
+
+from django.db.models.query import QuerySet
+from graphene_django.fields import connection_adapter, page_info_adapter
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql.execution import ExecutionContext
+from graphql_relay import connection_from_array_slice, cursor_to_offset, get_offset_with_default, offset_to_cursor
+
+from .models import Customer, Product, Order
+
+
+# -------------------------------
+# Base Loader
+# -------------------------------
+class DataLoader:
+    """Batching loader with a per-request cache; ``is_async`` loaders return awaitables."""
+
+    # Keeps ``IN (...)`` lists under SQLite's bound-parameter limit
+    max_batch_size = 500
+
+    def __init__(self, registry=None, is_async=False):
+        self.registry = registry
+        self.is_async = is_async
+        self._cache = {}
+        self._queue = {}
+        # Async mode: the scheduled batch, and the batch fetching each key in flight
+        self._batch = None
+        self._loading = {}
+
+    def batch_load(self, keys):
+        """Return a dict mapping each found key to its value."""
+        raise NotImplementedError
+
+    async def abatch_load(self, keys):
+        """``batch_load`` through the async ORM."""
+        raise NotImplementedError
+
+    def default(self):
+        """Value cached for keys the batch did not return."""
+        return None
+
+    def queue(self, keys):
+        """Schedule keys for the next batch without fetching anything yet."""
+        for key in keys:
+            if key is not None and key not in self._cache and key not in self._loading:
+                self._queue[key] = None
+
+    def prime(self, key, value):
+        """Seed the cache with a value that is already in memory."""
+        self._cache.setdefault(key, value)
+        self._queue.pop(key, None)
+
+    def load(self, key):
+        if key in self._cache:
+            return self._cache[key]
+        if self.is_async:
+            return self._aload(key)
+        self._queue[key] = None
+        self.dispatch()
+        return self._cache.get(key, self.default())
+
+    async def _aload(self, key):
+        batch = self._loading.get(key)
+        if batch is None:
+            self._queue[key] = None
+            if self._batch is None:
+                # Runs once the loads already scheduled on the loop have queued their keys
+                self._batch = asyncio.ensure_future(self.adispatch())
+            batch = self._batch
+        await batch
+        return self._cache.get(key, self.default())
+
+    def dispatch(self):
+        """Fetch every queued key, in chunks of ``max_batch_size``."""
+        keys, self._queue = list(self._queue), {}
+        for chunk in self._chunks(keys):
+            self._store(chunk, self.batch_load(chunk))
+
+    async def adispatch(self):
+        """``dispatch`` through the async ORM; loads made meanwhile start the next batch."""
+        keys, self._queue, self._batch = list(self._queue), {}, None
+        batch = asyncio.current_task()
+        self._loading.update(dict.fromkeys(keys, batch))
+        try:
+            for chunk in self._chunks(keys):
+                self._store(chunk, await self.abatch_load(chunk))
+        finally:
+            for key in keys:
+                self._loading.pop(key, None)
+
+    def _chunks(self, keys):
+        for start in range(0, len(keys), self.max_batch_size):
+            yield keys[start:start + self.max_batch_size]
+
+    def _store(self, keys, found):
+        for key in keys:
+            self._cache[key] = found.get(key, self.default())
+        if self.registry is not None:
+            self.registry.track(self.loaded_objects(found))
+
+    @staticmethod
+    def loaded_objects(found):
+        for value in found.values():
+            if isinstance(value, list):
+                yield from value
+            else:
+                yield value
+
+
+class GroupedLoader(DataLoader):
+    """Loader whose values are lists of related rows (one-to-many / many-to-many)."""
+
+    def default(self):
+        return []
+
+    def rows(self, keys):
+        """Queryset of the rows related to ``keys``."""
+        raise NotImplementedError
+
+    def entry(self, row):
+        """``(key, value)`` that ``row`` contributes."""
+        raise NotImplementedError
+
+    def batch_load(self, keys):
+        grouped = defaultdict(list)
+        for row in self.rows(keys):
+            key, value = self.entry(row)
+            grouped[key].append(value)
+        return grouped
+
+    async def abatch_load(self, keys):
+        grouped = defaultdict(list)
+        async for row in self.rows(keys):
+            key, value = self.entry(row)
+            grouped[key].append(value)
+        return grouped
+
+
+# -------------------------------
+# CRM Loaders
+# -------------------------------
+class CustomerByIdLoader(DataLoader):
+    def batch_load(self, keys):
+        return Customer.objects.in_bulk(keys)
+
+    async def abatch_load(self, keys):
+        return await Customer.objects.ain_bulk(keys)
+
+
+class ProductsByOrderIdLoader(GroupedLoader):
+    def rows(self, keys):
+        return (
+            Order.products.through.objects
+            .filter(order_id__in=keys)
+            .select_related("product")
+            .order_by("product_id")
+        )
+
+    def entry(self, row):
+        return row.order_id, row.product
+
+
+class OrdersByCustomerIdLoader(GroupedLoader):
+    def rows(self, keys):
+        return Order.objects.filter(customer_id__in=keys).order_by("id")
+
+    def entry(self, order):
+        return order.customer_id, order
+
+
+class OrdersByProductIdLoader(GroupedLoader):
+    def rows(self, keys):
+        return (
+            Order.products.through.objects
+            .filter(product_id__in=keys)
+            .select_related("order")
+            .order_by("order_id")
+        )
+
+    def entry(self, row):
+        return row.product_id, row.order
+
+
+class Loaders:
+    """The set of loaders shared by every resolver in one request."""
+
+    def __init__(self, is_async=False):
+        self.customer_by_id = CustomerByIdLoader(self, is_async)
+        self.products_by_order_id = ProductsByOrderIdLoader(self, is_async)
+        self.orders_by_customer_id = OrdersByCustomerIdLoader(self, is_async)
+        self.orders_by_product_id = OrdersByProductIdLoader(self, is_async)
+
+    def track(self, objects):
+        """
+        Queue the relation keys of instances that are about to be resolved.
+
+        Relations the query planner already joined or prefetched cost nothing
+        extra: ``load_related`` reads them from the instance. They only prime
+        the loaders when they hold full rows, since the planner's ``only()``
+        fits one selection and the loaders are shared by all of them.
+        """
+        for obj in objects:
+            prefetched = getattr(obj, "_prefetched_objects_cache", {})
+            if isinstance(obj, Order):
+                if Order.customer.is_cached(obj):
+                    self._prime(self.customer_by_id, obj.customer_id, obj.customer)
+                    self.track([obj.customer])
+                else:
+                    self.customer_by_id.queue([obj.customer_id])
+                self._prime_or_queue(self.products_by_order_id, obj, prefetched.get("products"))
+            elif isinstance(obj, Customer):
+                self._prime(self.customer_by_id, obj.pk, obj)
+                self._prime_or_queue(self.orders_by_customer_id, obj, prefetched.get("orders"))
+            elif isinstance(obj, Product):
+                self._prime_or_queue(self.orders_by_product_id, obj, prefetched.get("orders"))
+
+    @classmethod
+    def _prime_or_queue(cls, loader, obj, prefetched):
+        if prefetched is None:
+            loader.queue([obj.pk])
+        else:
+            cls._prime(loader, obj.pk, list(prefetched))
+
+    @staticmethod
+    def _prime(loader, key, value):
+        instances = value if isinstance(value, list) else [value]
+        if not any(instance.get_deferred_fields() for instance in instances):
+            loader.prime(key, value)
+
+
+def load_related(obj, name, loader, key=None):
+    """
+    ``obj``'s relation ``name`` as the query planner joined or prefetched it
+    for this selection, otherwise through ``loader`` (keyed on ``obj.pk``).
+    """
+    prefetched = getattr(obj, "_prefetched_objects_cache", {})
+    if name in prefetched:
+        return list(prefetched[name])
+    field = obj._meta.get_field(name)
+    if field.many_to_one and field.is_cached(obj):
+        return getattr(obj, name)
+    return loader.load(obj.pk if key is None else key)
+
+
+def get_loaders(info):
+    """Return the loaders bound to the current request, creating them on first use."""
+    context = info.context
+    if context is None:
+        return Loaders()
+
+    loaders = getattr(context, "crm_loaders", None)
+    if loaders is None:
+        loaders = Loaders(is_async(info))
+        context.crm_loaders = loaders
+    return loaders
+
+
+# -------------------------------
+# Async Execution
+# -------------------------------
+class AsyncContext:
+    """
+    Resolver context for one operation executing on the event loop.
+
+    Attribute reads fall through to the request; what resolvers store
+    (loaders, counters, traces) stays with the operation.
+    """
+
+    crm_async = True
+
+    def __init__(self, request):
+        self.request = request
+
+    def __getattr__(self, name):
+        return getattr(self.request, name)
+
+
+def is_async(info):
+    """True when resolvers must return awaitables instead of touching the database."""
+    return getattr(info.context, "crm_async", False)
+
+
+def then(value, callback):
+    """``callback(value)``, once ``value`` is ready if it is an awaitable."""
+    if not isawaitable(value):
+        return callback(value)
+
+    async def chained():
+        return callback(await value)
+
+    return chained()
+
+
+# -------------------------------
+# Execution Hooks
+# -------------------------------
+class BatchExecutionContext(ExecutionContext):
+    """Queues relation keys for a whole list before any of its items resolve."""
+
+    def complete_list_value(self, return_type, field_nodes, info, path, result):
+        if isinstance(result, QuerySet):
+            if is_async(info):
+                return self.acomplete_queryset(return_type, field_nodes, info, path, result)
+            result = list(result)
+        if isinstance(result, list):
+            # Relay edges wrap the instance in ``node``
+            get_loaders(info).track(getattr(item, "node", item) for item in result)
+        return super().complete_list_value(return_type, field_nodes, info, path, result)
+
+    async def acomplete_queryset(self, return_type, field_nodes, info, path, queryset):
+        rows = [row async for row in queryset]
+        completed = self.complete_list_value(return_type, field_nodes, info, path, rows)
+        return await completed if isawaitable(completed) else completed
+
+
+class BatchedFilterConnectionField(DjangoFilterConnectionField):
+    """
+    Filter connection whose resolver may hand back a batch-loaded list.
+
+    Resolvers return loader results only when no filter argument is set, so
+    a list can be paginated as-is; anything else goes through django-filter.
+    Under async execution the page and its count are read with the async
+    ORM once the filtered queryset (or the loader's list) is ready.
+    """
+
+    @classmethod
+    def connection_resolver(
+        cls, resolver, connection, default_manager, queryset_resolver, max_limit,
+        enforce_first_or_last, root, info, **args
+    ):
+        if is_async(info):
+            # The stock resolver still checks the arguments and filters; paging waits
+            queryset_resolver = partial(cls.pending_rows, queryset_resolver)
+        return super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver, max_limit,
+            enforce_first_or_last, root, info, **args
+        )
+
+    @staticmethod
+    def pending_rows(queryset_resolver, connection, iterable, info, args):
+        if not isawaitable(iterable):
+            iterable = queryset_resolver(connection, iterable, info, args)
+        return PendingRows(iterable)
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        if isinstance(iterable, list):
+            return iterable
+        return super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        if isinstance(iterable, PendingRows):
+            return cls.aresolve_connection(connection, args, iterable.rows, max_limit)
+        return super().resolve_connection(connection, args, iterable, max_limit)
+
+    @classmethod
+    async def aresolve_connection(cls, connection, args, iterable, max_limit=None):
+        """``resolve_connection`` reading the COUNT and the one page through the async ORM."""
+        if isawaitable(iterable):
+            iterable = await iterable
+        iterable = maybe_queryset(iterable)
+        if not isinstance(iterable, QuerySet):
+            return cls.resolve_connection(connection, args, iterable, max_limit)
+
+        # Offset and default limit handled as in the stock resolve_connection
+        offset = args.pop("offset", None)
+        if offset:
+            after = args.get("after")
+            if after:
+                offset += cursor_to_offset(after) + 1
+            args["after"] = offset_to_cursor(offset - 1)
+        if max_limit is not None and args.get("first") is None and args.get("last") is None:
+            args["first"] = max_limit
+
+        count = await iterable.acount()
+        start, end = page_bounds(args, count)
+        rows = [row async for row in iterable[start:end]]
+        result = connection_from_array_slice(
+            rows,
+            args,
+            slice_start=start,
+            array_length=count,
+            array_slice_length=len(rows),
+            connection_type=partial(connection_adapter, connection),
+            edge_type=connection.Edge,
+            page_info_type=page_info_adapter,
+        )
+        result.iterable = iterable
+        result.length = count
+        return result
+
+
+class PendingRows:
+    """A connection's queryset or loader result, paged once it is ready."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+
+def page_bounds(args, count):
+    """``[start, end)`` of the rows ``connection_from_array_slice`` keeps for ``args``."""
+    start = min(get_offset_with_default(args.get("after"), -1) + 1, count)
+    end = min(get_offset_with_default(args.get("before"), count), count)
+    first, last = args.get("first"), args.get("last")
+    if isinstance(first, int):
+        end = min(end, start + first)
+    if isinstance(last, int):
+        start = max(start, end - last)
+    return start, max(start, end)
+
+
+def has_filters(args):
+    """True when a connection was called with anything besides pagination arguments."""
+    pagination = {"first", "last", "before", "after", "offset"}
+    return any(value is not None for key, value in args.items() if key not in pagination)
@@ -0,0 +1,389 @@
+import json
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.utils import timezone
+from graphql import execute, parse, validate
+from graphql_relay import to_global_id
+
+from crm.loaders import BatchExecutionContext
+from crm.models import Customer, Product, Order
+from crm.pagination import encode_cursor
+from crm.query_trace import QueryTrace
+
+BASE_URL = "http://localhost"
+
+# name -> (document, variables(fixture, iteration)); nested pages are bounded, as
+# /graphql's cost limit requires, and mutations write to the bench's own rows
+OPERATIONS = {
+    "ordersPage": (
+        """query ordersPage { allOrders(first: 50) { edges { node {
+            id totalAmount orderDate customer { name email } products(first: 10) { edges { node { name price } } }
+        } } } }""",
+        lambda fixture, i: {},
+    ),
+    "ordersKeysetDeep": (
+        """query ordersKeysetDeep($after: String) { allOrdersKeyset(first: 50, after: $after) {
+            edges { cursor node { id totalAmount customer { name } } } pageInfo { hasNextPage }
+        } }""",
+        lambda fixture, i: {"after": fixture.middle_cursor},
+    ),
+    "customersWithOrders": (
+        """query customersWithOrders { allCustomers(first: 20) { edges { node {
+            name email orders(first: 10) { edges { node { totalAmount products(first: 5) { edges { node { name } } } } } }
+        } } } }""",
+        lambda fixture, i: {},
+    ),
+    "lowStockProducts": (
+        "query lowStockProducts { allProducts(first: 50, lowStock: true) { edges { node { name stock price } } } }",
+        lambda fixture, i: {},
+    ),
+    "orderNode": (
+        """query orderNode($id: ID!) { order(id: $id) {
+            totalAmount customer { name } products(first: 10) { edges { node { name price } } }
+        } }""",
+        lambda fixture, i: {"id": fixture.order_ids[i % len(fixture.order_ids)]},
+    ),
+    "dashboard": (
+        """query dashboard($from: DateTime) {
+            totalCustomers totalOrders totalRevenue
+            revenueByPeriod(granularity: DAY, from: $from) { bucket revenue }
+            topProducts(period: MONTH, limit: 10) { product { name } units revenue }
+        }""",
+        lambda fixture, i: {"from": fixture.month_ago},
+    ),
+    "search": (
+        "query search($term: String!) { search(term: $term, limit: 20) { customers { name email } products { name } } }",
+        lambda fixture, i: {"term": ("john", "smith", "okafor", "laptop pro")[i % 4]},
+    ),
+    "createCustomer": (
+        """mutation createCustomer($input: CustomerInput!) {
+            createCustomer(input: $input) { success errors { message } }
+        }""",
+        lambda fixture, i: {"input": {"name": "Bench Customer", "email": f"{uuid.uuid4().hex}@{fixture.domain}"}},
+    ),
+    "createOrder": (
+        """mutation createOrder($input: OrderInput!) {
+            createOrder(input: $input) { success errors { message } order { id totalAmount } }
+        }""",
+        lambda fixture, i: {"input": {
+            "customerId": fixture.customer_id,
+            "productIds": fixture.product_ids[i % 3:i % 3 + 2],
+        }},
+    ),
+    "bulkCreateOrders": (
+        """mutation bulkCreateOrders($input: [OrderInput]!) {
+            bulkCreateOrders(input: $input) { orders { id } errors { message } }
+        }""",
+        lambda fixture, i: {"input": [
+            {"customerId": fixture.customer_id, "productIds": fixture.product_ids[j % 5:j % 5 + 1]}
+            for j in range(20)
+        ]},
+    ),
+}
+MUTATIONS = {"createCustomer", "createOrder", "bulkCreateOrders"}
+
+# Latencies compared against a baseline; p99 is shown but too noisy to fail on
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+GATED_LATENCY_KEYS = {"p50_ms", "p95_ms"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the canonical CRM queries and mutations in-process and over HTTP, "
+        "report p50/p95/p99, throughput and SQL statements per operation as JSON, "
+        "and compare against a saved baseline. Seed data first with crm_seed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--transport", choices=("inprocess", "http", "both"), default="both",
+            help="Execute against the schema directly, through the HTTP stack, or both.",
+        )
+        parser.add_argument(
+            "--url", help="GraphQL endpoint of a running server sharing this database. "
+                          "Without it, HTTP requests go to the WSGI app in this process.",
+        )
+        parser.add_argument("--iterations", type=int, default=200, help="Timed runs per operation.")
+        parser.add_argument("--warmup", type=int, default=20, help="Untimed runs per operation.")
+        parser.add_argument("--concurrency", type=int, default=1, help="Threads sharing the iterations.")
+        parser.add_argument("--operation", action="append", dest="operations", choices=list(OPERATIONS),
+                            help="Run only this operation (repeatable).")
+        parser.add_argument("--skip-mutations", action="store_true", help="Leave the database untouched.")
+        parser.add_argument("--output", help="Write the JSON report here (e.g. a new baseline).")
+        parser.add_argument("--baseline", help="JSON report to compare against.")
+        parser.add_argument(
+            "--tolerance", type=float, default=10.0,
+            help="Percent a latency may grow before it counts as a regression.",
+        )
+        parser.add_argument(
+            "--fail-on-regression", action="store_true",
+            help="Exit with an error when the comparison finds a regression.",
+        )
+
+    def handle(self, *args, **options):
+        names = options["operations"] or list(OPERATIONS)
+        if options["skip_mutations"]:
+            names = [name for name in names if name not in MUTATIONS]
+        transports = ["inprocess", "http"] if options["transport"] == "both" else [options["transport"]]
+
+        fixture = self.create_fixture()
+        try:
+            report = {
+                "meta": {
+                    "created": timezone.now().isoformat(),
+                    "vendor": connection.vendor,
+                    "rows": {
+                        "customers": Customer.objects.count(),
+                        "products": Product.objects.count(),
+                        "orders": Order.objects.count(),
+                    },
+                    "iterations": options["iterations"],
+                    "warmup": options["warmup"],
+                    "concurrency": options["concurrency"],
+                    "url": options["url"],
+                },
+                "results": {},
+            }
+            for transport in transports:
+                self.stderr.write(f"{transport}:")
+                run = self.get_runner(transport, options["url"])
+                report["results"][transport] = {
+                    name: self.measure(run, name, fixture, options) for name in names
+                }
+        finally:
+            self.remove_fixture(fixture)
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                regressions = self.compare(json.load(f), report, options["tolerance"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{regressions} regression(s) against {options['baseline']}")
+
+    # -------------------------------
+    # Fixture
+    # -------------------------------
+    def create_fixture(self):
+        """A customer and products of its own for the mutations, plus ids the reads page from."""
+        run_id = uuid.uuid4().hex[:8]
+        domain = f"bench-{run_id}.example.com"
+        customer = Customer.objects.create(name="Bench Customer", email=f"owner@{domain}")
+        products = Product.objects.bulk_create([
+            Product(name=f"Bench {run_id} #{i}", price=Decimal("9.99"), stock=10 ** 9) for i in range(6)
+        ])
+
+        keys = list(Order.objects.order_by("order_date", "id").values_list("order_date", "id"))
+        if not keys:
+            raise CommandError("No orders to read; run manage.py crm_seed first.")
+        sample = keys[::max(1, len(keys) // 50)]
+        return SimpleNamespace(
+            domain=domain,
+            customer_id=customer.pk,
+            product_ids=[product.pk for product in products],
+            order_ids=[to_global_id("OrderNode", pk) for _, pk in sample],
+            middle_cursor=encode_cursor(list(keys[len(keys) // 2])),
+            month_ago=(timezone.now() - timedelta(days=30)).isoformat(),
+        )
+
+    def remove_fixture(self, fixture):
+        Customer.objects.filter(email__endswith=f"@{fixture.domain}").delete()
+        Product.objects.filter(pk__in=fixture.product_ids).delete()
+
+    # -------------------------------
+    # Transports
+    # -------------------------------
+    def get_runner(self, transport, url):
+        """Return ``run(document, variables) -> (ok, sql statements or None)``."""
+        if transport == "inprocess":
+            return self.inprocess_runner()
+        return self.http_runner(url)
+
+    def inprocess_runner(self):
+        from graphql_crm.schema import schema
+
+        documents = {}
+
+        def run(document, variables):
+            if document not in documents:
+                parsed = parse(document)
+                errors = validate(schema.graphql_schema, parsed)
+                if errors:
+                    raise CommandError(f"Invalid benchmark operation: {errors[0].message}")
+                documents[document] = parsed
+            trace = QueryTrace()
+            with connection.execute_wrapper(trace):
+                result = execute(
+                    schema.graphql_schema,
+                    documents[document],
+                    context_value=SimpleNamespace(user=None, META={}),
+                    variable_values=variables,
+                    execution_context_class=BatchExecutionContext,
+                )
+            return self.succeeded(result.data, result.errors), len(trace)
+
+        return run
+
+    def http_runner(self, url):
+        local = threading.local()
+
+        def client():
+            if not hasattr(local, "client"):
+                if url:
+                    local.client = httpx.Client(timeout=60)
+                else:
+                    app = get_wsgi_application()
+                    local.client = httpx.Client(transport=httpx.WSGITransport(app=app), base_url=BASE_URL)
+            return local.client
+
+        def run(document, variables):
+            if url:
+                response = client().post(url, json={"query": document, "variables": variables})
+                statements = None
+            else:
+                # The WSGI app runs on this thread, so its statements go through this connection
+                trace = QueryTrace()
+                with connection.execute_wrapper(trace):
+                    response = client().post("/graphql", json={"query": document, "variables": variables})
+                statements = len(trace)
+            body = json.loads(response.content) if response.status_code in (200, 400) else {}
+            ok = response.status_code == 200 and self.succeeded(body.get("data"), body.get("errors"))
+            return ok, statements
+
+        return run
+
+    @staticmethod
+    def succeeded(data, errors):
+        if errors or not data:
+            return False
+        # Mutations report validation failures in the payload, not as GraphQL errors
+        return all(
+            not isinstance(payload, dict) or not payload.get("errors") and payload.get("success", True) is not False
+            for payload in data.values()
+        )
+
+    # -------------------------------
+    # Measurement
+    # -------------------------------
+    def measure(self, run, name, fixture, options):
+        document, variables = OPERATIONS[name]
+        for i in range(options["warmup"]):
+            run(document, variables(fixture, i))
+
+        iterations, concurrency = options["iterations"], max(1, options["concurrency"])
+        shares = [range(t, iterations, concurrency) for t in range(concurrency)]
+
+        def worker(indexes):
+            samples = []
+            try:
+                for i in indexes:
+                    values = variables(fixture, i)
+                    started = time.perf_counter()
+                    ok, statements = run(document, values)
+                    samples.append((time.perf_counter() - started, ok, statements))
+            finally:
+                if concurrency > 1:
+                    connection.close()
+            return samples
+
+        started = time.perf_counter()
+        if concurrency == 1:
+            samples = worker(shares[0])
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = [sample for result in pool.map(worker, shares) for sample in result]
+        wall = time.perf_counter() - started
+
+        latencies = [latency for latency, _, _ in samples]
+        statements = [count for _, _, count in samples if count is not None]
+        result = {
+            "iterations": len(samples),
+            "errors": sum(not ok for _, ok, _ in samples),
+            "throughput_per_s": round(len(samples) / wall, 1) if wall else None,
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+            **{
+                f"p{pct}_ms": round(self.percentile(latencies, pct) * 1000, 3)
+                for pct in (50, 95, 99)
+            },
+            "sql_queries": max(statements) if statements else None,
+        }
+        self.stderr.write(
+            f"{name:<22}{result['p50_ms']:>9.2f}ms p50{result['p99_ms']:>9.2f}ms p99"
+            f"{result['throughput_per_s']:>9.1f}/s  sql={result['sql_queries']}  errors={result['errors']}"
+        )
+        return result
+
+    @staticmethod
+    def percentile(values, pct):
+        if len(values) < 2:
+            return values[0] if values else 0.0
+        return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+    # -------------------------------
+    # Baseline
+    # -------------------------------
+    def compare(self, baseline, report, tolerance):
+        """Print each operation against the baseline; returns the number of regressions."""
+        for key in ("vendor", "rows", "iterations", "concurrency", "url"):
+            if baseline.get("meta", {}).get(key) != report["meta"][key]:
+                self.stderr.write(self.style.WARNING(
+                    f"Baseline {key} differs ({baseline.get('meta', {}).get(key)} vs {report['meta'][key]}); "
+                    "results may not be comparable."
+                ))
+        regressions = 0
+        self.stderr.write(
+            f"\n{'transport':<11}{'operation':<22}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'sql':>8}"
+        )
+        for transport, results in report["results"].items():
+            for name, current in results.items():
+                previous = baseline.get("results", {}).get(transport, {}).get(name)
+                if previous is None:
+                    self.stderr.write(f"{transport:<11}{name:<22}  (not in baseline)")
+                    continue
+
+                cells, regressed = [], False
+                for key in LATENCY_KEYS:
+                    change = self.change(previous[key], current[key])
+                    regressed |= key in GATED_LATENCY_KEYS and change > tolerance
+                    cells.append(f"{change:>+8.1f}%")
+                throughput = self.change(previous["throughput_per_s"], current["throughput_per_s"])
+                regressed |= throughput < -tolerance
+                cells.append(f"{throughput:>+8.1f}%")
+                sql_before, sql_now = previous.get("sql_queries"), current.get("sql_queries")
+                if sql_before is not None and sql_now is not None:
+                    regressed |= sql_now > sql_before
+                    cells.append(f"{sql_before:>4}->{sql_now:<3}")
+                else:
+                    cells.append(f"{'-':>8}")
+                regressed |= current["errors"] > previous["errors"]
+
+                line = f"{transport:<11}{name:<22}" + "".join(cells)
+                if regressed:
+                    regressions += 1
+                    line = self.style.ERROR(line + "  REGRESSION")
+                self.stderr.write(line)
+
+        if regressions:
+            self.stderr.write(self.style.ERROR(f"{regressions} regression(s) beyond {tolerance:g}%"))
+        else:
+            self.stderr.write(self.style.SUCCESS(f"No regressions beyond {tolerance:g}%"))
+        return regressions
+
+    @staticmethod
+    def change(before, after):
+        if not before:
+            return 0.0
+        return (after - before) / before * 100
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+BASE_URL = "http://localhost"
+DEFAULT_QUERY = """
+query Bench {
+  allOrders(first: 20) {
+    edges { node { id totalAmount customer { name email } products { edges { node { name price } } } } }
+  }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare /graphql throughput and latency under WSGI and ASGI at high "
+        "concurrency, in-process (e.g. --requests 5000 --concurrency 200)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="Requests per server mode.")
+        parser.add_argument("--concurrency", type=int, default=100, help="Requests in flight at once.")
+        parser.add_argument("--query", default=DEFAULT_QUERY, help="Operation to send.")
+        parser.add_argument(
+            "--db-latency-ms", type=float, default=0.0,
+            help="Sleep added to every SQL statement, to model a database across the network.",
+        )
+
+    def handle(self, *args, **options):
+        if options["db_latency_ms"]:
+            self.add_db_latency(options["db_latency_ms"] / 1000)
+
+        body = {"query": options["query"]}
+        total, concurrency = options["requests"], options["concurrency"]
+        shares = [total // concurrency + (i < total % concurrency) for i in range(concurrency)]
+        sync_label = "async view" if settings.CRM_ASYNC_GRAPHQL else "sync view"
+
+        self.stdout.write(
+            f"{total} requests, {concurrency} concurrent, "
+            f"{options['db_latency_ms']:.1f}ms added per statement"
+        )
+        self.stdout.write(f"{'mode':<28}{'req/s':>10}{'p50':>10}{'p99':>10}{'errors':>8}")
+        modes = [
+            (f"WSGI /graphql ({sync_label})", lambda: self.run_wsgi("/graphql", body, shares)),
+            (f"ASGI /graphql ({sync_label})", lambda: asyncio.run(self.run_asgi("/graphql", body, shares))),
+            ("ASGI /graphql/async", lambda: asyncio.run(self.run_asgi("/graphql/async", body, shares))),
+        ]
+        for label, run in modes:
+            started = time.perf_counter()
+            latencies, errors = run()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{label:<28}{len(latencies) / elapsed:>10.1f}"
+                f"{self.percentile(latencies, 50) * 1000:>8.1f}ms"
+                f"{self.percentile(latencies, 99) * 1000:>8.1f}ms{errors:>8}"
+            )
+
+    def run_wsgi(self, path, body, shares):
+        # A threaded WSGI server: one thread per request in flight
+        app = get_wsgi_application()
+
+        def worker(count):
+            latencies, errors = [], 0
+            with httpx.Client(transport=httpx.WSGITransport(app=app), base_url=BASE_URL) as client:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    errors += not self.succeeded(client.post(path, json=body))
+                    latencies.append(time.perf_counter() - started)
+            connections.close_all()
+            return latencies, errors
+
+        with ThreadPoolExecutor(max_workers=len(shares)) as pool:
+            return self.merge(pool.map(worker, shares))
+
+    async def run_asgi(self, path, body, shares):
+        app = get_asgi_application()
+        transport = httpx.ASGITransport(app=app)
+
+        async def worker(count):
+            latencies, errors = [], 0
+            for _ in range(count):
+                started = time.perf_counter()
+                errors += not self.succeeded(await client.post(path, json=body))
+                latencies.append(time.perf_counter() - started)
+            return latencies, errors
+
+        async with httpx.AsyncClient(transport=transport, base_url=BASE_URL) as client:
+            return self.merge(await asyncio.gather(*(worker(count) for count in shares)))
+
+    @staticmethod
+    def succeeded(response):
+        return response.status_code == 200 and "errors" not in json.loads(response.content)
+
+    @staticmethod
+    def merge(results):
+        latencies, errors = [], 0
+        for worker_latencies, worker_errors in results:
+            latencies += worker_latencies
+            errors += worker_errors
+        return latencies, errors
+
+    @staticmethod
+    def percentile(values, pct):
+        if len(values) < 2:
+            return values[0] if values else 0.0
+        return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+    @staticmethod
+    def add_db_latency(seconds):
+        def slow(execute, sql, params, many, context):
+            time.sleep(seconds)
+            return execute(sql, params, many, context)
+
+        def install(sender, connection, **kwargs):
+            # Fires on every reconnect of the same wrapper; add the delay once
+            if slow not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow)
+
+        connection_created.connect(install, weak=False)
+        for connection in connections.all(initialized_only=True):
+            install(None, connection)
@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from crm.loaders import BatchExecutionContext
+from crm.models import Customer, Product, Order
+
+CREATE_ORDER = """
+mutation CreateOrder($customerId: ID!, $productIds: [ID]!) {
+  createOrder(input: {customerId: $customerId, productIds: $productIds}) {
+    success
+    errors { field message }
+  }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer the createOrder mutation from concurrent writers and verify "
+        "that stock is never oversold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=32, help="Concurrent writer threads.")
+        parser.add_argument("--orders", type=int, default=2000, help="Total orders to attempt.")
+        parser.add_argument("--products", type=int, default=5, help="Products to compete for.")
+        parser.add_argument("--stock", type=int, default=200, help="Starting stock per product.")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark rows afterwards.")
+
+    def handle(self, *args, **options):
+        from graphql_crm.schema import schema
+
+        run_id = uuid.uuid4().hex[:8]
+        customer = Customer.objects.create(name="Bench Customer", email=f"bench-{run_id}@example.com")
+        products = Product.objects.bulk_create([
+            Product(name=f"Bench {run_id} #{i}", price=Decimal("9.99"), stock=options["stock"])
+            for i in range(options["products"])
+        ])
+        product_ids = [p.pk for p in products]
+
+        lock = threading.Lock()
+        outcomes = Counter()
+        error_messages = Counter()
+        latencies = []
+        remaining = [options["orders"]]
+
+        def take_ticket():
+            with lock:
+                if remaining[0] <= 0:
+                    return False
+                remaining[0] -= 1
+                return True
+
+        def writer():
+            rng = random.Random()
+            try:
+                while take_ticket():
+                    picks = rng.sample(product_ids, rng.randint(1, min(3, len(product_ids))))
+                    started = time.perf_counter()
+                    result = schema.execute(
+                        CREATE_ORDER,
+                        variable_values={"customerId": customer.pk, "productIds": picks},
+                        context_value=SimpleNamespace(),
+                        execution_context_class=BatchExecutionContext,
+                    )
+                    elapsed = time.perf_counter() - started
+                    if result.errors:
+                        outcome = "error"
+                        with lock:
+                            error_messages[str(result.errors[0])] += 1
+                    elif result.data["createOrder"]["success"]:
+                        outcome = "created"
+                    else:
+                        outcome = "rejected"
+                    with lock:
+                        outcomes[outcome] += 1
+                        latencies.append(elapsed)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer) for _ in range(options["writers"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        # Every unit sold must be matched by exactly one unit of missing stock
+        oversold = 0
+        through = Order.products.through.objects.filter(order__customer=customer)
+        for product in Product.objects.filter(pk__in=product_ids):
+            sold = through.filter(product_id=product.pk).count()
+            if product.stock < 0 or product.stock != options["stock"] - sold:
+                oversold += 1
+                self.stdout.write(self.style.ERROR(
+                    f"Product {product.pk}: stock {product.stock}, sold {sold}"
+                ))
+
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+        self.stdout.write(
+            f"{options['writers']} writers, {sum(outcomes.values())} attempts in {wall:.2f}s "
+            f"({outcomes['created'] / wall:.1f} orders/s)"
+        )
+        self.stdout.write(
+            f"created={outcomes['created']} rejected={outcomes['rejected']} "
+            f"errors={outcomes['error']} p99={p99 * 1000:.1f}ms"
+        )
+        for message, count in error_messages.most_common(3):
+            self.stdout.write(self.style.WARNING(f"  {count}x {message}"))
+        if oversold:
+            self.stdout.write(self.style.ERROR(f"OVERSOLD: {oversold} product(s) out of balance"))
+        else:
+            self.stdout.write(self.style.SUCCESS("No oversell: stock matches units sold."))
+
+        if not options["keep"]:
+            Order.objects.filter(customer=customer).delete()
+            Product.objects.filter(pk__in=product_ids).delete()
+            customer.delete()
@@ -0,0 +1,94 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from crm.models import Customer
+from crm.search import fts_enabled, ranked, search_customers
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda",
+    "William", "Elizabeth", "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Charles", "Karen", "Amara", "Kwame", "Ngozi", "Chidi",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+    "Okafor", "Mensah", "Adeyemi", "Nwosu", "Boateng",
+]
+DEFAULT_TERMS = ["jo", "john", "smith", "okafor", "jenn will", "mensah kw", "zzzz"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare icontains scans with the FTS5 search index on a synthetic "
+        "customer table (e.g. --customers 1000000)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=100000, help="Synthetic customers to create.")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per term.")
+        parser.add_argument("--term", action="append", dest="terms", help="Search term (repeatable).")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark rows afterwards.")
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        domain = f"bench-{run_id}.example.com"
+        self.seed(options["customers"], domain)
+
+        if not fts_enabled():
+            self.stdout.write(self.style.WARNING("Not on SQLite: both columns time the icontains fallback."))
+
+        self.stdout.write(
+            f"{'term':<14}{'icontains 20':>14}{'icontains cnt':>15}{'fts 20':>10}{'fts cnt':>10}{'matches':>10}"
+        )
+        for term in options["terms"] or DEFAULT_TERMS:
+            words = term.split()
+            scan = Customer.objects.all()
+            for word in words:
+                scan = scan.filter(name__icontains=word)
+            indexed = search_customers(Customer.objects.all(), term)
+
+            timings = [
+                self.p50(lambda: list(scan.order_by("pk")[:20]), options["repeat"]),
+                self.p50(scan.count, options["repeat"]),
+                self.p50(lambda: ranked(Customer, term, 20), options["repeat"]),
+                self.p50(indexed.count, options["repeat"]),
+            ]
+            self.stdout.write(
+                f"{term:<14}" + "".join(
+                    f"{t * 1000:>{w}.1f}ms" for t, w in zip(timings, (12, 13, 8, 8))
+                ) + f"{indexed.count():>10}"
+            )
+
+        if not options["keep"]:
+            deleted = Customer.objects.filter(email__endswith=f"@{domain}")._raw_delete(Customer.objects.db)
+            self.stdout.write(f"Removed {deleted} benchmark customers.")
+
+    def seed(self, count, domain):
+        rng = random.Random(0)
+        started = time.perf_counter()
+        batch = []
+        for i in range(count):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            batch.append(Customer(
+                name=f"{first} {last}",
+                email=f"{first.lower()}.{last.lower()}.{i}@{domain}",
+            ))
+            if len(batch) == 10000 or i == count - 1:
+                with transaction.atomic():
+                    Customer.objects.bulk_create(batch, batch_size=1000)
+                batch = []
+        self.stdout.write(f"Seeded {count} customers in {time.perf_counter() - started:.1f}s")
+
+    @staticmethod
+    def p50(fn, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
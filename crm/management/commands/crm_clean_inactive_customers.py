@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.deletion import DELETE_CHUNK_SIZE, DELETE_THROTTLE, INACTIVE_DAYS, delete_customers, inactive_customers
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete customers older than --days who never placed an order, in short "
+        "chunked transactions (what the weekly cleanup cron job runs)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=INACTIVE_DAYS, help="Minimum customer age in days.")
+        parser.add_argument("--chunk-size", type=int, default=DELETE_CHUNK_SIZE, help="Customers per transaction.")
+        parser.add_argument(
+            "--throttle", type=float, default=DELETE_THROTTLE,
+            help="Seconds to pause between transactions so other writers get in.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count the matching customers.")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        customers = inactive_customers(options["days"])
+        if options["dry_run"]:
+            self.stdout.write(f"{customers.count()} inactive customers would be deleted")
+            return
+
+        started = time.perf_counter()
+
+        def progress(counts):
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    f"Deleted {counts['customers']} customers "
+                    f"({time.perf_counter() - started:.1f}s)"
+                )
+
+        counts = delete_customers(
+            customers,
+            chunk_size=options["chunk_size"],
+            throttle=options["throttle"],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {counts['customers']} inactive customers "
+            f"({counts['rollups']} rollup rows) in {time.perf_counter() - started:.2f}s"
+        ))
@@ -0,0 +1,146 @@
+import csv
+import json
+import os
+import time
+from functools import partial
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from crm.bulk import bulk_create_customers, bulk_create_orders, bulk_create_products
+from crm.inventory import ReservationFailed
+from crm.models import ImportCheckpoint
+
+IMPORTERS = {
+    "customers": bulk_create_customers,
+    "products": bulk_create_products,
+    "orders": bulk_create_orders,
+}
+
+# A batch that loses a stock race is retried this many times before giving up
+RESERVATION_RETRIES = 3
+
+
+# -------------------------------
+# Readers
+# -------------------------------
+def read_ndjson(f):
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else {}
+
+
+def read_csv(f):
+    for row in csv.DictReader(f):
+        # product_ids arrive as "1;2;3" in a single column
+        if "product_ids" in row:
+            row["product_ids"] = [pk for pk in (row["product_ids"] or "").replace(";", " ").split() if pk]
+        yield row
+
+
+READERS = {"ndjson": read_ndjson, "jsonl": read_ndjson, "csv": read_csv}
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream customers, products or orders from an NDJSON or CSV file into the "
+        "database in batch transactions, resuming from the last committed batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(IMPORTERS), help="What the file contains.")
+        parser.add_argument("path", help="NDJSON (.ndjson/.jsonl) or CSV file.")
+        parser.add_argument("--format", choices=sorted(READERS), help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per transaction.")
+        parser.add_argument("--checkpoint", help="Checkpoint name (default: the file's absolute path).")
+        parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start over.")
+        parser.add_argument(
+            "--no-reserve-stock", action="store_true",
+            help="Orders only: do not take stock (e.g. replaying historical orders).",
+        )
+        parser.add_argument("--max-errors", type=int, default=20, help="Rejected rows to print.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if fmt not in READERS:
+            raise CommandError(f"Unknown format '{fmt}'; pass --format.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        create = IMPORTERS[options["model"]]
+        if options["model"] == "orders":
+            create = partial(bulk_create_orders, reserve_stock=not options["no_reserve_stock"])
+
+        path = os.path.abspath(path)
+        name = options["checkpoint"] or path
+        if options["restart"]:
+            ImportCheckpoint.objects.filter(name=name).delete()
+        state, _ = ImportCheckpoint.objects.get_or_create(
+            name=name, defaults={"model": options["model"], "path": path}
+        )
+        if (state.model, state.path) != (options["model"], path):
+            raise CommandError(f"Checkpoint '{name}' belongs to another import; pass --restart.")
+        if state.offset:
+            self.stdout.write(f"Resuming at row {state.offset}")
+
+        printed_errors = 0
+        started = time.perf_counter()
+        processed = 0
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = islice(READERS[fmt](f), state.offset, None)
+            for batch in batched(rows, options["batch_size"]):
+                offset = state.offset
+                errors = self.import_batch(create, batch, state)
+                for idx, messages in sorted(errors.items()):
+                    if printed_errors < options["max_errors"]:
+                        printed_errors += 1
+                        self.stderr.write(f"row {offset + idx + 1}: {', '.join(messages)}")
+
+                processed += len(batch)
+                rate = processed / (time.perf_counter() - started)
+                self.stdout.write(
+                    f"{state.offset} rows ({rate:.0f} rows/s): "
+                    f"{state.created} created, {state.rejected} rejected"
+                )
+
+        state.delete()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {state.created} {options['model']} "
+            f"({state.rejected} rejected) in {elapsed:.1f}s"
+        ))
+
+    def import_batch(self, create, batch, state):
+        """Create one batch and advance ``state`` past it in the same transaction."""
+        for attempt in range(RESERVATION_RETRIES):
+            try:
+                with transaction.atomic():
+                    created, errors = create(batch)
+                    # Only advance the checkpoint with the rows it covers, so a
+                    # crash can neither skip nor repeat a batch
+                    ImportCheckpoint.objects.filter(name=state.name).update(
+                        offset=F("offset") + len(batch),
+                        created=F("created") + len(created),
+                        rejected=F("rejected") + len(errors),
+                    )
+            except ReservationFailed:
+                # Another writer took stock mid-batch; re-read and try again
+                continue
+            state.refresh_from_db()
+            return errors
+        raise CommandError("Stock kept changing under the import; rerun to resume.")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from crm.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the totalCustomers/totalOrders/totalRevenue counters from a full "
+        "scan of the customer and order tables."
+    )
+
+    def handle(self, *args, **options):
+        drifted = 0
+        for name, (old, new) in reconcile_counters().items():
+            if old != new:
+                drifted += 1
+                self.stdout.write(self.style.WARNING(f"{name}: {old} -> {new}"))
+            else:
+                self.stdout.write(f"{name}: {new}")
+        if drifted:
+            self.stdout.write(self.style.SUCCESS(f"Reconciled {drifted} drifted counter(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS("All counters were already correct."))
@@ -0,0 +1,253 @@
+import json
+import queue
+import statistics
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from graphql import GraphQLError, OperationType, execute, get_operation_ast, parse, validate
+
+from crm.loaders import BatchExecutionContext
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay GraphQL traffic captured by crm.capture.GraphQLCaptureMiddleware, "
+        "in-process or against --url, at --speed times the captured rate, and "
+        "report latency per operation. Only queries are replayed unless "
+        "--include-mutations is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("captures", nargs="+", help="Capture files (JSONL), rotated ones included.")
+        parser.add_argument("--url", help="GraphQL endpoint to replay against instead of in-process.")
+        parser.add_argument(
+            "--speed", type=float, default=1.0,
+            help="Multiple of the captured arrival rate; 0 sends as fast as the workers allow.",
+        )
+        parser.add_argument("--concurrency", type=int, default=8, help="Operations in flight at once.")
+        parser.add_argument("--limit", type=int, help="Replay only the first N operations.")
+        parser.add_argument(
+            "--include-mutations", action="store_true",
+            help="Replay mutations too; they write to the target database.",
+        )
+        parser.add_argument("--output", help="Also write the report as JSON to this file.")
+
+    def handle(self, *args, **options):
+        if options["speed"] < 0:
+            raise CommandError("--speed must be zero or positive.")
+        entries, skipped = self.load(options["captures"], options["include_mutations"])
+        if options["limit"]:
+            entries = entries[:options["limit"]]
+        if not entries:
+            raise CommandError("Nothing to replay.")
+
+        target = options["url"] or "in-process"
+        self.stdout.write(
+            f"Replaying {len(entries)} operations ({skipped} skipped) against {target} "
+            f"at {options['speed']:g}x with {options['concurrency']} workers"
+        )
+        run = self.http_runner(options["url"]) if options["url"] else self.inprocess_runner()
+        samples, wall, lag = self.replay(entries, run, options["speed"], max(1, options["concurrency"]))
+
+        report = self.summarize(entries, samples, wall, lag)
+        self.print_report(report)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    # -------------------------------
+    # Captures
+    # -------------------------------
+    def load(self, paths, include_mutations):
+        """Captured entries in arrival order, and how many were left out."""
+        entries, skipped, operations = [], 0, {}
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        query = entry["query"]
+                    except (ValueError, KeyError, TypeError):
+                        skipped += 1
+                        continue
+
+                    key = (entry.get("hash"), entry.get("operationName"))
+                    if key not in operations:
+                        operations[key] = self.operation(query, entry.get("operationName"))
+                    operation = operations[key]
+                    if operation is None or (operation.operation != OperationType.QUERY and not include_mutations):
+                        skipped += 1
+                        continue
+                    entry["label"] = self.label(entry, operation)
+                    entries.append(entry)
+        entries.sort(key=lambda entry: entry["ts"])
+        return entries, skipped
+
+    @staticmethod
+    def operation(query, operation_name):
+        try:
+            return get_operation_ast(parse(query), operation_name)
+        except GraphQLError:
+            return None
+
+    @staticmethod
+    def label(entry, operation):
+        if entry.get("operationName"):
+            return entry["operationName"]
+        if operation.name is not None:
+            return operation.name.value
+        return f"anonymous:{entry['hash'][:12]}"
+
+    # -------------------------------
+    # Transports
+    # -------------------------------
+    def inprocess_runner(self):
+        from graphql_crm.schema import schema
+
+        documents = {}
+        lock = threading.Lock()
+
+        def document(entry):
+            with lock:
+                if entry["hash"] not in documents:
+                    parsed = parse(entry["query"])
+                    documents[entry["hash"]] = (parsed, validate(schema.graphql_schema, parsed))
+                return documents[entry["hash"]]
+
+        def run(entry):
+            parsed, errors = document(entry)
+            if errors:
+                return False
+            result = execute(
+                schema.graphql_schema,
+                parsed,
+                context_value=SimpleNamespace(user=None, META={}),
+                variable_values=entry.get("variables"),
+                operation_name=entry.get("operationName"),
+                execution_context_class=BatchExecutionContext,
+            )
+            return not result.errors
+
+        return run
+
+    def http_runner(self, url):
+        local = threading.local()
+
+        def run(entry):
+            if not hasattr(local, "client"):
+                local.client = httpx.Client(timeout=60)
+            response = local.client.post(url, json={
+                "query": entry["query"],
+                "variables": entry.get("variables"),
+                "operationName": entry.get("operationName"),
+            })
+            return response.status_code == 200 and "errors" not in json.loads(response.content)
+
+        return run
+
+    # -------------------------------
+    # Replay
+    # -------------------------------
+    def replay(self, entries, run, speed, concurrency):
+        """Send ``entries`` on the captured schedule; returns (samples, wall time, lag)."""
+        jobs = queue.Queue(maxsize=concurrency * 2)
+        samples, lag = [], []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while (job := jobs.get()) is not None:
+                    index, due = job
+                    started = time.perf_counter()
+                    try:
+                        ok = run(entries[index])
+                    except Exception:
+                        ok = False
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        samples.append((index, elapsed, ok))
+                        lag.append(max(0.0, started - due))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+
+        origin = entries[0]["ts"]
+        started = time.perf_counter()
+        for index, entry in enumerate(entries):
+            due = started + ((entry["ts"] - origin) / speed if speed else 0)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            jobs.put((index, due))
+        for _ in threads:
+            jobs.put(None)
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - started, lag
+
+    def summarize(self, entries, samples, wall, lag):
+        by_operation = {}
+        for index, elapsed, ok in samples:
+            entry = entries[index]
+            stats = by_operation.setdefault(entry["label"], {"latencies": [], "captured": [], "errors": 0})
+            stats["latencies"].append(elapsed)
+            stats["errors"] += not ok
+            if entry.get("duration_ms") is not None:
+                stats["captured"].append(entry["duration_ms"] / 1000)
+
+        operations = {}
+        for name, stats in sorted(by_operation.items(), key=lambda item: -len(item[1]["latencies"])):
+            latencies = stats["latencies"]
+            operations[name] = {
+                "count": len(latencies),
+                "errors": stats["errors"],
+                **{f"p{pct}_ms": round(self.percentile(latencies, pct) * 1000, 3) for pct in (50, 95, 99)},
+                "max_ms": round(max(latencies) * 1000, 3),
+                "captured_p50_ms": (
+                    round(self.percentile(stats["captured"], 50) * 1000, 3) if stats["captured"] else None
+                ),
+            }
+        all_latencies = [elapsed for _, elapsed, _ in samples]
+        return {
+            "operations": operations,
+            "total": {
+                "count": len(samples),
+                "errors": sum(not ok for _, _, ok in samples),
+                "wall_s": round(wall, 3),
+                "throughput_per_s": round(len(samples) / wall, 1) if wall else None,
+                **{f"p{pct}_ms": round(self.percentile(all_latencies, pct) * 1000, 3) for pct in (50, 95, 99)},
+                # Time operations waited for a free worker past their scheduled start
+                "lag_p99_ms": round(self.percentile(lag, 99) * 1000, 3),
+            },
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{'operation':<32}{'count':>7}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'captured':>10}"
+        )
+        for name, stats in report["operations"].items():
+            captured = stats["captured_p50_ms"]
+            self.stdout.write(
+                f"{name[:31]:<32}{stats['count']:>7}{stats['errors']:>8}"
+                + "".join(f"{stats[key]:>8.1f}ms" for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms"))
+                + (f"{captured:>8.1f}ms" if captured is not None else f"{'-':>10}")
+            )
+        total = report["total"]
+        self.stdout.write(
+            f"{total['count']} operations in {total['wall_s']:.1f}s ({total['throughput_per_s']}/s), "
+            f"p50 {total['p50_ms']:.1f}ms, p99 {total['p99_ms']:.1f}ms, "
+            f"{total['errors']} errors, schedule lag p99 {total['lag_p99_ms']:.1f}ms"
+        )
+
+    @staticmethod
+    def percentile(values, pct):
+        if len(values) < 2:
+            return values[0] if values else 0.0
+        return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary onto a replica alias, once or every --interval "
+        "seconds: a stand-in for streaming replication in local setups "
+        "(CRM_DB_REPLICA=replica.sqlite3). The interval is the replica's lag; "
+        "replica connections see a new copy once they reconnect, so leave "
+        "CONN_MAX_AGE at 0 there."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--alias", default="replica", help="Replica alias in DATABASES.")
+        parser.add_argument("--interval", type=float, help="Keep copying, this many seconds apart.")
+
+    def handle(self, *args, **options):
+        if options["alias"] not in settings.DATABASES:
+            raise CommandError(f"No database alias {options['alias']!r}.")
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replica = connections[options["alias"]].settings_dict
+        if primary["ENGINE"] != replica["ENGINE"] or connections[DEFAULT_DB_ALIAS].vendor != "sqlite":
+            raise CommandError("Only SQLite files are copied; real replicas replicate themselves.")
+        source, target = str(primary["NAME"]), str(replica["NAME"])
+        if os.path.abspath(source) == os.path.abspath(target):
+            raise CommandError("The replica is the primary's own file; set CRM_DB_REPLICA.")
+
+        while True:
+            started = time.perf_counter()
+            self.copy(source, target)
+            self.stdout.write(f"Copied {source} to {target} in {time.perf_counter() - started:.2f}s")
+            if options["interval"] is None:
+                return
+            time.sleep(options["interval"])
+
+    @staticmethod
+    def copy(source, target):
+        """Snapshot ``source`` and swap it in, so replica readers never see a half-copied file."""
+        partial = f"{target}.partial"
+        src, dst = sqlite3.connect(source), sqlite3.connect(partial)
+        try:
+            # The backup API copies a consistent snapshot while writers carry on
+            src.backup(dst)
+        finally:
+            src.close()
+            dst.close()
+        os.replace(partial, target)
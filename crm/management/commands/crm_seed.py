@@ -0,0 +1,209 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from crm.counters import reconcile_counters
+from crm.management.commands.crm_bench_search import FIRST_NAMES, LAST_NAMES
+from crm.models import Customer, Product, Order
+from crm.rollups import rebuild_rollups
+
+PRODUCT_WORDS = [
+    "Laptop", "Phone", "Tablet", "Monitor", "Keyboard", "Mouse", "Headset", "Speaker",
+    "Camera", "Router", "Charger", "Cable", "Dock", "Drive", "Printer", "Watch",
+]
+PRODUCT_GRADES = ["Basic", "Plus", "Pro", "Max", "Mini", "Ultra", "Lite", "Air"]
+
+
+def zipf_weights(count, skew):
+    """Cumulative weights ``1/rank**skew``, for ``random.choices(cum_weights=...)``."""
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic customers, products and orders at production scale "
+        "(e.g. --customers 1000000 --products 20000 --orders 5000000). A few "
+        "customers place most orders and a few products sell most units; the "
+        "same --seed gives the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=10000, help="Customers to create.")
+        parser.add_argument("--products", type=int, default=1000, help="Products to create.")
+        parser.add_argument("--orders", type=int, default=50000, help="Orders to create.")
+        parser.add_argument("--max-products", type=int, default=8, help="Most products on one order.")
+        parser.add_argument(
+            "--skew", type=float, default=0.8,
+            help="Zipf exponent of customer activity and product popularity (0 = uniform).",
+        )
+        parser.add_argument("--days", type=int, default=365, help="History the rows are spread over.")
+        parser.add_argument("--batch-size", type=int, default=10000, help="Rows per transaction.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+        parser.add_argument(
+            "--skip-rollups", action="store_true",
+            help="Leave the revenue rollups for crm_refresh_rollups --rebuild.",
+        )
+
+    def handle(self, *args, **options):
+        if options["customers"] < 1 or options["products"] < 1:
+            raise CommandError("Orders need at least one customer and one product.")
+
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.now = timezone.now()
+        self.history = timedelta(days=options["days"])
+        started = time.perf_counter()
+
+        customers = self.seed_customers(options["customers"])
+        products = self.seed_products(options["products"])
+        self.seed_orders(
+            options["orders"], customers, products, options["max_products"], options["skew"]
+        )
+
+        # Raw inserts send no signals: rebuild what the signals would have kept up
+        reconcile_counters()
+        if not options["skip_rollups"]:
+            self.timed("Rebuilt revenue rollups", lambda: rebuild_rollups(settle_seconds=0))
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f}s"))
+
+    # -------------------------------
+    # Tables
+    # -------------------------------
+    def seed_customers(self, count):
+        """Insert customers; returns ``[(id, created_at)]``."""
+        start = self.next_id(Customer)
+        customers = []
+
+        def rows(ids):
+            for pk in ids:
+                first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+                phone = f"+1555{self.rng.randrange(10 ** 7):07d}" if self.rng.random() < 0.7 else None
+                created_at = self.now - self.history * self.rng.random()
+                customers.append((pk, created_at))
+                yield pk, f"{first} {last}", f"{first.lower()}.{last.lower()}.{pk}@seed.example.com", phone, created_at
+
+        self.insert(Customer, ["id", "name", "email", "phone", "created_at"], start, count, rows)
+        return customers
+
+    def seed_products(self, count):
+        """Insert products; returns ``{id: price}``."""
+        start = self.next_id(Product)
+        prices = {}
+
+        def rows(ids):
+            for pk in ids:
+                price = Decimal(min(max(self.rng.lognormvariate(3.5, 1.0), 0.5), 5000)).quantize(Decimal("0.01"))
+                # One in ten runs low, for the restock job and lowStock filter
+                stock = self.rng.randrange(10) if self.rng.random() < 0.1 else self.rng.randrange(10, 1000)
+                prices[pk] = price
+                name = f"{self.rng.choice(PRODUCT_WORDS)} {self.rng.choice(PRODUCT_GRADES)} {pk}"
+                yield pk, name, price, stock
+
+        self.insert(Product, ["id", "name", "price", "stock"], start, count, rows)
+        return prices
+
+    def seed_orders(self, count, customers, prices, max_products, skew):
+        # Popularity follows rank in a shuffled order, not insertion order
+        customers = self.rng.sample(customers, len(customers))
+        product_ids = self.rng.sample(list(prices), len(prices))
+        customer_weights = zipf_weights(len(customers), skew)
+        product_weights = zipf_weights(len(product_ids), skew)
+        # Mostly one to three lines; the tail thins out geometrically
+        sizes = range(1, min(max_products, len(product_ids)) + 1)
+        size_weights = list(accumulate(0.5 ** size for size in sizes))
+
+        through = Order.products.through
+        start = self.next_id(Order)
+        next_line = [self.next_id(through)]
+        lines = []
+
+        def rows(ids):
+            picked = self.rng.choices(customers, cum_weights=customer_weights, k=len(ids))
+            for pk, (customer_id, created_at) in zip(ids, picked):
+                size = self.rng.choices(sizes, cum_weights=size_weights)[0]
+                items = set(self.rng.choices(product_ids, cum_weights=product_weights, k=size))
+                order_date = created_at + (self.now - created_at) * self.rng.random()
+                for product_id in sorted(items):
+                    lines.append((next_line[0], pk, product_id))
+                    next_line[0] += 1
+                yield pk, customer_id, sum(prices[item] for item in items), order_date
+
+        def flush_lines():
+            self.executemany(through, ["id", "order_id", "product_id"], lines)
+            lines.clear()
+
+        self.insert(
+            Order, ["id", "customer_id", "total_amount", "order_date"], start, count, rows,
+            after_batch=flush_lines,
+        )
+        self.reset_sequences(through)
+
+    # -------------------------------
+    # Inserts
+    # -------------------------------
+    def insert(self, model, columns, start, count, rows, after_batch=None):
+        """Insert ``count`` rows with consecutive ids from ``start``, one transaction per batch."""
+        started = time.perf_counter()
+        for offset in range(0, count, self.batch_size):
+            ids = range(start + offset, start + min(offset + self.batch_size, count))
+            with transaction.atomic():
+                self.executemany(model, columns, list(rows(ids)))
+                if after_batch is not None:
+                    after_batch()
+        self.reset_sequences(model)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{model._meta.verbose_name_plural.capitalize()}: {count} in {elapsed:.1f}s "
+            f"({count / elapsed if elapsed else 0:.0f} rows/s)"
+        )
+
+    def executemany(self, model, columns, rows):
+        if not rows:
+            return
+        # Raw cursors skip field adaptation: store datetimes and decimals as the ORM would
+        fields = [model._meta.get_field(column) for column in columns]
+        adapt = [
+            (index, field.get_db_prep_value)
+            for index, field in enumerate(fields)
+            if field.get_internal_type() in ("DateTimeField", "DecimalField")
+        ]
+        if adapt:
+            rows = [list(row) for row in rows]
+            for row in rows:
+                for index, prep in adapt:
+                    row[index] = prep(row[index], connection)
+        quote = connection.ops.quote_name
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            quote(model._meta.db_table),
+            ", ".join(quote(column) for column in columns),
+            ", ".join(["%s"] * len(columns)),
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    @staticmethod
+    def next_id(model):
+        return (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+    @staticmethod
+    def reset_sequences(model):
+        # Explicit ids leave PostgreSQL sequences behind; SQLite needs nothing
+        statements = connection.ops.sequence_reset_sql(no_style(), [model])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    def timed(self, label, func):
+        started = time.perf_counter()
+        result = func()
+        self.stdout.write(f"{label}: {result} in {time.perf_counter() - started:.1f}s")
+        return result
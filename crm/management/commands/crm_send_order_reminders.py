@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.reminders import get_sender, pending_reminders, send_order_reminders, window_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Send one reminder per customer with orders in the last --days that no "
+        "earlier run covered (what the daily reminders cron job runs)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Window of orders to remind about.")
+        parser.add_argument("--sender", help="Dotted path of the sender class, e.g. crm.reminders.EmailSender.")
+        parser.add_argument("--workers", type=int, help="Concurrent sends.")
+        parser.add_argument("--rate", type=float, help="Sends per second across all workers; 0 for no limit.")
+        parser.add_argument("--attempts", type=int, help="Tries per reminder before leaving it for the next run.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the reminders that are due.")
+
+    def handle(self, *args, **options):
+        for name in ("days", "workers", "attempts"):
+            if options[name] is not None and options[name] < 1:
+                raise CommandError(f"--{name} must be at least 1.")
+        if options["dry_run"]:
+            due = sum(len(batch) for batch in pending_reminders(window_start(options["days"])))
+            self.stdout.write(f"{due} reminders due")
+            return
+
+        started = time.perf_counter()
+
+        def progress(counts):
+            if options["verbosity"] > 1:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"Sent {counts['sent']}, failed {counts['failed']} ({elapsed:.1f}s)")
+
+        counts = send_order_reminders(
+            sender=get_sender(options["sender"]),
+            days=options["days"],
+            workers=options["workers"],
+            rate_limit=options["rate"],
+            max_attempts=options["attempts"],
+            progress=progress,
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {counts['sent']} order reminders, {counts['failed']} failed, in {elapsed:.2f}s"
+        ))
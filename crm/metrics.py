@@ -0,0 +1,297 @@
+"""
+In-process GraphQL metrics in the Prometheus text format, served at ``/metrics``.
+
+Every operation records its latency and error count. Only a sampled
+fraction (``SAMPLE_RATE``) also records per-field resolver timings
+(``MetricsMiddleware``) and SQL counts and durations (an execute wrapper
+on the operation's connection). Non-sampled operations therefore pay for
+a couple of clock reads and one attribute check per resolved field.
+
+A field's timing covers its own resolver only (up to the value it returns
+or, under async execution, awaits): children resolve after it. The first
+``load()`` of a batch absorbs the whole batch query.
+Scalar fields are attribute reads and are not timed unless
+``TIME_SCALAR_FIELDS`` is set. Metrics are per process, so scrape every
+worker.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from inspect import isawaitable
+
+from django.conf import settings
+from django.db import connections
+from graphql import get_named_type, is_leaf_type
+
+from .routing import aexecute_wrapper, read_alias
+
+DEFAULTS = {
+    # False turns off recording and /metrics
+    "ENABLED": True,
+    # Fraction of operations that record field and SQL timings
+    "SAMPLE_RATE": 0.1,
+    # Also time scalar fields (attribute reads) on sampled operations
+    "TIME_SCALAR_FIELDS": False,
+    # Distinct operation names kept as labels; the rest are reported as "other"
+    "MAX_OPERATION_NAMES": 200,
+}
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+def get_setting(name):
+    return getattr(settings, "CRM_METRICS", {}).get(name, DEFAULTS[name])
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# -------------------------------
+# Metric Types
+# -------------------------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), values):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {values[-2]}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {values[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []  # callables returning [(name, kind, help, value)] at scrape time
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+            lines += metric.samples()
+        for collect in self.collectors:
+            for name, kind, help, value in collect():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+OPERATION_DURATION = registry.register(Histogram(
+    "crm_graphql_operation_duration_seconds",
+    "Time spent executing a GraphQL operation.",
+    labels=("operation_type", "operation_name"),
+))
+OPERATION_ERRORS = registry.register(Counter(
+    "crm_graphql_errors_total",
+    "GraphQL errors returned, by phase (request: parse/validation/cost; execution).",
+    labels=("operation_name", "phase"),
+))
+FIELD_DURATION = registry.register(Histogram(
+    "crm_graphql_field_duration_seconds",
+    "Resolver time per field, from sampled operations.",
+    labels=("field",),
+))
+OPERATION_SQL_QUERIES = registry.register(Histogram(
+    "crm_graphql_operation_sql_queries",
+    "SQL statements issued per operation, from sampled operations.",
+    labels=("operation_type", "operation_name"),
+    buckets=COUNT_BUCKETS,
+))
+SQL_DURATION = registry.register(Histogram(
+    "crm_sql_query_duration_seconds",
+    "SQL statement duration, from sampled operations.",
+    labels=("statement",),
+))
+SAMPLED_OPERATIONS = registry.register(Counter(
+    "crm_graphql_sampled_operations_total",
+    "Operations that recorded field and SQL timings.",
+))
+
+
+# -------------------------------
+# Recording
+# -------------------------------
+_operation_names = set()
+_operation_names_lock = threading.Lock()
+
+
+def operation_label(operation_name):
+    """Bound label cardinality: clients choose operation names."""
+    if not operation_name:
+        return "anonymous"
+    if operation_name in _operation_names:
+        return operation_name
+    with _operation_names_lock:
+        if len(_operation_names) < get_setting("MAX_OPERATION_NAMES"):
+            _operation_names.add(operation_name)
+            return operation_name
+    return "other"
+
+
+def record_rejected(operation_name, errors):
+    if get_setting("ENABLED") and errors:
+        OPERATION_ERRORS.inc(operation_label(operation_name), "request", amount=len(errors))
+
+
+class Sample:
+    """Field and SQL timings of one sampled operation; flushed when it ends."""
+
+    def __init__(self):
+        self.time_scalars = get_setting("TIME_SCALAR_FIELDS")
+        self.fields = []
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append((sql.lstrip()[:6].upper(), time.perf_counter() - started))
+
+
+class record_operation:
+    """
+    Context manager timing one operation; sets ``context.crm_metrics`` when sampled.
+
+    Use ``async with`` for operations executing on the event loop.
+    """
+
+    def __init__(self, context, operation_type, operation_name):
+        self.enabled = get_setting("ENABLED")
+        self.context = context
+        self.labels = (operation_type, operation_label(operation_name))
+        self.sample = None
+        self.result = None
+
+    def __enter__(self):
+        if self.sampled():
+            self._wrapper = connections[read_alias()].execute_wrapper(self.sample)
+            self._wrapper.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        if self.sample is not None:
+            self._wrapper.__exit__(*exc_info)
+        self.observe(elapsed)
+
+    async def __aenter__(self):
+        if self.sampled():
+            self._wrapper = aexecute_wrapper(self.sample)
+            await self._wrapper.__aenter__()
+        self.started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        if self.sample is not None:
+            await self._wrapper.__aexit__(*exc_info)
+        self.observe(elapsed)
+
+    def sampled(self):
+        if self.enabled and random.random() < get_setting("SAMPLE_RATE"):
+            self.sample = Sample()
+            self.context.crm_metrics = self.sample
+        return self.sample is not None
+
+    def observe(self, elapsed):
+        if not self.enabled:
+            return
+        OPERATION_DURATION.observe(elapsed, *self.labels)
+        if self.result is not None and self.result.errors:
+            OPERATION_ERRORS.inc(self.labels[1], "execution", amount=len(self.result.errors))
+
+        if self.sample is not None:
+            self.context.crm_metrics = None
+            SAMPLED_OPERATIONS.inc()
+            for field, duration in self.sample.fields:
+                FIELD_DURATION.observe(duration, field)
+            OPERATION_SQL_QUERIES.observe(len(self.sample.statements), *self.labels)
+            for statement, duration in self.sample.statements:
+                SQL_DURATION.observe(duration, statement)
+
+
+class MetricsMiddleware:
+    """Graphene middleware timing resolvers of sampled operations."""
+
+    def resolve(self, next, root, info, **args):
+        sample = getattr(info.context, "crm_metrics", None)
+        if sample is None or (
+            not sample.time_scalars and is_leaf_type(get_named_type(info.return_type))
+        ):
+            return next(root, info, **args)
+        field = f"{info.parent_type.name}.{info.field_name}"
+        started = time.perf_counter()
+        try:
+            result = next(root, info, **args)
+        except Exception:
+            sample.fields.append((field, time.perf_counter() - started))
+            raise
+        if isawaitable(result):
+            return self.timed(result, sample, field, started)
+        sample.fields.append((field, time.perf_counter() - started))
+        return result
+
+    @staticmethod
+    async def timed(result, sample, field, started):
+        try:
+            return await result
+        finally:
+            sample.fields.append((field, time.perf_counter() - started))
@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def seed_counters(apps, schema_editor):
+    Counter = apps.get_model("crm", "Counter")
+    Customer = apps.get_model("crm", "Customer")
+    Order = apps.get_model("crm", "Order")
+    orders = Order.objects.aggregate(count=Count("pk"), revenue=Sum("total_amount"))
+    Counter.objects.bulk_create([
+        Counter(name="customers", value=Customer.objects.count()),
+        Counter(name="orders", value=orders["count"]),
+        Counter(name="revenue", value=orders["revenue"] or Decimal("0")),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# Only SQLite gets the FTS5 index; other backends keep icontains (crm/search.py)
+FTS_INDEXES = [
+    ("crm_customer", "crm_customer_fts", ("name", "email")),
+    ("crm_product", "crm_product_fts", ("name",)),
+]
+
+
+def statements(source, fts, columns):
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    changed = " OR ".join(f"old.{c} IS NOT new.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{source}', content_rowid='id')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {source} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {source} WHEN {changed} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        # Index the rows that already exist
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for source, fts, columns in FTS_INDEXES:
+        for sql in statements(source, fts, columns):
+            schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for _, fts, _ in FTS_INDEXES:
+        for suffix in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_revenue_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
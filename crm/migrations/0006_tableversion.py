@@ -0,0 +1,73 @@
+from django.db import migrations, models
+
+# Tables the GraphQL API reads. Each gets a TableVersion row plus triggers
+# that bump it inside the writing statement; the response cache never stores
+# a result that read a table without a row here (crm/response_cache.py).
+TRACKED_TABLES = [
+    "crm_customer",
+    "crm_product",
+    "crm_order",
+    "crm_order_products",
+    "crm_counter",
+    "crm_customerrevenuerollup",
+    "crm_productrevenuerollup",
+]
+
+
+def create_triggers(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in ("sqlite", "postgresql"):
+        # No rows, no triggers: the response cache stores nothing here
+        return
+    TableVersion = apps.get_model("crm", "TableVersion")
+    TableVersion.objects.bulk_create([TableVersion(table=table) for table in TRACKED_TABLES])
+
+    if vendor == "sqlite":
+        for table in TRACKED_TABLES:
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                schema_editor.execute(
+                    f"CREATE TRIGGER {table}_version_{event.lower()} AFTER {event} ON {table} "
+                    f"BEGIN UPDATE crm_tableversion SET version = version + 1 "
+                    f"WHERE \"table\" = '{table}'; END"
+                )
+    else:
+        schema_editor.execute(
+            "CREATE FUNCTION crm_bump_table_version() RETURNS trigger AS $$ BEGIN "
+            "UPDATE crm_tableversion SET version = version + 1 WHERE \"table\" = TG_TABLE_NAME; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql"
+        )
+        for table in TRACKED_TABLES:
+            schema_editor.execute(
+                f"CREATE TRIGGER {table}_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE "
+                f"ON {table} FOR EACH STATEMENT EXECUTE FUNCTION crm_bump_table_version()"
+            )
+
+
+def drop_triggers(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for table in TRACKED_TABLES:
+            for event in ("insert", "update", "delete"):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_version_{event}")
+    elif vendor == "postgresql":
+        for table in TRACKED_TABLES:
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_version ON {table}")
+        schema_editor.execute("DROP FUNCTION IF EXISTS crm_bump_table_version()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_search_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('table', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,20 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_tableversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderReminder',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_reminder', serialize=False, to='crm.customer')),
+                ('last_order_id', models.BigIntegerField()),
+                ('sent_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-17 05:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_orderreminder'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
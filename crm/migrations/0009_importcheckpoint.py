@@ -0,0 +1,24 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_order_date_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=20)),
+                ('path', models.TextField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('created', models.BigIntegerField(default=0)),
+                ('rejected', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
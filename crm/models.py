@@ -2,6 +2,7 @@ from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.utils import timezone
 
 class Customer(models.Model):
     name = models.CharField(max_length=100)
@@ -9,6 +10,12 @@ class Customer(models.Model):
     phone = models.CharField(max_length=20, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Backs keyset pagination on (created_at, id)
+            models.Index(fields=["created_at", "id"], name="customer_created_id_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -26,7 +33,103 @@ class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="orders")
     products = models.ManyToManyField(Product, related_name="orders")
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    order_date = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: imports and replays keep their historical dates
+    order_date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination on (order_date, id)
+            models.Index(fields=["order_date", "id"], name="order_date_id_idx"),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.customer.name}"
+
+
+class Counter(models.Model):
+    """Running totals read by the dashboard fields; see crm/counters.py."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+
+# -------------------------------
+# Revenue Rollups (maintained by crm/rollups.py)
+# -------------------------------
+class RollupGranularity(models.TextChoices):
+    HOUR = "hour", "Hour"
+    DAY = "day", "Day"
+
+
+class CustomerRevenueRollup(models.Model):
+    granularity = models.CharField(max_length=4, choices=RollupGranularity.choices)
+    bucket = models.DateTimeField()
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="revenue_rollups")
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["granularity", "bucket", "customer"], name="customer_rollup_key"
+            ),
+        ]
+
+
+class ProductRevenueRollup(models.Model):
+    granularity = models.CharField(max_length=4, choices=RollupGranularity.choices)
+    bucket = models.DateTimeField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="revenue_rollups")
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["granularity", "bucket", "product"], name="product_rollup_key"
+            ),
+        ]
+        indexes = [
+            # topProducts ranks a bucket range by revenue
+            models.Index(fields=["granularity", "bucket", "revenue"], name="product_rollup_rank_idx"),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Keyset position (order_date, id) of the last order folded into the rollups."""
+    name = models.CharField(max_length=50, primary_key=True)
+    order_date = models.DateTimeField(null=True)
+    order_id = models.BigIntegerField(default=0)
+
+
+class TableVersion(models.Model):
+    """Write counter per table; the response cache keys on these (crm/response_cache.py)."""
+    table = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+
+# -------------------------------
+# Order Reminders (sent by crm/reminders.py)
+# -------------------------------
+class OrderReminder(models.Model):
+    """Latest order a customer has been reminded about; later orders get a new reminder."""
+    customer = models.OneToOneField(
+        Customer, on_delete=models.CASCADE, primary_key=True, related_name="order_reminder"
+    )
+    last_order_id = models.BigIntegerField()
+    sent_at = models.DateTimeField()
+
+
+# -------------------------------
+# Imports (resumed by manage.py crm_import)
+# -------------------------------
+class ImportCheckpoint(models.Model):
+    """Rows of an import file already handled; saved in each batch's own transaction."""
+    name = models.CharField(max_length=255, primary_key=True)
+    model = models.CharField(max_length=20)
+    path = models.TextField()
+    offset = models.BigIntegerField(default=0)
+    created = models.BigIntegerField(default=0)
+    rejected = models.BigIntegerField(default=0)
@@ -0,0 +1,191 @@
+"""
+Keyset (seek) pagination for relay connections.
+
+Offset cursors make the database walk and discard every row before the
+page, and each page also pays for a ``COUNT(*)``. Keyset cursors encode
+the sort key of the last row seen instead, so the next page is a single
+indexed range scan no matter how deep it is. Under async execution the
+page and ``totalCount`` are read through the async ORM.
+"""
+import base64
+import json
+from functools import partial
+
+import graphene
+from django.db.models import Q
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphql import GraphQLError
+
+from .loaders import is_async
+
+CURSOR_PREFIX = "keyset:"
+
+
+# -------------------------------
+# Cursors
+# -------------------------------
+def _cursor_value(value):
+    # Full isoformat: DjangoJSONEncoder would drop microseconds and repeat rows
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(values):
+    payload = CURSOR_PREFIX + json.dumps(values, default=_cursor_value)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, model, keyset):
+    """Turn a cursor back into typed sort-key values for ``keyset``."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor.encode()).decode()
+        if not payload.startswith(CURSOR_PREFIX):
+            raise ValueError(payload)
+        values = json.loads(payload[len(CURSOR_PREFIX):])
+        return [
+            model._meta.get_field(name).to_python(value)
+            for name, value in zip(keyset, values, strict=True)
+        ]
+    except Exception:
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+
+
+def seek_filter(keyset, values, backward=False):
+    """
+    WHERE clause for rows strictly after (or before) ``values`` in keyset order.
+
+    Written as ``lead >= v AND (lead > v OR id > i)`` so the leading
+    condition is a plain range seek on the composite index.
+    """
+    (lead, tiebreak), (lead_value, tiebreak_value) = keyset, values
+    op = "lt" if backward else "gt"
+    return Q(**{f"{lead}__{op}e": lead_value}) & (
+        Q(**{f"{lead}__{op}": lead_value}) | Q(**{f"{tiebreak}__{op}": tiebreak_value})
+    )
+
+
+# -------------------------------
+# Connection
+# -------------------------------
+class KeysetConnection(graphene.relay.Connection):
+    """Connection paged by sort key; ``totalCount`` is only computed when selected."""
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int(
+        description="Exact number of matching rows. Runs a COUNT(*); omit it on hot paths."
+    )
+
+    def resolve_total_count(self, info):
+        if is_async(info):
+            return self.iterable.acount()
+        return self.iterable.count()
+
+
+class KeysetConnectionField(DjangoFilterConnectionField):
+    """
+    Filterable connection paginated with keyset cursors.
+
+    ``keyset`` is a ``(column, tiebreaker)`` pair such as ``("order_date", "id")``
+    and should be backed by a composite index. ``first``/``after`` page
+    forwards and ``last``/``before`` page backwards; there is no ``offset``.
+    """
+
+    def __init__(self, connection, keyset, *args, **kwargs):
+        self.keyset_connection = connection
+        self.keyset = tuple(keyset)
+        super().__init__(connection._meta.node, *args, **kwargs)
+        self._base_args.pop("offset", None)
+
+    @property
+    def type(self):
+        return self.keyset_connection
+
+    @classmethod
+    def keyset_resolver(
+        cls, resolver, connection, default_manager, queryset_resolver, max_limit, keyset,
+        root, info, **args
+    ):
+        first, last = args.get("first"), args.get("last")
+        after, before = args.get("after"), args.get("before")
+        for name, value in (("first", first), ("last", last)):
+            if value is not None and value < 0:
+                raise GraphQLError(f"`{name}` must be a non-negative integer.")
+            if value is not None and max_limit and value > max_limit:
+                raise GraphQLError(
+                    f"Requesting {value} records on the `{info.field_name}` connection "
+                    f"exceeds the `{name}` limit of {max_limit} records."
+                )
+
+        iterable = resolver(root, info, **args)
+        if iterable is None:
+            iterable = default_manager
+        queryset = queryset_resolver(connection, iterable, info, args)
+        model = queryset.model
+
+        # Cursors read the sort key; keep it in a planner's only() projection
+        fields, deferred = queryset.query.deferred_loading
+        if fields and not deferred:
+            queryset = queryset.only(*fields, *keyset)
+
+        backward = last is not None or (before is not None and first is None)
+        limit = last if backward else first
+        if limit is None:
+            limit = max_limit
+        cursor = before if backward else after
+        direction = "-" if backward else ""
+
+        page = queryset.order_by(*(direction + name for name in keyset))
+        if cursor:
+            page = page.filter(seek_filter(keyset, decode_cursor(cursor, model, keyset), backward))
+
+        # One extra row tells us whether another page exists
+        page = page[:limit + 1] if limit is not None else page
+        if is_async(info):
+            return cls.apage_connection(connection, queryset, page, limit, backward, keyset, after, before)
+        return cls.page_connection(connection, queryset, list(page), limit, backward, keyset, after, before)
+
+    @classmethod
+    async def apage_connection(cls, connection, queryset, page, *args):
+        rows = [row async for row in page]
+        return cls.page_connection(connection, queryset, rows, *args)
+
+    @staticmethod
+    def page_connection(connection, queryset, rows, limit, backward, keyset, after, before):
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit]
+        if backward:
+            rows.reverse()
+
+        edges = [
+            connection.Edge(
+                node=row,
+                cursor=encode_cursor([getattr(row, name) for name in keyset]),
+            )
+            for row in rows
+        ]
+        result = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_more if backward else bool(after),
+                has_next_page=bool(before) if backward else has_more,
+            ),
+        )
+        result.iterable = queryset
+        return result
+
+    def wrap_resolve(self, parent_resolver):
+        return partial(
+            self.keyset_resolver,
+            self.resolver or parent_resolver,
+            self.connection_type,
+            self.get_manager(),
+            self.get_queryset_resolver(),
+            self.max_limit,
+            self.keyset,
+        )
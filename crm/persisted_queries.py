@@ -0,0 +1,183 @@
+"""
+Persisted queries and a parsed-document cache for the /graphql view.
+
+Clients may send ``extensions.persistedQuery.sha256Hash`` instead of the
+query text (Apollo APQ protocol). Hashes resolve against a manifest of
+operations registered ahead of time or, when APQ is enabled, against
+queries registered on first use in Django's cache. Either way the parsed
+and validated ``DocumentNode`` is kept in a bounded LRU so repeat requests
+skip parsing and validation entirely.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+PERSISTED_QUERY_VERSION = 1
+CACHE_PREFIX = "crm:persisted-query:"
+
+DEFAULTS = {
+    # JSON file mapping sha256 hashes to query text
+    "MANIFEST": None,
+    # Register unknown hashes on first use (APQ); False restricts to the manifest
+    "ALLOW_REGISTRATION": True,
+    # Number of parsed-and-validated documents kept per process
+    "DOCUMENT_CACHE_SIZE": 256,
+}
+
+
+def get_setting(name):
+    return getattr(settings, "CRM_PERSISTED_QUERIES", {}).get(name, DEFAULTS[name])
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class PersistedQueryError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+# -------------------------------
+# Document Cache
+# -------------------------------
+class DocumentCache:
+    """Thread-safe LRU of parsed and validated documents keyed by query hash."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            document = self._documents.get(key)
+            if document is None:
+                self.misses += 1
+                return None
+            self._documents.move_to_end(key)
+            self.hits += 1
+            return document
+
+    def set(self, key, document):
+        with self._lock:
+            self._documents[key] = document
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.maxsize:
+                self._documents.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._documents)
+
+
+# -------------------------------
+# Persisted Query Store
+# -------------------------------
+@lru_cache(maxsize=1)
+def load_manifest():
+    """Operations registered ahead of time, as ``{sha256: query}``."""
+    path = get_setting("MANIFEST")
+    if not path:
+        return {}
+    with open(path) as f:
+        manifest = json.load(f)
+    # Re-hash so a stale manifest entry can never run different text
+    return {query_hash(query): query for query in manifest.values()}
+
+
+def register_query(query):
+    """Store ``query`` under its hash and return the hash."""
+    digest = query_hash(query)
+    cache.set(CACHE_PREFIX + digest, query, timeout=None)
+    return digest
+
+
+async def aregister_query(query):
+    digest = query_hash(query)
+    await cache.aset(CACHE_PREFIX + digest, query, timeout=None)
+    return digest
+
+
+def lookup_query(digest):
+    return load_manifest().get(digest) or cache.get(CACHE_PREFIX + digest)
+
+
+async def alookup_query(digest):
+    return load_manifest().get(digest) or await cache.aget(CACHE_PREFIX + digest)
+
+
+def get_extensions(request, data):
+    extensions = request.GET.get("extensions") or data.get("extensions")
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            return {}
+    return extensions if isinstance(extensions, dict) else {}
+
+
+def resolve_persisted_query(extensions, query):
+    """
+    Return ``(query, register)``: the query text to execute for a request,
+    and whether to register it once it has validated.
+
+    Plain requests pass through untouched. A hash with text is checked
+    against the text; a bare hash is looked up.
+    """
+    query, register, digest = check_persisted_query(extensions, query)
+    if digest is not None:
+        query = require_stored(lookup_query(digest))
+    return query, register
+
+
+async def aresolve_persisted_query(extensions, query):
+    """``resolve_persisted_query`` through the async cache API."""
+    query, register, digest = check_persisted_query(extensions, query)
+    if digest is not None:
+        query = require_stored(await alookup_query(digest))
+    return query, register
+
+
+def check_persisted_query(extensions, query):
+    """``(query, register, digest)``, where ``digest`` is set when the text must be looked up."""
+    persisted = extensions.get("persistedQuery")
+    if not persisted:
+        return query, False, None
+
+    if persisted.get("version") != PERSISTED_QUERY_VERSION:
+        raise PersistedQueryError(
+            "Unsupported persisted query version.", "PERSISTED_QUERY_NOT_SUPPORTED"
+        )
+
+    digest = persisted.get("sha256Hash")
+    if not query:
+        return None, False, digest
+    if query_hash(query) != digest:
+        raise PersistedQueryError("Provided sha256Hash does not match query.", "BAD_REQUEST")
+    if digest in load_manifest():
+        return query, False, None
+    if not get_setting("ALLOW_REGISTRATION"):
+        raise PersistedQueryError(
+            "Only pre-registered persisted queries are allowed.",
+            "PERSISTED_QUERY_NOT_SUPPORTED",
+        )
+    return query, True, None
+
+
+def require_stored(stored):
+    if stored is None:
+        raise PersistedQueryError("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+    return stored
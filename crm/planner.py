@@ -0,0 +1,123 @@
+"""
+Selection-set-aware query planning for the CRM resolvers.
+
+``plan_queryset`` walks the fields a client actually asked for and turns
+them into ``only()`` column projection, ``select_related`` joins for
+forward foreign keys and ``prefetch_related`` (with nested ``Prefetch``
+querysets) for reverse and many-to-many relations.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+# Connection arguments that only slice the related rows
+PAGINATION_ARGS = {"first", "last", "before", "after", "offset"}
+
+
+class QueryPlan:
+    def __init__(self):
+        self.only = set()
+        self.select_related = []
+        self.prefetch_related = []
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset.only(*sorted(self.only))
+
+
+def collect_fields(selection_set, info, fields=None):
+    """Flatten a selection set (including fragments) into ``{name: [FieldNode]}``."""
+    fields = {} if fields is None else fields
+    if selection_set is None:
+        return fields
+
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            fields.setdefault(selection.name.value, []).append(selection)
+        elif isinstance(selection, InlineFragmentNode):
+            collect_fields(selection.selection_set, info, fields)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments[selection.name.value]
+            collect_fields(fragment.selection_set, info, fields)
+    return fields
+
+
+def object_fields(field_nodes, info):
+    """Fields selected on the object(s) a field returns, looking through relay ``edges { node }``."""
+    fields = {}
+    for node in field_nodes:
+        collect_fields(node.selection_set, info, fields)
+
+    if "edges" not in fields:
+        return fields
+
+    edge_fields = {}
+    for edge in fields["edges"]:
+        collect_fields(edge.selection_set, info, edge_fields)
+
+    node_fields = {}
+    for node in edge_fields.get("node", []):
+        collect_fields(node.selection_set, info, node_fields)
+    return node_fields
+
+
+def has_filter_arguments(field_nodes):
+    return any(
+        argument.name.value not in PAGINATION_ARGS
+        for node in field_nodes
+        for argument in node.arguments
+    )
+
+
+def build_plan(model, fields, info, plan, prefix=""):
+    """Add the columns and relations ``fields`` needs on ``model`` to ``plan``."""
+    # Keys are always loaded so relations can be resolved without deferred lookups
+    plan.only.add(prefix + model._meta.pk.attname)
+    for field in model._meta.concrete_fields:
+        if field.is_relation:
+            plan.only.add(prefix + field.name)
+
+    for name, nodes in fields.items():
+        try:
+            field = model._meta.get_field(to_snake_case(name))
+        except FieldDoesNotExist:
+            continue
+
+        if field.many_to_one or field.one_to_one:
+            if not field.concrete:
+                continue
+            plan.select_related.append(prefix + field.name)
+            build_plan(
+                field.related_model, object_fields(nodes, info), info, plan,
+                prefix=f"{prefix}{field.name}__",
+            )
+        elif field.many_to_many or field.one_to_many:
+            # Filtered relations are resolved per row by the resolver
+            if has_filter_arguments(nodes):
+                continue
+            accessor = field.name if field.concrete else field.get_accessor_name()
+            related = field.related_model
+            queryset = plan_queryset(
+                related._default_manager.order_by("pk"), info, field_nodes=nodes
+            )
+            plan.prefetch_related.append(Prefetch(prefix + accessor, queryset=queryset))
+        elif field.concrete:
+            plan.only.add(prefix + field.name)
+    return plan
+
+
+def plan_queryset(queryset, info, field_nodes=None):
+    """
+    Optimize ``queryset`` for the selection of ``field_nodes``.
+
+    Defaults to the field currently being resolved, so a root resolver can
+    simply return ``plan_queryset(Model.objects.all(), info)``.
+    """
+    if field_nodes is None:
+        field_nodes = info.field_nodes
+    fields = object_fields(field_nodes, info)
+    return build_plan(queryset.model, fields, info, QueryPlan()).apply(queryset)
@@ -0,0 +1,158 @@
+"""
+In-process publish/subscribe for GraphQL subscriptions.
+
+Writers announce changes with ``orders_created(ids)`` and
+``stock_changed(ids)``. Model signals and the bulk and inventory paths
+call these; the signals cannot see ``bulk_create`` or ``UPDATE`` statements.
+Nothing is published until the surrounding transaction commits, and the
+rows are fetched once per commit, only while someone is subscribed. All
+subscribers share the fetched instances.
+
+Every subscription owns a bounded ``asyncio.Queue`` on its connection's
+event loop. A subscriber that falls ``QUEUE_SIZE`` events behind is ended
+with ``SubscriberOverflow``. Events are never dropped silently; the client
+resubscribes and re-reads what it missed. Only writes made in this process
+are seen, so run the websocket server in the same process as the
+mutations (the ASGI app serves both).
+"""
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Product, Order
+
+ORDER_CREATED = "order_created"
+PRODUCT_STOCK_CHANGED = "product_stock_changed"
+
+DEFAULTS = {
+    # Events a subscription may fall behind before it is ended
+    "QUEUE_SIZE": 100,
+    # Concurrent subscriptions per websocket connection
+    "MAX_SUBSCRIPTIONS": 20,
+    # Seconds a client has to send connection_init
+    "CONNECTION_INIT_TIMEOUT": 10,
+}
+
+# Ids per fetch; keeps ``IN (...)`` under SQLite's bound-parameter limit
+FETCH_CHUNK_SIZE = 500
+
+
+def get_setting(name):
+    return getattr(settings, "CRM_SUBSCRIPTIONS", {}).get(name, DEFAULTS[name])
+
+
+class SubscriberOverflow(Exception):
+    def __init__(self, topic):
+        super().__init__(f"Subscriber fell too far behind on {topic}; resubscribe to continue.")
+
+
+# -------------------------------
+# Hub
+# -------------------------------
+class Subscriber:
+    _overflowed = object()
+
+    def __init__(self, topic, maxsize):
+        self.topic = topic
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def offer(self, events):
+        """Enqueue ``events``; runs on the subscriber's loop."""
+        for event in events:
+            if self.overflowed:
+                return
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Free the queue so the consumer wakes up to the overflow at once
+                self.overflowed = True
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                self.queue.put_nowait(self._overflowed)
+
+    async def __aiter__(self):
+        while True:
+            event = await self.queue.get()
+            if event is self._overflowed:
+                raise SubscriberOverflow(self.topic)
+            yield event
+
+
+class Hub:
+    """Thread-safe fan-out from writer threads to subscribers' event loops."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def has_subscribers(self, topic):
+        return bool(self._subscribers.get(topic))
+
+    @asynccontextmanager
+    async def subscribe(self, topic, maxsize=None):
+        subscriber = Subscriber(topic, maxsize or get_setting("QUEUE_SIZE"))
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscriber)
+        try:
+            yield subscriber
+        finally:
+            with self._lock:
+                self._subscribers[topic].discard(subscriber)
+
+    def publish(self, topic, events):
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, events)
+            except RuntimeError:
+                # The connection's loop is gone; its context manager cleans up
+                pass
+
+
+hub = Hub()
+
+
+# -------------------------------
+# Publishing
+# -------------------------------
+def fetch_orders(ids):
+    return Order.objects.select_related("customer").prefetch_related("products").filter(pk__in=ids)
+
+
+def fetch_products(ids):
+    return Product.objects.filter(pk__in=ids)
+
+
+FETCHERS = {
+    ORDER_CREATED: fetch_orders,
+    PRODUCT_STOCK_CHANGED: fetch_products,
+}
+
+
+def publish_on_commit(topic, ids):
+    """Publish the rows ``ids`` of ``topic`` once the current transaction commits."""
+    ids = sorted(set(ids))
+    if ids:
+        transaction.on_commit(lambda: _publish(topic, ids), robust=True)
+
+
+def _publish(topic, ids):
+    if not hub.has_subscribers(topic):
+        return
+    for start in range(0, len(ids), FETCH_CHUNK_SIZE):
+        events = list(FETCHERS[topic](ids[start:start + FETCH_CHUNK_SIZE]).order_by("pk"))
+        hub.publish(topic, events)
+
+
+def orders_created(ids):
+    publish_on_commit(ORDER_CREATED, ids)
+
+
+def stock_changed(ids):
+    publish_on_commit(PRODUCT_STOCK_CHANGED, ids)
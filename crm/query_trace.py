@@ -0,0 +1,208 @@
+"""
+SQL tracing for GraphQL operations: N+1 detection and query budgets.
+
+A ``QueryTrace`` records every statement an operation issues, along with
+the path of the field being resolved when it ran. That is the last field
+entered, so a lazy queryset evaluated while a field's value is completed,
+or a loader batch dispatched by a field's first ``load()``, counts against
+that field. Statements that differ only in their parameters fall into
+one group. A group of ``N_PLUS_ONE_THRESHOLD`` or more statements is the
+signature of an N+1: the same lookup once per row instead of one batch.
+
+In dev mode (``ENABLED``, on when ``DEBUG`` is) the GraphQL views trace
+every operation and log each such group with the field paths that issued
+it, on the ``crm.query_trace`` logger. Tests pin query counts with
+``QueryBudgetMixin.assertMaxQueries(operation, n)``.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import connections
+
+from .loaders import BatchExecutionContext
+from .routing import aexecute_wrapper, read_alias
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Trace every /graphql operation and log N+1 groups
+    "ENABLED": False,
+    # Similar statements in one operation that count as an N+1
+    "N_PLUS_ONE_THRESHOLD": 3,
+}
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_NUMBER = re.compile(r"\b\d+\b")
+
+
+def get_setting(name):
+    return getattr(settings, "CRM_QUERY_TRACE", {}).get(name, DEFAULTS[name])
+
+
+def statement_shape(sql):
+    """``sql`` with its parameters, IN-list lengths and LIMIT/OFFSET literals erased."""
+    return _NUMBER.sub("?", _IN_LIST.sub("IN (...)", sql))
+
+
+def field_path(path):
+    """``allOrders.edges.*.node.customer`` for a resolver's ``info.path``."""
+    if path is None:
+        return "(operation)"
+    return ".".join("*" if isinstance(key, int) else key for key in path.as_list())
+
+
+# -------------------------------
+# Trace
+# -------------------------------
+class QueryTrace:
+    """Execute wrapper recording statements against the field being resolved."""
+
+    def __init__(self):
+        self.statements = []  # (sql, params, duration, field path)
+        self.path = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append((sql, params, time.perf_counter() - started, field_path(self.path)))
+
+    def __len__(self):
+        return len(self.statements)
+
+    def repeated(self, threshold=None):
+        """``[(shape, count, {field path: count})]`` for groups of ``threshold`` or more, largest first."""
+        threshold = threshold or get_setting("N_PLUS_ONE_THRESHOLD")
+        groups = {}
+        for sql, _, _, path in self.statements:
+            groups.setdefault(statement_shape(sql), Counter())[path] += 1
+        return sorted(
+            (
+                (shape, sum(paths.values()), dict(paths))
+                for shape, paths in groups.items()
+                if sum(paths.values()) >= threshold
+            ),
+            key=lambda group: -group[1],
+        )
+
+    def report(self):
+        lines = [
+            f"{index}. [{path}] {sql} {list(params or ())}"
+            for index, (sql, params, _, path) in enumerate(self.statements, 1)
+        ]
+        for shape, count, paths in self.repeated():
+            lines.append(f"N+1: {count} similar statements from {', '.join(paths)}: {shape}")
+        return "\n".join(lines)
+
+
+class QueryTraceMiddleware:
+    """Graphene middleware pointing the operation's trace at the field being resolved."""
+
+    def resolve(self, next, root, info, **args):
+        trace = getattr(info.context, "crm_query_trace", None)
+        if trace is not None:
+            trace.path = info.path
+        return next(root, info, **args)
+
+
+@contextmanager
+def trace_queries(context, label):
+    """Trace the statements run inside the block when dev mode is on; log N+1 groups."""
+    if not get_setting("ENABLED"):
+        yield None
+        return
+
+    trace = QueryTrace()
+    context.crm_query_trace = trace
+    try:
+        with connections[read_alias()].execute_wrapper(trace):
+            yield trace
+    finally:
+        context.crm_query_trace = None
+        log_trace(trace, label)
+
+
+@asynccontextmanager
+async def atrace_queries(context, label):
+    """``trace_queries`` for operations executing on the event loop."""
+    if not get_setting("ENABLED"):
+        yield None
+        return
+
+    trace = QueryTrace()
+    context.crm_query_trace = trace
+    try:
+        async with aexecute_wrapper(trace):
+            yield trace
+    finally:
+        context.crm_query_trace = None
+        log_trace(trace, label)
+
+
+def log_trace(trace, label):
+    for shape, count, paths in trace.repeated():
+        logger.warning(
+            "Possible N+1 in %s: %d similar statements from %s: %s",
+            label, count, ", ".join(paths), shape,
+        )
+    logger.debug(
+        "%s: %d statements in %.1fms", label, len(trace),
+        sum(duration for _, _, duration, _ in trace.statements) * 1000,
+    )
+
+
+def trace_operation(operation, variables=None, context=None, schema=None):
+    """Run ``operation`` in-process as the views do and return ``(result, trace)``."""
+    if schema is None:
+        # Imported late: the project schema imports this app's modules
+        from graphql_crm.schema import schema
+
+    if context is None:
+        context = SimpleNamespace(user=None, META={})
+    trace = QueryTrace()
+    context.crm_query_trace = trace
+    try:
+        with connections[read_alias()].execute_wrapper(trace):
+            result = schema.execute(
+                operation,
+                variable_values=variables,
+                context_value=context,
+                middleware=[QueryTraceMiddleware()],
+                execution_context_class=BatchExecutionContext,
+            )
+    finally:
+        context.crm_query_trace = None
+    return result, trace
+
+
+# -------------------------------
+# Test Assertions
+# -------------------------------
+class QueryBudgetMixin:
+    """``TestCase`` mixin holding GraphQL operations to a number of SQL statements."""
+
+    def execute_operation(self, operation, variables=None, context=None):
+        result, trace = trace_operation(operation, variables, context)
+        if result.errors:
+            self.fail(f"Operation failed: {[error.message for error in result.errors]}")
+        return result.data, trace
+
+    def assertMaxQueries(self, operation, n, variables=None, context=None):
+        """Run ``operation`` and fail if it issues more than ``n`` statements; return its data."""
+        data, trace = self.execute_operation(operation, variables, context)
+        if len(trace) > n:
+            self.fail(f"{len(trace)} queries executed, {n} allowed:\n{trace.report()}")
+        return data
+
+    def assertNoNPlusOne(self, operation, variables=None, context=None, threshold=None):
+        """Run ``operation`` and fail if any statement repeats per row; return its data."""
+        data, trace = self.execute_operation(operation, variables, context)
+        if trace.repeated(threshold):
+            self.fail(f"Repeated statements detected:\n{trace.report()}")
+        return data
@@ -0,0 +1,257 @@
+"""
+Order reminders behind ``manage.py crm_send_order_reminders``.
+
+Orders placed in the last ``WINDOW_DAYS`` are read in keyset pages on
+``(order_date, id)`` and folded into one reminder per customer. A
+customer whose ``OrderReminder`` row already covers their latest order is
+skipped, so a rerun only sends what earlier runs did not, and a run that
+dies partway picks up after its last recorded batch.
+
+Reminders go out through a pluggable ``SENDER`` on a bounded thread pool.
+All workers share one rate limit, and a failed send is retried with
+exponential backoff before it is left for the next run. Sends are
+recorded one batch at a time, so a crash repeats at most one batch.
+"""
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Customer, Order, OrderReminder
+from .pagination import seek_filter
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Dotted path of the sender class
+    "SENDER": "crm.reminders.FileSender",
+    # FileSender's output, one JSON line per reminder
+    "OUTBOX": "/tmp/order_reminders_outbox.jsonl",
+    # Orders younger than this get a reminder
+    "WINDOW_DAYS": 7,
+    # Orders read per keyset page
+    "PAGE_SIZE": 2000,
+    # Concurrent sends
+    "WORKERS": 8,
+    # Sends per second across all workers; None for no limit
+    "RATE_LIMIT": 50,
+    # Tries per reminder, backing off RETRY_BACKOFF * 2**n seconds between them
+    "MAX_ATTEMPTS": 3,
+    "RETRY_BACKOFF": 0.5,
+}
+
+KEYSET = ("order_date", "id")
+
+# Customers looked up, sent and recorded together; under SQLite's 999 parameters
+BATCH_SIZE = 500
+
+Reminder = namedtuple(
+    "Reminder", "customer_id name email order_count total last_order_id last_order_date"
+)
+
+
+def get_setting(name):
+    return getattr(settings, "CRM_REMINDERS", {}).get(name, DEFAULTS[name])
+
+
+# -------------------------------
+# Senders
+# -------------------------------
+def render(reminder):
+    """Subject and body of the reminder email."""
+    subject = "Your recent orders"
+    body = (
+        f"Hi {reminder.name},\n\n"
+        f"You placed {reminder.order_count} order(s) totalling {reminder.total} recently. "
+        f"Your latest, #{reminder.last_order_id}, was placed on "
+        f"{reminder.last_order_date:%Y-%m-%d}.\n"
+    )
+    return subject, body
+
+
+class FileSender:
+    """Appends each reminder to ``OUTBOX`` as a JSON line; a stand-in for a mail provider."""
+
+    def __init__(self):
+        self.path = get_setting("OUTBOX")
+        self.lock = threading.Lock()
+
+    def send(self, reminder):
+        subject, body = render(reminder)
+        line = json.dumps(
+            {"to": reminder.email, "subject": subject, "body": body, "sent_at": timezone.now()},
+            default=str,
+        )
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def close(self):
+        pass
+
+
+class EmailSender:
+    """Sends through Django's ``EMAIL_BACKEND`` (SMTP in production), one open connection per worker."""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def send(self, reminder):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = get_connection()
+            # An open connection is reused by every message sent through it
+            connection.open()
+            with self.lock:
+                self.connections.append(connection)
+        subject, body = render(reminder)
+        try:
+            EmailMessage(subject, body, to=[reminder.email], connection=connection).send()
+        except Exception:
+            # The connection may be dead; the retry opens a fresh one
+            self.local.connection = None
+            connection.close()
+            raise
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+def get_sender(path=None):
+    return import_string(path or get_setting("SENDER"))()
+
+
+# -------------------------------
+# Pending Reminders
+# -------------------------------
+def window_start(days=None):
+    return timezone.now() - timedelta(days=days if days is not None else get_setting("WINDOW_DAYS"))
+
+
+def recent_orders_by_customer(since, page_size):
+    """``{customer_id: [order_count, total, last_order_id, last_order_date]}`` for orders since ``since``."""
+    orders = Order.objects.filter(order_date__gte=since).order_by(*KEYSET)
+    customers, position = {}, None
+    while True:
+        page = orders if position is None else orders.filter(seek_filter(KEYSET, position))
+        rows = list(page.values_list("order_date", "id", "customer_id", "total_amount")[:page_size])
+        for order_date, pk, customer_id, amount in rows:
+            entry = customers.get(customer_id)
+            if entry is None:
+                customers[customer_id] = [1, amount, pk, order_date]
+                continue
+            entry[0] += 1
+            entry[1] += amount
+            # Keyset order is by date; a later id can still carry an earlier date
+            if pk > entry[2]:
+                entry[2], entry[3] = pk, order_date
+        if len(rows) < page_size:
+            return customers
+        position = rows[-1][:2]
+
+
+def pending_reminders(since, page_size=None):
+    """Batches of reminders for customers with an order since ``since`` no sent reminder covers."""
+    recent = recent_orders_by_customer(since, page_size or get_setting("PAGE_SIZE"))
+    ids = iter(sorted(recent))
+    while batch := list(islice(ids, BATCH_SIZE)):
+        covered = dict(
+            OrderReminder.objects.filter(customer_id__in=batch).values_list("customer_id", "last_order_id")
+        )
+        due = [pk for pk in batch if recent[pk][2] > covered.get(pk, 0)]
+        contacts = Customer.objects.filter(pk__in=due).values_list("pk", "name", "email")
+        reminders = [Reminder(pk, name, email, *recent[pk]) for pk, name, email in contacts]
+        if reminders:
+            yield reminders
+
+
+def record_sent(reminders):
+    now = timezone.now()
+    OrderReminder.objects.bulk_create(
+        [
+            OrderReminder(customer_id=reminder.customer_id, last_order_id=reminder.last_order_id, sent_at=now)
+            for reminder in reminders
+        ],
+        update_conflicts=True,
+        unique_fields=["customer"],
+        update_fields=["last_order_id", "sent_at"],
+    )
+
+
+# -------------------------------
+# Delivery
+# -------------------------------
+class RateLimiter:
+    """Spaces calls ``1 / rate`` seconds apart across all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def deliver(sender, reminder, limiter, max_attempts, backoff):
+    """Send ``reminder``, retrying failures; returns whether it went out."""
+    for attempt in range(max_attempts):
+        limiter.wait()
+        try:
+            sender.send(reminder)
+            return True
+        except Exception as exc:
+            if attempt + 1 == max_attempts:
+                logger.warning("Reminder to customer %s failed %d times: %s", reminder.customer_id, max_attempts, exc)
+                return False
+            time.sleep(backoff * 2 ** attempt)
+
+
+def send_order_reminders(sender=None, days=None, workers=None, rate_limit=None, max_attempts=None, progress=None):
+    """
+    Send every due reminder and return ``{"sent": n, "failed": n}``.
+
+    Arguments left as ``None`` come from ``CRM_REMINDERS``. ``progress`` is
+    called with the running counts after each recorded batch.
+    """
+    sender = sender or get_sender()
+    since = window_start(days)
+    limiter = RateLimiter(rate_limit if rate_limit is not None else get_setting("RATE_LIMIT"))
+    max_attempts = max_attempts or get_setting("MAX_ATTEMPTS")
+    backoff = get_setting("RETRY_BACKOFF")
+    counts = {"sent": 0, "failed": 0}
+
+    def send(reminder):
+        return deliver(sender, reminder, limiter, max_attempts, backoff)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers or get_setting("WORKERS")) as pool:
+            for reminders in pending_reminders(since):
+                delivered = [reminder for reminder, ok in zip(reminders, pool.map(send, reminders)) if ok]
+                # Recorded from this thread only: workers never write to the database
+                record_sent(delivered)
+                counts["sent"] += len(delivered)
+                counts["failed"] += len(reminders) - len(delivered)
+                if progress is not None:
+                    progress(dict(counts))
+    finally:
+        sender.close()
+    return counts
@@ -0,0 +1,201 @@
+"""
+Opt-in response cache for read operations on /graphql.
+
+Triggers from migration 0006 bump a per-table counter in ``TableVersion``
+inside every INSERT, UPDATE or DELETE statement. That covers the ORM,
+bulk_create, raw SQL and other processes, and the counter commits
+atomically with the data. A cached response is keyed on:
+
+- the normalized document, operation name and variables;
+- the versions of the tables that produced it.
+
+Before executing, a request reads every version in one query. On a miss
+it records which tables its SELECTs touched and stores the result under
+the versions it read first. The stored data is therefore never older than
+its key: once any of those tables changes, the key changes and the entry
+is never served again. A result that read a table with no version row
+(or any table, on a backend without the triggers) is not cached, and
+neither is one from a resolver that called ``mark_uncacheable()`` because
+its answer moves with the clock (``topProducts`` covers a window ending
+now). Entries age out via ``TIMEOUT`` and the cache backend's own eviction
+(LocMemCache is an LRU bounded by ``MAX_ENTRIES``). ``aexecute`` is the
+same lookup for operations executing on the event loop.
+"""
+import hashlib
+import json
+import re
+import threading
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from graphql import ExecutionResult, print_ast
+
+from .persisted_queries import DocumentCache, query_hash
+from .routing import aexecute_wrapper, read_alias
+
+CACHE_PREFIX = "crm:response:"
+VERSION_TABLE = "crm_tableversion"
+
+DEFAULTS = {
+    # Responses are only cached when this is True
+    "ENABLED": False,
+    # Alias in settings.CACHES; its MAX_ENTRIES bounds the cache
+    "CACHE": "default",
+    # Seconds an entry may live even if nothing changes
+    "TIMEOUT": 300,
+}
+
+# Tables whose contents are derived from another table's writes
+DERIVED_TABLES = {
+    "crm_customer_fts": "crm_customer",
+    "crm_product_fts": "crm_product",
+}
+
+READ = re.compile(r'\b(?:FROM|JOIN)\s+[`"\[]?(\w+)', re.IGNORECASE)
+
+
+def get_setting(name):
+    return getattr(settings, "CRM_RESPONSE_CACHE", {}).get(name, DEFAULTS[name])
+
+
+# Set while a cacheable operation runs; resolvers flag clock-dependent results in it
+_uncacheable = ContextVar("crm_response_uncacheable", default=None)
+
+
+def mark_uncacheable():
+    """Keep the running operation's response out of the cache."""
+    flags = _uncacheable.get()
+    if flags is not None:
+        flags.append(True)
+
+
+# -------------------------------
+# Table Versions
+# -------------------------------
+def read_versions(using=None):
+    """Versions as seen by ``using``, by default the connection this operation reads."""
+    connection = connections[using or read_alias()]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {connection.ops.quote_name('table')}, {connection.ops.quote_name('version')} "
+            f"FROM {connection.ops.quote_name(VERSION_TABLE)}"
+        )
+        return dict(cursor.fetchall())
+
+
+class TableRecorder:
+    """Execute wrapper collecting every table a request's SELECTs read."""
+
+    def __init__(self):
+        self.tables = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        for table in READ.findall(sql):
+            self.tables.add(DERIVED_TABLES.get(table, table))
+        return execute(sql, params, many, context)
+
+
+# -------------------------------
+# Response Cache
+# -------------------------------
+class ResponseCache:
+    def __init__(self, normalized_cache_size=256):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # query text hash -> hash of the printed (normalized) document
+        self._normalized = DocumentCache(normalized_cache_size)
+
+    @property
+    def enabled(self):
+        return get_setting("ENABLED")
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def request_key(self, query, document, operation_name, variables):
+        """Same key for queries that differ only in whitespace, commas or comments."""
+        text_hash = query_hash(query)
+        normalized = self._normalized.get(text_hash)
+        if normalized is None:
+            normalized = query_hash(print_ast(document))
+            self._normalized.set(text_hash, normalized)
+        payload = json.dumps([normalized, operation_name, variables or {}], sort_keys=True, default=str)
+        return CACHE_PREFIX + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def entry_key(request_key, tables, versions):
+        stamp = ",".join(f"{table}={versions.get(table, 0)}" for table in sorted(tables))
+        return f"{request_key}:{hashlib.sha256(stamp.encode('utf-8')).hexdigest()}"
+
+    def execute(self, request_key, run):
+        """Return ``(result, hit)``, calling ``run()`` only when nothing valid is cached."""
+        cache = caches[get_setting("CACHE")]
+        versions = read_versions()
+        tables = cache.get(request_key)
+        if tables is not None:
+            data = cache.get(self.entry_key(request_key, tables, versions))
+            if data is not None:
+                self._count(hit=True)
+                return ExecutionResult(data=data), True
+
+        self._count(hit=False)
+        recorder = TableRecorder()
+        flags = []
+        token = _uncacheable.set(flags)
+        try:
+            with connections[read_alias()].execute_wrapper(recorder):
+                result = run()
+        finally:
+            _uncacheable.reset(token)
+        tables = frozenset(recorder.tables) - {VERSION_TABLE}
+        if self.cacheable(result, flags, tables, versions):
+            timeout = get_setting("TIMEOUT")
+            cache.set(request_key, tables, timeout=timeout)
+            cache.set(self.entry_key(request_key, tables, versions), result.data, timeout=timeout)
+        return result, False
+
+    async def aexecute(self, request_key, run):
+        """``execute`` for async callers: ``run()`` returns an awaitable result."""
+        cache = caches[get_setting("CACHE")]
+        # A raw cursor read; there is no async API for it
+        versions = await sync_to_async(read_versions)()
+        tables = await cache.aget(request_key)
+        if tables is not None:
+            data = await cache.aget(self.entry_key(request_key, tables, versions))
+            if data is not None:
+                self._count(hit=True)
+                return ExecutionResult(data=data), True
+
+        self._count(hit=False)
+        recorder = TableRecorder()
+        flags = []
+        token = _uncacheable.set(flags)
+        try:
+            async with aexecute_wrapper(recorder):
+                result = await run()
+        finally:
+            _uncacheable.reset(token)
+        tables = frozenset(recorder.tables) - {VERSION_TABLE}
+        if self.cacheable(result, flags, tables, versions):
+            timeout = get_setting("TIMEOUT")
+            await cache.aset(request_key, tables, timeout=timeout)
+            await cache.aset(self.entry_key(request_key, tables, versions), result.data, timeout=timeout)
+        return result, False
+
+    @staticmethod
+    def cacheable(result, flags, tables, versions):
+        # Only cache what every touched table's version can invalidate
+        return not result.errors and not flags and tables <= versions.keys()
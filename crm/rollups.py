@@ -0,0 +1,245 @@
+"""
+Incremental revenue rollups by (bucket, customer) and (bucket, product).
+
+``refresh_rollups`` folds orders past a keyset watermark on
+``(order_date, id)`` into hourly and daily buckets, one chunk per
+transaction, so each run only reads orders it has not seen. The analytics
+fields (``revenueByPeriod``, ``topProducts``) read these tables and never
+touch ``Order`` or its through table.
+
+Orders younger than ``ROLLUP_SETTLE_SECONDS`` wait for the next run: a
+transaction that commits late carries an ``order_date`` from before its
+commit, and the watermark must not have moved past it by then. Product
+revenue uses the product's price when the order is folded in, since order
+lines do not record one. Deleted orders stay counted until
+``manage.py crm_refresh_rollups --rebuild``; orders created with a date
+behind the watermark are folded in by ``fold_late_orders``.
+"""
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .inventory import CENTS
+from .models import (
+    CustomerRevenueRollup,
+    Order,
+    ProductRevenueRollup,
+    RollupGranularity,
+    RollupWatermark,
+)
+from .pagination import seek_filter
+
+WATERMARK = "revenue"
+KEYSET = ("order_date", "id")
+
+# Backends with INSERT ... ON CONFLICT DO UPDATE (SQLite 3.24+, PostgreSQL)
+UPSERT_VENDORS = {"sqlite", "postgresql"}
+
+# Orders folded per transaction
+ROLLUP_CHUNK_SIZE = 5000
+ROLLUP_SETTLE_SECONDS = 60
+
+TRUNCATE = {
+    RollupGranularity.HOUR: TruncHour,
+    RollupGranularity.DAY: TruncDay,
+}
+
+
+def refresh_rollups(chunk_size=ROLLUP_CHUNK_SIZE, settle_seconds=ROLLUP_SETTLE_SECONDS):
+    """Fold every settled order past the watermark into the rollups; returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    folded = 0
+    while True:
+        with transaction.atomic():
+            # The row lock keeps two overlapping runs from folding the same chunk
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+            pending = Order.objects.filter(order_date__lte=cutoff)
+            if watermark.order_date is not None:
+                pending = pending.filter(
+                    seek_filter(KEYSET, (watermark.order_date, watermark.order_id))
+                )
+            keys = list(pending.order_by(*KEYSET).values_list(*KEYSET)[:chunk_size])
+            if not keys:
+                return folded
+
+            window = pending.exclude(seek_filter(KEYSET, keys[-1]))
+            for granularity in TRUNCATE:
+                fold_customers(window, granularity)
+                fold_products(window, granularity)
+            watermark.order_date, watermark.order_id = keys[-1]
+            watermark.save()
+
+        folded += len(keys)
+        if len(keys) < chunk_size:
+            return folded
+
+
+def fold_late_orders(orders, chunk_size=500):
+    """
+    Fold the ``orders`` just created that the watermark has already passed.
+
+    ``refresh_rollups`` only reads forward, so an order created with a
+    historical ``order_date`` (an import or replay) would never be counted.
+    Call inside the transaction that created the orders.
+    """
+    watermark = RollupWatermark.objects.select_for_update().filter(name=WATERMARK).first()
+    if watermark is None or watermark.order_date is None:
+        return 0
+    position = (watermark.order_date, watermark.order_id)
+    late = [order.pk for order in orders if (order.order_date, order.pk) <= position]
+    for start in range(0, len(late), chunk_size):
+        window = Order.objects.filter(pk__in=late[start:start + chunk_size])
+        for granularity in TRUNCATE:
+            fold_customers(window, granularity)
+            fold_products(window, granularity)
+    return len(late)
+
+
+def rebuild_rollups(settle_seconds=ROLLUP_SETTLE_SECONDS):
+    """Drop the rollups and fold every order again."""
+    with transaction.atomic():
+        CustomerRevenueRollup.objects.all().delete()
+        ProductRevenueRollup.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK).delete()
+    return refresh_rollups(settle_seconds=settle_seconds)
+
+
+def bucket_of(granularity, field):
+    return TRUNCATE[granularity](field, tzinfo=dt_timezone.utc)
+
+
+def fold_customers(orders, granularity):
+    rows = (
+        orders
+        .annotate(bucket=bucket_of(granularity, "order_date"))
+        .values("bucket", "customer_id")
+        .annotate(order_count=Count("pk"), revenue=Sum("total_amount"))
+        .order_by()
+    )
+    merge(CustomerRevenueRollup, granularity, "customer_id", rows, ("order_count", "revenue"))
+
+
+def fold_products(orders, granularity):
+    rows = (
+        Order.products.through.objects
+        .filter(order__in=orders)
+        .annotate(bucket=bucket_of(granularity, "order__order_date"))
+        .values("bucket", "product_id")
+        .annotate(units=Count("pk"), revenue=Sum("product__price"))
+        .order_by()
+    )
+    merge(ProductRevenueRollup, granularity, "product_id", rows, ("units", "revenue"))
+
+
+def merge(model, granularity, key, rows, measures):
+    """Add aggregated ``rows`` onto existing rollup rows, creating the missing ones."""
+    if connection.vendor in UPSERT_VENDORS:
+        return _upsert(model, granularity, key, rows, measures)
+
+    rows = list(rows)
+    if not rows:
+        return
+    existing = {
+        (rollup.bucket, getattr(rollup, key)): rollup
+        for rollup in model.objects.filter(
+            granularity=granularity,
+            bucket__in={row["bucket"] for row in rows},
+            **{f"{key}__in": {row[key] for row in rows}},
+        )
+    }
+    to_create, to_update = [], []
+    for row in rows:
+        rollup = existing.get((row["bucket"], row[key]))
+        if rollup is None:
+            to_create.append(model(
+                granularity=granularity,
+                bucket=row["bucket"],
+                **{key: row[key]},
+                **{measure: row[measure] for measure in measures},
+            ))
+            continue
+        for measure in measures:
+            setattr(rollup, measure, getattr(rollup, measure) + row[measure])
+        to_update.append(rollup)
+
+    model.objects.bulk_create(to_create, batch_size=500)
+    model.objects.bulk_update(to_update, measures, batch_size=500)
+
+
+def _upsert(model, granularity, key, rows, measures):
+    # INSERT ... SELECT ... ON CONFLICT DO UPDATE: the aggregate never leaves the database
+    qn = connection.ops.quote_name
+    opts = model._meta
+    table = qn(opts.db_table)
+    column = {name: qn(opts.get_field(name).column) for name in ("granularity", "bucket", key, *measures)}
+    select_sql, params = rows.query.sql_with_params()
+    selected = ", ".join(f"agg.{qn(name)}" for name in ("bucket", key, *measures))
+    updates = ", ".join(f"{column[m]} = {table}.{column[m]} + excluded.{column[m]}" for m in measures)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(column.values())}) "
+        f"SELECT %s, {selected} FROM ({select_sql}) agg WHERE true "
+        f"ON CONFLICT ({column['granularity']}, {column['bucket']}, {column[key]}) "
+        f"DO UPDATE SET {updates}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [granularity, *params])
+
+
+# -------------------------------
+# Reads
+# -------------------------------
+def revenue_by_period(granularity, start=None, end=None):
+    """``[{bucket, order_count, revenue}]`` for buckets starting in ``[start, end)``."""
+    return _quantized(list(_revenue_buckets(granularity, start, end)))
+
+
+async def arevenue_by_period(granularity, start=None, end=None):
+    return _quantized([row async for row in _revenue_buckets(granularity, start, end)])
+
+
+def top_products(since, limit, granularity=RollupGranularity.DAY):
+    """``[{product_id, units, revenue}]`` ranked by revenue over buckets from ``since``."""
+    return _quantized(list(_product_ranking(since, limit, granularity)))
+
+
+async def atop_products(since, limit, granularity=RollupGranularity.DAY):
+    return _quantized([row async for row in _product_ranking(since, limit, granularity)])
+
+
+def _revenue_buckets(granularity, start, end):
+    rollups = CustomerRevenueRollup.objects.filter(granularity=granularity)
+    if start is not None:
+        rollups = rollups.filter(bucket__gte=start)
+    if end is not None:
+        rollups = rollups.filter(bucket__lt=end)
+    return (
+        rollups.values("bucket")
+        .annotate(order_count=Sum("order_count"), revenue=Sum("revenue"))
+        .order_by("bucket")
+    )
+
+
+def _product_ranking(since, limit, granularity):
+    since = timezone.localtime(since, dt_timezone.utc)
+    if granularity == RollupGranularity.DAY:
+        since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        since = since.replace(minute=0, second=0, microsecond=0)
+    return (
+        ProductRevenueRollup.objects
+        .filter(granularity=granularity, bucket__gte=since)
+        .values("product_id")
+        .annotate(units=Sum("units"), revenue=Sum("revenue"))
+        .order_by("-revenue", "product_id")[:limit]
+    )
+
+
+def _quantized(rows):
+    # SQLite sums decimals as floats; hand back cents like the model fields
+    for row in rows:
+        row["revenue"] = Decimal(str(row["revenue"])).quantize(CENTS)
+    return rows
@@ -0,0 +1,210 @@
+"""
+Read replicas for GraphQL query operations.
+
+``ReplicaRouter`` sends ORM reads to a replica only inside
+``operation_route()``, which the /graphql views enter for every
+operation: queries get a replica from ``REPLICAS``, mutations get the
+primary. Everything else (admin, cron jobs, management commands) keeps
+reading and writing the primary. Writes always go to the primary, even
+for instances loaded from a replica.
+
+Replicas lag. A mutation pins the rest of its request to the primary, so
+a batch that writes and then reads sees its own write. Across requests,
+the response to a request that wrote carries a signed cookie with the
+primary's table versions (crm/response_cache.py). For ``STICKY_SECONDS``
+afterwards, that client reads a replica only once the replica's versions
+have caught up; until then it reads the primary. On backends without
+version rows it reads the primary for the whole window.
+
+Code that reads through a raw cursor asks ``read_alias()`` for the
+connection the ORM would use. Async code enters ``aoperation_route()`` and
+installs execute wrappers with ``aexecute_wrapper()``.
+"""
+import json
+import random
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+DEFAULTS = {
+    # Aliases in DATABASES that query operations read from; empty reads the primary
+    "REPLICAS": [],
+    # How long after a write its client waits for replicas to catch up
+    "STICKY_SECONDS": 10,
+    # Cookie carrying the table versions of the client's last write
+    "COOKIE": "crm_written",
+}
+
+COOKIE_SALT = "crm.routing"
+
+_route = ContextVar("crm_route", default=None)
+
+
+def get_setting(name):
+    return getattr(settings, "CRM_DATABASE_ROUTING", {}).get(name, DEFAULTS[name])
+
+
+class RequestState:
+    """Routing state shared by every operation of one request."""
+
+    def __init__(self, written):
+        # {table: version} from the client's last write, or None
+        self.written = written
+        self.wrote = False
+        self.replica = None
+        self.checked = False
+
+
+class Route:
+    def __init__(self, state, replica):
+        self.state = state
+        self.replica = replica
+
+
+# -------------------------------
+# Router
+# -------------------------------
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        route = _route.get()
+        if route is None or route.replica is None or route.state.wrote:
+            return None
+        return route.replica
+
+    def db_for_write(self, model, **hints):
+        route = _route.get()
+        if route is not None:
+            # Everything after a write in this request reads the primary
+            route.state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary
+        return db not in get_setting("REPLICAS")
+
+
+def read_alias():
+    """The alias the ORM reads from right now."""
+    route = _route.get()
+    if route is None or route.replica is None or route.state.wrote:
+        return DEFAULT_DB_ALIAS
+    return route.replica
+
+
+@asynccontextmanager
+async def aexecute_wrapper(wrapper):
+    """
+    ``connections[read_alias()].execute_wrapper(wrapper)`` for async code.
+
+    Connections are per thread, so the wrapper is installed from the
+    thread the async ORM runs this request's queries on.
+    """
+    def install():
+        manager = connections[read_alias()].execute_wrapper(wrapper)
+        manager.__enter__()
+        return manager
+
+    manager = await sync_to_async(install)()
+    try:
+        yield
+    finally:
+        await sync_to_async(manager.__exit__)(None, None, None)
+
+
+# -------------------------------
+# Request Scope
+# -------------------------------
+def get_state(request):
+    state = getattr(request, "crm_routing", None)
+    if state is None:
+        written = None
+        # Websocket operations carry no cookies, and so no sticky writes
+        if get_setting("REPLICAS") and hasattr(request, "get_signed_cookie"):
+            value = request.get_signed_cookie(
+                get_setting("COOKIE"), default=None, salt=COOKIE_SALT, max_age=get_setting("STICKY_SECONDS")
+            )
+            if value is not None:
+                try:
+                    written = json.loads(value)
+                except ValueError:
+                    pass
+        state = request.crm_routing = RequestState(written)
+    return state
+
+
+def choose_replica(state):
+    """A replica that has every write this client made, or None for the primary."""
+    if not state.checked:
+        state.checked = True
+        replicas = get_setting("REPLICAS")
+        if replicas:
+            alias = random.choice(replicas)
+            if state.written is None or caught_up(alias, state.written):
+                state.replica = alias
+    return state.replica
+
+
+def caught_up(alias, written):
+    # Imported late: response_cache imports this module
+    from .response_cache import read_versions
+
+    if not written:
+        return False
+    try:
+        versions = read_versions(alias)
+    except DatabaseError:
+        return False
+    return all(versions.get(table, -1) >= version for table, version in written.items())
+
+
+@contextmanager
+def operation_route(request, operation_type):
+    """Route one operation: queries to a replica, anything else to the primary."""
+    state = get_state(request)
+    if operation_type == "mutation":
+        # Raw-cursor writes never reach the router; a mutation counts as a write
+        state.wrote = True
+    replica = None
+    if operation_type == "query" and not state.wrote:
+        replica = choose_replica(state)
+    token = _route.set(Route(state, replica))
+    try:
+        yield
+    finally:
+        _route.reset(token)
+
+
+@asynccontextmanager
+async def aoperation_route(request, operation_type):
+    """``operation_route`` for async code."""
+    state = get_state(request)
+    if operation_type == "query" and not state.wrote and not state.checked and get_setting("REPLICAS"):
+        # caught_up() reads the replica's versions through a raw cursor
+        await sync_to_async(choose_replica)(state)
+    with operation_route(request, operation_type):
+        yield
+
+
+def remember_writes(request, response):
+    """After a request that wrote, tell its client which versions to wait for."""
+    state = getattr(request, "crm_routing", None)
+    if state is None or not state.wrote or not get_setting("REPLICAS"):
+        return
+    from .response_cache import read_versions
+
+    response.set_signed_cookie(
+        get_setting("COOKIE"),
+        json.dumps(read_versions(DEFAULT_DB_ALIAS), separators=(",", ":")),
+        salt=COOKIE_SALT,
+        max_age=get_setting("STICKY_SECONDS"),
+        httponly=True,
+        samesite="Lax",
+    )
+
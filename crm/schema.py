@@ -1,32 +1,25 @@
 import graphene
-from graphene_django import DjangoObjectType
 from crm.models import Product  # ✅ required import
-
-
-# --- Define ProductType (GraphQL representation of Product model) ---
-class ProductType(DjangoObjectType):
-    class Meta:
-        model = Product
-        fields = ("id", "name", "stock", "price")  # adjust fields as in your model
+from crm.schemaa import ProductType  # shared so both schemas can be merged
+from crm.inventory import restock_low_stock
+from crm.planner import plan_queryset
 
 
 # --- Define the Mutation for updating low-stock products ---
 class UpdateLowStockProducts(graphene.Mutation):
     class Arguments:
-        pass  # no arguments required
+        threshold = graphene.Int(default_value=10)  # restock products below this
+        amount = graphene.Int(default_value=10)     # units added to each
 
     updated_products = graphene.List(ProductType)
     message = graphene.String()
 
-    def mutate(self, info):
-        # Find products with stock < 10
-        low_stock_products = Product.objects.filter(stock__lt=10)
+    def mutate(self, info, threshold=10, amount=10):
+        if amount <= 0:
+            return UpdateLowStockProducts(updated_products=[], message="Restock amount must be positive.")
 
-        updated = []
-        for product in low_stock_products:
-            product.stock += 10  # ✅ restock by 10
-            product.save()
-            updated.append(product)
+        # ✅ One UPDATE per id range instead of a save() per product
+        updated = restock_low_stock(threshold, amount)
 
         message = (
             f"{len(updated)} product(s) restocked successfully."
@@ -38,10 +31,11 @@ class UpdateLowStockProducts(graphene.Mutation):
 
 # --- Root Query (if not already defined elsewhere) ---
 class Query(graphene.ObjectType):
+    hello = graphene.String(default_value="Hello, GraphQL!")  # heartbeat probe (crm.cron)
     products = graphene.List(ProductType)
 
     def resolve_products(self, info):
-        return Product.objects.all()
+        return plan_queryset(Product.objects.all(), info)
 
 
 # --- Root Mutation ---
@@ -1,12 +1,22 @@
-import re
 import decimal
+from datetime import timedelta
 from django.db import transaction
 from django.utils import timezone
 import graphene
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
 from .models import Customer, Product, Order
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .bulk import PHONE_PATTERN, bulk_create_customers, bulk_create_orders
+from .counters import CUSTOMERS, ORDERS, REVENUE, get_counters
+from .deletion import delete_customers
+from .inventory import ReservationFailed, order_errors, reserve_stock
+from .loaders import BatchedFilterConnectionField, get_loaders, has_filters, is_async, load_related, then
+from .pagination import KeysetConnection, KeysetConnectionField
+from .planner import plan_queryset
+from .response_cache import mark_uncacheable
+from .pubsub import ORDER_CREATED, PRODUCT_STOCK_CHANGED, hub
+from .rollups import arevenue_by_period, atop_products, fold_late_orders, revenue_by_period, top_products
+from .search import aranked, ranked
 
 # -------------------------------
 # GraphQL Types
@@ -14,10 +24,17 @@ from .filters import CustomerFilter, ProductFilter, OrderFilter
 
 # === Non-relay types (for mutations) ===
 class CustomerType(DjangoObjectType):
+    orders = BatchedFilterConnectionField(lambda: OrderNode, required=True)
+
     class Meta:
         model = Customer
         fields = "__all__"
 
+    def resolve_orders(self, info, **kwargs):
+        if has_filters(kwargs):
+            return self.orders.all()
+        return load_related(self, "orders", get_loaders(info).orders_by_customer_id)
+
 
 class ProductType(DjangoObjectType):
     class Meta:
@@ -26,31 +43,129 @@ class ProductType(DjangoObjectType):
 
 
 class OrderType(DjangoObjectType):
+    customer = graphene.Field(lambda: CustomerNode, required=True)
+    products = BatchedFilterConnectionField(lambda: ProductNode, required=True)
+
     class Meta:
         model = Order
         fields = "__all__"
 
+    def resolve_customer(self, info):
+        return load_related(self, "customer", get_loaders(info).customer_by_id, self.customer_id)
+
+    def resolve_products(self, info, **kwargs):
+        if has_filters(kwargs):
+            return self.products.all()
+        return load_related(self, "products", get_loaders(info).products_by_order_id)
+
 # === Relay Nodes (for filtering and pagination) ===
-class CustomerNode(DjangoObjectType):
+class AsyncNode(DjangoObjectType):
+    """Relay node whose lookup by id also works under async execution."""
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def get_node(cls, info, id):
+        if not is_async(info):
+            return super().get_node(info, id)
+        return cls.get_queryset(cls._meta.model.objects, info).filter(pk=id).afirst()
+
+
+class CustomerNode(AsyncNode):
+    orders = BatchedFilterConnectionField(lambda: OrderNode, required=True)
+
     class Meta:
         model = Customer
         filterset_class = CustomerFilter
         interfaces = (graphene.relay.Node,)
 
+    def resolve_orders(self, info, **kwargs):
+        if has_filters(kwargs):
+            return self.orders.all()
+        return load_related(self, "orders", get_loaders(info).orders_by_customer_id)
+
+
+class ProductNode(AsyncNode):
+    orders = BatchedFilterConnectionField(lambda: OrderNode, required=True)
 
-class ProductNode(DjangoObjectType):
     class Meta:
         model = Product
         filterset_class = ProductFilter
         interfaces = (graphene.relay.Node,)
 
+    def resolve_orders(self, info, **kwargs):
+        if has_filters(kwargs):
+            return self.orders.all()
+        return load_related(self, "orders", get_loaders(info).orders_by_product_id)
+
+
+class OrderNode(AsyncNode):
+    customer = graphene.Field(lambda: CustomerNode, required=True)
+    products = BatchedFilterConnectionField(lambda: ProductNode, required=True)
 
-class OrderNode(DjangoObjectType):
     class Meta:
         model = Order
         filterset_class = OrderFilter
         interfaces = (graphene.relay.Node,)
 
+    def resolve_customer(self, info):
+        return load_related(self, "customer", get_loaders(info).customer_by_id, self.customer_id)
+
+    def resolve_products(self, info, **kwargs):
+        if has_filters(kwargs):
+            return self.products.all()
+        return load_related(self, "products", get_loaders(info).products_by_order_id)
+
+
+# === Keyset Connections (opt-in seek pagination) ===
+class OrderKeysetConnection(KeysetConnection):
+    class Meta:
+        node = OrderNode
+
+
+class CustomerKeysetConnection(KeysetConnection):
+    class Meta:
+        node = CustomerNode
+
+
+# === Analytics types (read from the rollup tables) ===
+class RollupGranularityEnum(graphene.Enum):
+    class Meta:
+        name = "RollupGranularity"
+
+    HOUR = "hour"
+    DAY = "day"
+
+
+class RollupPeriodEnum(graphene.Enum):
+    """Trailing window ending now."""
+    class Meta:
+        name = "RollupPeriod"
+
+    DAY = 1
+    WEEK = 7
+    MONTH = 30
+    YEAR = 365
+
+
+class RevenueBucketType(graphene.ObjectType):
+    bucket = graphene.DateTime()
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+
+
+class ProductRevenueType(graphene.ObjectType):
+    product = graphene.Field(ProductType)
+    units = graphene.Int()
+    revenue = graphene.Decimal()
+
+
+# === Search results ===
+class SearchResultsType(graphene.ObjectType):
+    customers = graphene.List(CustomerType)
+    products = graphene.List(ProductType)
+
 
 # -------------------------------
 # Error Object
@@ -105,19 +220,19 @@ class CreateCustomer(graphene.Mutation):
 
         # Validate phone format (if provided)
         if input.phone:
-            phone_pattern = re.compile(r"^(\+\d{1,15}|(\d{3}-\d{3}-\d{4}))$")
-            if not phone_pattern.match(input.phone):
+            if not PHONE_PATTERN.match(input.phone):
                 errors.append(ErrorType(field="phone", message="Invalid phone format. Use +1234567890 or 123-456-7890."))
 
         if errors:
             return CreateCustomer(customer=None, success=False, message="Validation failed.", errors=errors)
 
-        customer = Customer.objects.create(
-            name=input.name.strip(),
-            email=input.email.strip(),
-            phone=(input.phone.strip() if input.phone else None)
-        )
-        customer.save()
+        # The counter bump in post_save commits with the row
+        with transaction.atomic():
+            customer = Customer.objects.create(
+                name=input.name.strip(),
+                email=input.email.strip(),
+                phone=(input.phone.strip() if input.phone else None)
+            )
 
         return CreateCustomer(customer=customer, success=True, message="Customer created successfully.", errors=[])
 
@@ -133,56 +248,24 @@ class BulkCreateCustomers(graphene.Mutation):
 
     @staticmethod
     def mutate(root, info, input):
-        created = []
-        errors = []
-
         if not input:
             return BulkCreateCustomers(
-                created_customers=[],
+                customers=[],
                 errors=[ErrorType(message="No input provided.")],
                 message="Empty input list."
             )
 
-        with transaction.atomic():
-            for idx, data in enumerate(input):
-                local_errors = []
-                if Customer.objects.filter(email=data.email).exists():
-                    local_errors.append(f"Duplicate email: {data.email}")
-
-                if data.phone:
-                    pattern = re.compile(r"^(\+\d{1,15}|(\d{3}-\d{3}-\d{4}))$")
-                    if not pattern.match(data.phone):
-                        local_errors.append(f"Invalid phone format for {data.email}")
-
-                if local_errors:
-                    errors.append(ErrorType(
-                        field=f"customer[{idx}]",
-                        message=", ".join(local_errors)
-                    ))
-                    continue
-
-                try:
-                    cust = Customer.objects.create(
-                        name=data.name.strip(),
-                        email=data.email.strip(),
-                        phone=(data.phone.strip() if data.phone else None)
-                    )
-                    created.append(cust)
-
-                    for customer in cust:
-                        customer.save()
-
-                except Exception as e:
-                    errors.append(ErrorType(
-                        field=f"customer[{idx}]",
-                        message=str(e)
-                    ))
-
+        created, errors = bulk_create_customers(input)
 
         msg = "Some customers created successfully." if errors else "All customers created successfully."
-
-
-        return BulkCreateCustomers(customers=created, errors=errors, message=msg)
+        return BulkCreateCustomers(
+            customers=created,
+            errors=[
+                ErrorType(field=f"customer[{idx}]", message=", ".join(messages))
+                for idx, messages in sorted(errors.items())
+            ],
+            message=msg,
+        )
 
 
 # -------------------------------
@@ -236,46 +319,95 @@ class CreateOrder(graphene.Mutation):
 
     @staticmethod
     def mutate(root, info, input: OrderInput):
-        errors = []
-
-        # Validate customer
-        try:
-            customer = Customer.objects.get(pk=input.customer_id)
-        except Customer.DoesNotExist:
-            errors.append(ErrorType(field="customer_id", message="Invalid customer ID."))
-
         # Validate products
         if not input.product_ids:
-            errors.append(ErrorType(field="product_ids", message="At least one product ID is required."))
+            errors = [ErrorType(field="product_ids", message="At least one product ID is required.")]
             return CreateOrder(order=None, success=False, errors=errors)
 
-        products = Product.objects.filter(pk__in=input.product_ids)
-        if products.count() != len(input.product_ids):
-            invalid_ids = set(input.product_ids) - set(str(p.id) for p in products)
-            errors.append(ErrorType(field="product_ids", message=f"Invalid product IDs: {', '.join(invalid_ids)}"))
+        try:
+            customer_id = int(input.customer_id)
+        except (TypeError, ValueError):
+            errors = [ErrorType(field="customer_id", message="Invalid customer ID.")]
+            return CreateOrder(order=None, success=False, errors=errors)
+        try:
+            product_ids = sorted({int(pk) for pk in input.product_ids})
+        except (TypeError, ValueError):
+            invalid_ids = ", ".join(str(pk) for pk in input.product_ids)
+            errors = [ErrorType(field="product_ids", message=f"Invalid product IDs: {invalid_ids}")]
+            return CreateOrder(order=None, success=False, errors=errors)
 
-        if errors:
+        # Reserve stock, price the order and create it in one short transaction
+        try:
+            with transaction.atomic():
+                prices = reserve_stock(customer_id, product_ids)
+                if len(prices) != len(product_ids):
+                    raise ReservationFailed()
+
+                order = Order.objects.create(
+                    customer_id=customer_id,
+                    order_date=input.order_date or timezone.now(),
+                    total_amount=sum(prices.values())
+                )
+                Order.products.through.objects.bulk_create([
+                    Order.products.through(order_id=order.pk, product_id=pk)
+                    for pk in product_ids
+                ])
+                if input.order_date:
+                    fold_late_orders([order])
+        except ReservationFailed:
+            errors = [
+                ErrorType(field=field, message=message)
+                for field, message in order_errors(customer_id, product_ids)
+            ]
             return CreateOrder(order=None, success=False, errors=errors)
 
-        # Calculate total
-        total = sum([p.price for p in products])
-        order_date = input.order_date or timezone.now()
+        return CreateOrder(order=order, success=True, errors=[])
 
-        # Create order
-        order = Order.objects.create(
-            customer=customer,
-            order_date=order_date,
-            total_amount=total
-        )
-        order.products.set(products)
-        # Create order
+# -------------------------------
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(OrderInput, required=True)
+        # False for replays of historical orders
+        take_stock = graphene.Boolean(name="reserveStock", default_value=True)
 
-        # ✅ Save explicitly
-        order.save()
+    orders = graphene.List(OrderType)
+    errors = graphene.List(ErrorType)
+    message = graphene.String()
+
+    @staticmethod
+    def mutate(root, info, input, take_stock=True):
+        if not input:
+            return BulkCreateOrders(
+                orders=[],
+                errors=[ErrorType(message="No input provided.")],
+                message="Empty input list."
+            )
+
+        try:
+            orders, errors = bulk_create_orders(input, reserve_stock=take_stock)
+        except ReservationFailed:
+            return BulkCreateOrders(
+                orders=[],
+                errors=[ErrorType(message="Stock changed while the batch was processed; retry it.")],
+                message="No orders created."
+            )
+
+        if not orders:
+            msg = "No orders created."
+        elif errors:
+            msg = "Some orders created successfully."
+        else:
+            msg = "All orders created successfully."
+        return BulkCreateOrders(
+            orders=orders,
+            errors=[
+                ErrorType(field=f"order[{idx}]", message=", ".join(messages))
+                for idx, messages in sorted(errors.items())
+            ],
+            message=msg,
+        )
 
 
-        return CreateOrder(order=order, success=True, errors=[])
-    
     # -------------------------------
 # Delete Customer
 # -------------------------------
@@ -289,16 +421,14 @@ class DeleteCustomer(graphene.Mutation):
 
     @staticmethod
     def mutate(root, info, id):
-        try:
-            customer = Customer.objects.get(pk=id)
-            customer.delete()
-            return DeleteCustomer(success=True, message="Customer deleted successfully.", errors=[])
-        except Customer.DoesNotExist:
+        # Chunked raw cascade: a customer with many orders never holds one long write lock
+        if not delete_customers(Customer.objects.filter(pk=id))["customers"]:
             return DeleteCustomer(
                 success=False,
                 message="Customer not found.",
                 errors=[ErrorType(field="id", message="Invalid customer ID.")]
             )
+        return DeleteCustomer(success=True, message="Customer deleted successfully.", errors=[])
 
 
 # -------------------------------
@@ -359,6 +489,7 @@ class Mutation(graphene.ObjectType):
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
 
     # 🧹 Deletion mutations
     delete_customer = DeleteCustomer.Field()
@@ -369,24 +500,146 @@ class Query(graphene.ObjectType):
 
     # Relay Filterable Queries
     customer = graphene.relay.Node.Field(CustomerNode)
-    all_customers = DjangoFilterConnectionField(CustomerNode)
+    all_customers = BatchedFilterConnectionField(CustomerNode)
 
     product = graphene.relay.Node.Field(ProductNode)
-    all_products = DjangoFilterConnectionField(ProductNode)
+    all_products = BatchedFilterConnectionField(ProductNode)
 
     order = graphene.relay.Node.Field(OrderNode)
-    all_orders = DjangoFilterConnectionField(OrderNode)
+    all_orders = BatchedFilterConnectionField(OrderNode)
+
+    # Keyset-paginated variants: constant cost per page at any depth
+    all_orders_keyset = KeysetConnectionField(OrderKeysetConnection, keyset=("order_date", "id"))
+    all_customers_keyset = KeysetConnectionField(CustomerKeysetConnection, keyset=("created_at", "id"))
+
+    # Dashboard totals, read from maintained counters instead of COUNT/SUM scans
+    total_customers = graphene.Int()
+    total_orders = graphene.Int()
+    total_revenue = graphene.Decimal()
+
+    # Time-bucketed analytics, read only from the rollup tables
+    revenue_by_period = graphene.List(
+        RevenueBucketType,
+        granularity=RollupGranularityEnum(default_value="day"),
+        from_=graphene.DateTime(name="from"),
+        to=graphene.DateTime(),
+    )
+    top_products = graphene.List(
+        ProductRevenueType,
+        period=RollupPeriodEnum(default_value=7),
+        limit=graphene.Int(default_value=10),
+    )
+
+    # Ranked full-text prefix search (FTS5 on SQLite)
+    search = graphene.Field(
+        SearchResultsType,
+        term=graphene.String(required=True),
+        limit=graphene.Int(default_value=20),
+    )
 
     # Basic Queries (if you want non-relay access)
     customers = graphene.List(CustomerType)
     products = graphene.List(ProductType)
     orders = graphene.List(OrderType)
 
+    def resolve_total_customers(self, info):
+        return then(get_counters(info), lambda counters: int(counters[CUSTOMERS]))
+
+    def resolve_total_orders(self, info):
+        return then(get_counters(info), lambda counters: int(counters[ORDERS]))
+
+    def resolve_total_revenue(self, info):
+        return then(get_counters(info), lambda counters: counters[REVENUE])
+
+    def resolve_revenue_by_period(self, info, granularity="day", from_=None, to=None):
+        granularity = getattr(granularity, "value", granularity)
+        read = arevenue_by_period if is_async(info) else revenue_by_period
+        return then(read(granularity, from_, to), lambda rows: [RevenueBucketType(**row) for row in rows])
+
+    def resolve_top_products(self, info, period=7, limit=10):
+        days = getattr(period, "value", period)
+        granularity = "hour" if days == 1 else "day"
+        # The window ends now; table versions alone cannot tell when it moved
+        mark_uncacheable()
+        since = timezone.now() - timedelta(days=days)
+        limit = max(1, min(limit, 100))
+        if is_async(info):
+            return atop_product_revenue(since, limit, granularity)
+        rows = top_products(since, limit, granularity)
+        return product_revenue(rows, Product.objects.in_bulk([row["product_id"] for row in rows]))
+
+    def resolve_search(self, info, term, limit=20):
+        limit = max(1, min(limit, 100))
+        if is_async(info):
+            return asearch(term, limit)
+        return SearchResultsType(
+            customers=ranked(Customer, term, limit),
+            products=ranked(Product, term, limit),
+        )
+
     def resolve_customers(self, info):
-        return Customer.objects.all()
+        return plan_queryset(Customer.objects.all(), info)
 
     def resolve_products(self, info):
-        return Product.objects.all()
+        return plan_queryset(Product.objects.all(), info)
 
     def resolve_orders(self, info):
-        return Order.objects.prefetch_related('products').all()
+        return plan_queryset(Order.objects.all(), info)
+
+    # Connection resolvers: django-filter narrows the planned queryset
+    def resolve_all_customers(self, info, **kwargs):
+        return plan_queryset(Customer.objects.all(), info)
+
+    def resolve_all_products(self, info, **kwargs):
+        return plan_queryset(Product.objects.all(), info)
+
+    def resolve_all_orders(self, info, **kwargs):
+        return plan_queryset(Order.objects.all(), info)
+
+    def resolve_all_orders_keyset(self, info, **kwargs):
+        return plan_queryset(Order.objects.all(), info)
+
+    def resolve_all_customers_keyset(self, info, **kwargs):
+        return plan_queryset(Customer.objects.all(), info)
+
+
+def product_revenue(rows, products):
+    return [
+        ProductRevenueType(product=products.get(row["product_id"]), units=row["units"], revenue=row["revenue"])
+        for row in rows
+    ]
+
+
+async def atop_product_revenue(since, limit, granularity):
+    rows = await atop_products(since, limit, granularity)
+    return product_revenue(rows, await Product.objects.ain_bulk([row["product_id"] for row in rows]))
+
+
+async def asearch(term, limit):
+    return SearchResultsType(
+        customers=await aranked(Customer, term, limit),
+        products=await aranked(Product, term, limit),
+    )
+
+
+# -------------------------------
+# Root Subscription
+# -------------------------------
+class Subscription(graphene.ObjectType):
+    order_created = graphene.Field(OrderNode, required=True)
+    product_stock_changed = graphene.Field(
+        ProductNode,
+        required=True,
+        threshold=graphene.Int(),  # only products whose stock is now below this
+    )
+
+    async def subscribe_order_created(root, info):
+        async with hub.subscribe(ORDER_CREATED) as orders:
+            async for order in orders:
+                yield order
+
+    async def subscribe_product_stock_changed(root, info, threshold=None):
+        async with hub.subscribe(PRODUCT_STOCK_CHANGED) as products:
+            async for product in products:
+                if threshold is None or product.stock < threshold:
+                    yield product
@@ -0,0 +1,123 @@
+"""
+Full-text search over customer and product names (and customer emails).
+
+On SQLite the text lives in FTS5 external-content tables
+(``crm_customer_fts``, ``crm_product_fts``) that triggers from migration
+0005 keep in sync with every INSERT, UPDATE and DELETE, bulk paths and
+raw SQL included. A search term is split into words and each word becomes
+a prefix query (``"jo"* "smi"*``), so results arrive while the user is
+still typing and are ranked by bm25. Other backends fall back to the
+``icontains`` lookups the filters have always used.
+"""
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Customer, Product, Order
+from .routing import read_alias
+
+# model -> (FTS table, indexed columns, bm25 weight per column)
+FTS_TABLES = {
+    Customer: ("crm_customer_fts", ("name", "email"), (2.0, 1.0)),
+    Product: ("crm_product_fts", ("name",), (1.0,)),
+}
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_enabled():
+    return connection.vendor == "sqlite"
+
+
+def match_expression(term):
+    """``'Jo Smi'`` -> ``'"jo"* "smi"*'``; None when the term has no words."""
+    words = WORD.findall((term or "").lower())
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def matching_ids(model, term):
+    """A subquery of the primary keys of ``model`` rows matching ``term``."""
+    table, _, _ = FTS_TABLES[model]
+    return RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [match_expression(term)])
+
+
+def icontains_q(fields, term):
+    """Fallback: every word must appear in at least one of ``fields``."""
+    q = Q()
+    for word in WORD.findall(term or ""):
+        word_q = Q()
+        for field in fields:
+            word_q |= Q(**{f"{field}__icontains": word})
+        q &= word_q
+    return q
+
+
+# -------------------------------
+# Filters
+# -------------------------------
+def search_customers(queryset, term):
+    if not match_expression(term):
+        return queryset
+    if fts_enabled():
+        return queryset.filter(pk__in=matching_ids(Customer, term))
+    return queryset.filter(icontains_q(("name", "email"), term))
+
+
+def search_products(queryset, term):
+    if not match_expression(term):
+        return queryset
+    if fts_enabled():
+        return queryset.filter(pk__in=matching_ids(Product, term))
+    return queryset.filter(icontains_q(("name",), term))
+
+
+def search_orders(queryset, term):
+    """Orders whose customer or any product matches ``term``."""
+    if not match_expression(term):
+        return queryset
+    through = Order.products.through.objects
+    if fts_enabled():
+        customer_ids = matching_ids(Customer, term)
+        product_ids = matching_ids(Product, term)
+    else:
+        customer_ids = Customer.objects.filter(icontains_q(("name", "email"), term)).values("pk")
+        product_ids = Product.objects.filter(icontains_q(("name",), term)).values("pk")
+    return queryset.filter(
+        Q(customer_id__in=customer_ids)
+        | Q(pk__in=through.filter(product_id__in=product_ids).values("order_id"))
+    )
+
+
+# -------------------------------
+# Ranked Search
+# -------------------------------
+def ranked(model, term, limit):
+    """Up to ``limit`` instances matching ``term``, best match first."""
+    expression = match_expression(term)
+    if not expression:
+        return []
+    if not fts_enabled():
+        _, columns, _ = FTS_TABLES[model]
+        return list(model.objects.filter(icontains_q(columns, term)).order_by("pk")[:limit])
+
+    table, _, weights = FTS_TABLES[model]
+    # Same connection as the in_bulk below, so a lagging replica cannot drop rows
+    with connections[read_alias()].cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {table} WHERE {table} MATCH %s "
+            f"ORDER BY bm25({table}, {', '.join(map(str, weights))}), rowid LIMIT %s",
+            [expression, limit],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    found = model.objects.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+async def aranked(model, term, limit):
+    """``ranked`` for async resolvers; FTS5 is read through a raw cursor, which has no async API."""
+    return await sync_to_async(ranked)(model, term, limit)
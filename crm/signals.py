@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .counters import bump
+from .models import Customer, Product, Order
+from .pubsub import orders_created, stock_changed
+
+
+# -------------------------------
+# Counters
+# -------------------------------
+@receiver(post_save, sender=Customer, dispatch_uid="crm_counters_customer_created")
+def customer_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump(customers=1)
+
+
+@receiver(post_delete, sender=Customer, dispatch_uid="crm_counters_customer_deleted")
+def customer_deleted(sender, instance, **kwargs):
+    bump(customers=-1)
+
+
+@receiver(post_save, sender=Order, dispatch_uid="crm_counters_order_created")
+def order_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump(orders=1, revenue=instance.total_amount)
+
+
+@receiver(post_delete, sender=Order, dispatch_uid="crm_counters_order_deleted")
+def order_deleted(sender, instance, **kwargs):
+    bump(orders=-1, revenue=-instance.total_amount)
+
+
+# -------------------------------
+# Subscriptions
+# -------------------------------
+@receiver(post_save, sender=Order, dispatch_uid="crm_pubsub_order_created")
+def publish_order_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        orders_created([instance.pk])
+
+
+@receiver(post_save, sender=Product, dispatch_uid="crm_pubsub_product_saved")
+def publish_product_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and (update_fields is None or "stock" in update_fields):
+        stock_changed([instance.pk])
@@ -1,40 +1,37 @@
-from datetime import datetime
-import requests
+import datetime
 from celery import shared_task
+from gql import gql
 
-GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
-LOG_FILE = "/tmp/crm_report_log.txt"
+from .local_client import local_client
+from .rollups import refresh_rollups
 
+LOG_FILE = "/tmp/crm_report_log.txt"
 
-@shared_task
-def generate_crm_report():
-    """Generates a CRM report using GraphQL data and logs it with a timestamp."""
-    query = """
+REPORT_QUERY = gql("""
     {
         totalCustomers
         totalOrders
         totalRevenue
     }
-    """
+""")
+
 
+@shared_task
+def generate_crm_report():
+    """Generates a CRM report using GraphQL data and logs it with a timestamp."""
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     try:
-        response = requests.post(GRAPHQL_ENDPOINT, json={"query": query}, timeout=10)
-
-        if response.status_code == 200:
-            data = response.json().get("data", {})
-            customers = data.get("totalCustomers", 0)
-            orders = data.get("totalOrders", 0)
-            revenue = data.get("totalRevenue", 0.0)
-
-            log_message = (
-                f"{timestamp} - Report: {customers} customers, "
-                f"{orders} orders, {revenue} revenue\n"
-            )
+        # Runs in-process against the schema; no web worker needed
+        data = local_client().execute(REPORT_QUERY)
+        customers = data.get("totalCustomers", 0)
+        orders = data.get("totalOrders", 0)
+        revenue = data.get("totalRevenue", 0.0)
 
-        else:
-            log_message = f"{timestamp} - ERROR: GraphQL returned {response.status_code}\n"
+        log_message = (
+            f"{timestamp} - Report: {customers} customers, "
+            f"{orders} orders, {revenue} revenue\n"
+        )
 
     except Exception as e:
         log_message = f"{timestamp} - ERROR: {e}\n"
@@ -44,3 +41,10 @@ def generate_crm_report():
         f.write(log_message)
 
     return "CRM Report logged successfully."
+
+
+@shared_task
+def refresh_revenue_rollups():
+    """Folds orders placed since the last run into the revenue rollup tables."""
+    folded = refresh_rollups()
+    return f"Folded {folded} orders into the revenue rollups."
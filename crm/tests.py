@@ -1,3 +1,1193 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import json
+import logging
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphql import parse
+from graphql_relay import offset_to_cursor, to_global_id
+from graphql_crm.schema import schema
+
+from .bulk import bulk_create_customers, bulk_create_products, existing_emails
+from .cost import QueryCostAnalyzer
+from .counters import computed_counters, read_counters, reconcile_counters
+from .deletion import delete_customers, inactive_customers
+from .export import aiter_ndjson, iter_ndjson
+from .inventory import reserve_stock, restock_low_stock
+from .models import Customer, CustomerRevenueRollup, ImportCheckpoint, Product, Order, OrderReminder
+from .persisted_queries import lookup_query, query_hash, register_query
+from .pubsub import PRODUCT_STOCK_CHANGED, Hub, SubscriberOverflow, hub, orders_created
+from .query_trace import QueryBudgetMixin, statement_shape, trace_operation
+from .reminders import send_order_reminders
+from .response_cache import read_versions
+from .rollups import rebuild_rollups, revenue_by_period
+from .routing import COOKIE_SALT, ReplicaRouter, choose_replica, get_state, operation_route
+from .websocket import GraphQLWebSocketApp
+
+
+def seed(customers=12, products=8, orders_per_customer=2):
+    """Customers with a couple of two-product orders each."""
+    customers = Customer.objects.bulk_create([
+        Customer(name=f"Customer {i}", email=f"customer{i}@example.com", phone="+15550000")
+        for i in range(customers)
+    ])
+    products = Product.objects.bulk_create([
+        Product(name=f"Product {i}", price=i + 1, stock=i * 5) for i in range(products)
+    ])
+    through = []
+    for i, customer in enumerate(customers):
+        for j in range(orders_per_customer):
+            order = Order.objects.create(customer=customer, total_amount=10)
+            through += [
+                Order.products.through(order_id=order.pk, product_id=products[(i + j + k) % len(products)].pk)
+                for k in range(2)
+            ]
+    Order.products.through.objects.bulk_create(through)
+    return customers, products
+
+
+# -------------------------------
+# Keyset Pagination
+# -------------------------------
+class KeysetPaginationTests(QueryBudgetMixin, TestCase):
+    PAGE = """query ($first: Int, $after: String, $last: Int, $before: String) {
+        allOrdersKeyset(first: $first, after: $after, last: $last, before: $before) {
+            edges { cursor node { id } }
+            pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+        }
+    }"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(customers=5, orders_per_customer=3)
+        # Three orders share each date, so pages split inside runs of ties
+        start = timezone.now() - timedelta(days=10)
+        for i, pk in enumerate(Order.objects.order_by("-pk").values_list("pk", flat=True)):
+            Order.objects.filter(pk=pk).update(order_date=start + timedelta(days=i // 3))
+        cls.expected = [
+            to_global_id("OrderNode", pk)
+            for pk in Order.objects.order_by("order_date", "id").values_list("pk", flat=True)
+        ]
+
+    def page(self, **variables):
+        data, _ = self.execute_operation(self.PAGE, variables)
+        connection = data["allOrdersKeyset"]
+        return [edge["node"]["id"] for edge in connection["edges"]], connection["pageInfo"]
+
+    def test_forward_pages_follow_the_keyset_across_ties(self):
+        seen, after = [], None
+        while True:
+            ids, info = self.page(first=4, after=after)
+            seen += ids
+            if not info["hasNextPage"]:
+                break
+            self.assertEqual(info["hasPreviousPage"], after is not None)
+            after = info["endCursor"]
+        self.assertEqual(seen, self.expected)
+
+    def test_backward_pages_follow_the_keyset_across_ties(self):
+        seen, before = [], None
+        while True:
+            ids, info = self.page(last=4, before=before)
+            seen = ids + seen
+            if not info["hasPreviousPage"]:
+                break
+            before = info["startCursor"]
+        self.assertEqual(seen, self.expected)
+
+    def test_cursors_round_trip_between_directions(self):
+        _, info = self.page(first=6)
+        cursor = info["endCursor"]
+        self.assertEqual(self.page(first=3, after=cursor)[0], self.expected[6:9])
+        self.assertEqual(self.page(last=3, before=cursor)[0], self.expected[2:5])
+
+    def test_first_zero_returns_no_rows(self):
+        ids, info = self.page(first=0)
+        self.assertEqual(ids, [])
+        self.assertTrue(info["hasNextPage"])
+
+    def test_invalid_cursor_is_rejected(self):
+        result, _ = trace_operation(self.PAGE, {"first": 2, "after": "bm90LWEtY3Vyc29y"})
+        self.assertIn("Invalid cursor", result.errors[0].message)
+
+
+# -------------------------------
+# Query Tracing
+# -------------------------------
+class StatementShapeTests(TestCase):
+    def test_in_lists_of_any_length_share_a_shape(self):
+        self.assertEqual(
+            statement_shape('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s)'),
+            statement_shape('SELECT * FROM "t" WHERE "id" IN (%s)'),
+        )
+
+    def test_limit_literals_are_erased(self):
+        self.assertEqual(
+            statement_shape('SELECT * FROM "t" WHERE "id" = %s LIMIT 21'),
+            'SELECT * FROM "t" WHERE "id" = %s LIMIT ?',
+        )
+
+
+class NPlusOneDetectionTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+
+    def test_filtered_relation_per_row_is_flagged(self):
+        # Filtered relations bypass the loaders and run once per order
+        operation = '{ allOrders(first: 10) { edges { node { products(name: "Product") { edges { node { name } } } } } } }'
+        result, trace = trace_operation(operation)
+        self.assertIsNone(result.errors)
+        repeated = trace.repeated()
+        self.assertTrue(repeated)
+        for shape, count, paths in repeated:
+            self.assertEqual(paths, {"allOrders.edges.*.node.products": 10})
+        with self.assertRaises(AssertionError):
+            self.assertNoNPlusOne(operation)
+
+    def test_batched_relations_are_not_flagged(self):
+        self.assertNoNPlusOne(
+            '{ allOrders(first: 20) { edges { node { customer { name } products { edges { node { name } } } } } } }'
+        )
+
+    @override_settings(CRM_QUERY_TRACE={"ENABLED": True, "N_PLUS_ONE_THRESHOLD": 3})
+    def test_dev_mode_logs_the_field_path(self):
+        operation = 'query Filtered { allOrders(first: 5) { edges { node { products(name: "Product") { edges { node { name } } } } } } }'
+        with self.assertLogs("crm.query_trace", "WARNING") as logs:
+            response = self.client.post("/graphql", {"query": operation}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("query Filtered", logs.output[0])
+        self.assertIn("5 similar statements from allOrders.edges.*.node.products", logs.output[0])
+
+
+# -------------------------------
+# Response Cache
+# -------------------------------
+@override_settings(CRM_RESPONSE_CACHE={"ENABLED": True, "CACHE": "crm-responses", "TIMEOUT": 300})
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(customers=3)
+
+    def setUp(self):
+        caches["crm-responses"].clear()
+
+    def cache_hits(self, query, path="/graphql"):
+        post = self.client.post if path == "/graphql" else async_to_sync(self.async_client.post)
+        hits = []
+        for _ in range(2):
+            response = post(path, {"query": query}, content_type="application/json")
+            hits.append(response.json()["extensions"]["responseCache"]["hit"])
+        return hits
+
+    def test_repeated_queries_are_served_from_the_cache(self):
+        self.assertEqual(self.cache_hits("{ totalCustomers allProducts(first: 2) { edges { node { name } } } }"), [False, True])
+
+    def test_windows_ending_now_are_never_cached(self):
+        self.assertEqual(self.cache_hits("{ totalCustomers topProducts(period: DAY) { units } }"), [False, False])
+
+    def test_async_view(self):
+        query = "{ totalOrders allOrders(first: 2) { edges { node { id } } } }"
+        self.assertEqual(self.cache_hits(query, "/graphql/async"), [False, True])
+        self.assertEqual(self.cache_hits("{ topProducts(period: DAY) { units } }", "/graphql/async"), [False, False])
+
+
+# -------------------------------
+# Persisted Queries
+# -------------------------------
+class PersistedQueryTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+
+    def post(self, digest, query=None):
+        body = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": digest}}}
+        if query is not None:
+            body["query"] = query
+        return self.client.post("/graphql", body, content_type="application/json").json()
+
+    def error_code(self, response):
+        [error] = response["errors"]
+        return error["extensions"]["code"]
+
+    def test_registered_on_first_use(self):
+        query = "{ totalOrders }"
+        self.assertEqual(self.post(query_hash(query), query)["data"], {"totalOrders": 0})
+        self.assertEqual(self.post(query_hash(query))["data"], {"totalOrders": 0})
+
+    def test_unknown_hash(self):
+        response = self.post(query_hash("{ totalOrders }"))
+        self.assertEqual(response["errors"][0]["message"], "PersistedQueryNotFound")
+        self.assertEqual(self.error_code(response), "PERSISTED_QUERY_NOT_FOUND")
+
+    def test_hash_mismatch_registers_nothing(self):
+        self.assertEqual(self.error_code(self.post(query_hash("{ totalOrders }"), "{ totalCustomers }")), "BAD_REQUEST")
+        self.assertIsNone(lookup_query(query_hash("{ totalOrders }")))
+        self.assertIsNone(lookup_query(query_hash("{ totalCustomers }")))
+
+    def test_invalid_queries_are_not_registered(self):
+        query = "{ noSuchField }"
+        response = self.post(query_hash(query), query)
+        self.assertIn("Cannot query field 'noSuchField'", response["errors"][0]["message"])
+        self.assertIsNone(lookup_query(query_hash(query)))
+
+    @override_settings(CRM_PERSISTED_QUERIES={"ALLOW_REGISTRATION": False})
+    def test_registration_can_be_turned_off(self):
+        query = "{ totalOrders }"
+        self.assertEqual(self.error_code(self.post(query_hash(query), query)), "PERSISTED_QUERY_NOT_SUPPORTED")
+        self.assertIsNone(lookup_query(query_hash(query)))
+        # Registered queries still resolve
+        register_query(query)
+        self.assertEqual(self.post(query_hash(query))["data"], {"totalOrders": 0})
+
+
+# -------------------------------
+# Metrics
+# -------------------------------
+@override_settings(CRM_METRICS={"ENABLED": True, "SAMPLE_RATE": 1.0})
+class MetricsTests(TestCase):
+    QUERY = "query MetricsProbe { allOrders(first: 2) { edges { node { id customer { name } } } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(customers=2)
+
+    def scrape(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        text = response.content.decode()
+        samples = dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+        return text, {key: float(value) for key, value in samples.items()}
+
+    def test_operations_and_resolvers_are_exposed(self):
+        _, before = self.scrape()
+        self.client.post("/graphql", {"query": self.QUERY}, content_type="application/json")
+        self.client.post(
+            "/graphql", {"query": "query MetricsProbe { nope }", "operationName": "MetricsProbe"},
+            content_type="application/json",
+        )
+        text, after = self.scrape()
+
+        def added(key):
+            return after.get(key, 0) - before.get(key, 0)
+
+        operation = 'operation_type="query",operation_name="MetricsProbe"'
+        self.assertIn("# TYPE crm_graphql_operation_duration_seconds histogram", text)
+        self.assertEqual(added(f"crm_graphql_operation_duration_seconds_count{{{operation}}}"), 1)
+        self.assertEqual(added(f'crm_graphql_operation_duration_seconds_bucket{{{operation},le="+Inf"}}'), 1)
+        # The count and the page with its customers joined
+        self.assertEqual(added(f"crm_graphql_operation_sql_queries_sum{{{operation}}}"), 2)
+        self.assertEqual(added('crm_sql_query_duration_seconds_count{statement="SELECT"}'), 2)
+        # Composite fields are timed once per resolved value; scalars are not timed
+        self.assertEqual(added('crm_graphql_field_duration_seconds_count{field="Query.allOrders"}'), 1)
+        self.assertEqual(added('crm_graphql_field_duration_seconds_count{field="OrderNode.customer"}'), 2)
+        self.assertNotIn('field="OrderNode.id"', text)
+        self.assertEqual(added('crm_graphql_errors_total{operation_name="MetricsProbe",phase="request"}'), 1)
+        self.assertEqual(added('crm_graphql_errors_total{operation_name="MetricsProbe",phase="execution"}'), 0)
+
+    @override_settings(CRM_METRICS={"ENABLED": False})
+    def test_disabled(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+
+# -------------------------------
+# Traffic Capture
+# -------------------------------
+class CaptureTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f"{directory.name}/graphql.jsonl"
+        settings = override_settings(CRM_CAPTURE={"ENABLED": True, "SAMPLE_RATE": 1.0, "PATH": self.path})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(self.close_capture_logger)
+        # The middleware stack is built per client, after the override
+        self.client = Client()
+
+    @staticmethod
+    def close_capture_logger():
+        # Each test writes to its own file; drop the handler bound to this one
+        logger = logging.getLogger("crm.capture.traffic")
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+
+    def captured(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_operations_are_written_replayable(self):
+        query = "query Totals($n: Int) { totalCustomers allProducts(first: $n) { edges { node { name } } } }"
+        self.client.post(
+            "/graphql", {"query": query, "variables": {"n": 2}, "operationName": "Totals"},
+            content_type="application/json",
+        )
+        self.client.get("/metrics")
+        [entry] = self.captured()
+        self.assertEqual(entry["hash"], query_hash(query))
+        self.assertEqual((entry["operationName"], entry["variables"], entry["status"]), ("Totals", {"n": 2}, 200))
+
+    def test_hash_only_requests_record_the_query(self):
+        query = "{ totalOrders }"
+        digest = register_query(query)
+        self.client.post(
+            "/graphql", {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": digest}}},
+            content_type="application/json",
+        )
+        [entry] = self.captured()
+        self.assertEqual(entry["query"], query)
+
+
+# -------------------------------
+# Query Budgets
+# -------------------------------
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers, cls.products = seed()
+        cls.order = Order.objects.order_by("pk").first()
+
+    def test_all_orders(self):
+        # Page, customers, products: the same for any page size
+        for size in (5, 20):
+            data = self.assertMaxQueries(
+                """query ($first: Int) { allOrders(first: $first) { edges { node {
+                    id totalAmount customer { name } products { edges { node { name price } } }
+                } } } }""",
+                3, variables={"first": size},
+            )
+            self.assertEqual(len(data["allOrders"]["edges"]), size)
+
+    def test_all_customers_with_nested_orders(self):
+        self.assertMaxQueries(
+            """{ allCustomers(first: 10) { edges { node {
+                name orders { edges { node { totalAmount products { edges { node { name } } } } } }
+            } } } }""",
+            4,
+        )
+
+    def test_all_products_with_orders_and_customers(self):
+        self.assertMaxQueries(
+            "{ allProducts(first: 10) { edges { node { name orders { edges { node { id customer { email } } } } } } } }",
+            3,
+        )
+
+    def test_aliased_selections_of_one_relation(self):
+        # Each alias projects its own columns; neither may read the other's instances
+        self.assertMaxQueries(
+            """{
+                a: allOrders(first: 10) { edges { node { customer { name } products { edges { node { name } } } } } }
+                b: allOrders(first: 10) { edges { node { customer { email } products { edges { node { price } } } } } }
+                c: allCustomers(first: 10) { edges { node { phone } } }
+            }""",
+            8,
+        )
+
+    def test_keyset_pages(self):
+        data = self.assertMaxQueries(
+            "{ allOrdersKeyset(first: 10) { edges { cursor node { id customer { name } } } pageInfo { hasNextPage } } }",
+            1,
+        )
+        self.assertTrue(data["allOrdersKeyset"]["pageInfo"]["hasNextPage"])
+        self.assertMaxQueries(
+            "{ allCustomersKeyset(first: 10) { edges { node { name orders { edges { node { id } } } } } } }",
+            2,
+        )
+
+    def test_plain_lists(self):
+        self.assertMaxQueries(
+            """{
+                customers { name orders { edges { node { id } } } }
+                products { name stock }
+                orders { totalAmount customer { name } products { edges { node { name } } } }
+            }""",
+            5,
+        )
+
+    def test_order_node(self):
+        self.assertMaxQueries(
+            "query ($id: ID!) { order(id: $id) { totalAmount customer { name } products { edges { node { name } } } } }",
+            3, variables={"id": to_global_id("OrderNode", self.order.pk)},
+        )
+
+    def test_dashboard_totals(self):
+        self.assertMaxQueries("{ totalCustomers totalOrders totalRevenue }", 1)
+
+    def test_rollups(self):
+        self.assertMaxQueries(
+            "{ revenueByPeriod(granularity: DAY) { bucket revenue } topProducts(limit: 5) { product { name } units } }",
+            2,
+        )
+
+    def test_search(self):
+        self.assertMaxQueries('{ search(term: "Customer") { customers { name } products { name } } }', 3)
+
+
+class MutationBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers, cls.products = seed()
+
+    def test_create_customer(self):
+        data = self.assertMaxQueries(
+            'mutation { createCustomer(input: {name: "New", email: "new@example.com", phone: "+15550001"}) { success } }',
+            5,
+        )
+        self.assertTrue(data["createCustomer"]["success"])
+
+    def test_bulk_create_customers(self):
+        # Independent of the batch size
+        for size in (2, 20):
+            entries = ",".join(
+                f'{{name: "Bulk {size}-{i}", email: "bulk{size}-{i}@example.com"}}' for i in range(size)
+            )
+            data = self.assertMaxQueries(
+                f"mutation {{ bulkCreateCustomers(input: [{entries}]) {{ customers {{ id }} errors {{ message }} }} }}",
+                5,
+            )
+            self.assertEqual(len(data["bulkCreateCustomers"]["customers"]), size)
+
+    def test_create_product(self):
+        self.assertMaxQueries(
+            'mutation { createProduct(input: {name: "New", price: 2.5, stock: 5}) { success product { id } } }', 2
+        )
+
+    def test_create_order(self):
+        customer, products = self.customers[0], self.products[3:5]
+        data = self.assertMaxQueries(
+            """mutation ($input: OrderInput!) { createOrder(input: $input) {
+                success order { totalAmount customer { name } products { edges { node { name } } } }
+            } }""",
+            9, variables={"input": {"customerId": customer.pk, "productIds": [p.pk for p in products]}},
+        )
+        self.assertTrue(data["createOrder"]["success"])
+
+    def test_bulk_create_orders(self):
+        for size in (3, 10):
+            entries = [
+                {"customerId": self.customers[i].pk, "productIds": [self.products[5 + i % 3].pk]}
+                for i in range(size)
+            ]
+            data = self.assertMaxQueries(
+                """mutation ($input: [OrderInput]!) { bulkCreateOrders(input: $input) {
+                    orders { id customer { name } } errors { message }
+                } }""",
+                10, variables={"input": entries},
+            )
+            self.assertEqual(len(data["bulkCreateOrders"]["orders"]), size)
+
+    def test_update_low_stock_products(self):
+        self.assertMaxQueries(
+            "mutation { updateLowStockProducts(threshold: 12, amount: 5) { updatedProducts { name stock } } }", 4
+        )
+
+    def test_deletes(self):
+        order = Order.objects.filter(customer=self.customers[2]).first()
+        self.assertMaxQueries(f'mutation {{ deleteOrder(id: "{order.pk}") {{ success }} }}', 5)
+        self.assertMaxQueries(f'mutation {{ deleteProduct(id: "{self.products[0].pk}") {{ success }} }}', 4)
+        # Constant however many orders the customer has
+        customer = self.customers[1]
+        Order.objects.bulk_create([Order(customer=customer, total_amount=5) for _ in range(20)])
+        self.assertMaxQueries(f'mutation {{ deleteCustomer(id: "{customer.pk}") {{ success }} }}', 12)
+        self.assertFalse(Order.objects.filter(customer=customer).exists())
+
+
+# -------------------------------
+# Query Cost
+# -------------------------------
+class QueryCostTests(TestCase):
+    NESTED = """{ allCustomers(first: 100) { edges { node { orders(first: 100) { edges { node {
+        products(first: 100) { edges { node { name } } }
+    } } } } } } }"""
+
+    def post(self, query):
+        return self.client.post("/graphql", {"query": query}, content_type="application/json")
+
+    def cost_of(self, query):
+        document = parse(query)
+        return QueryCostAnalyzer(schema.graphql_schema, document).operation_cost(document.definitions[0])
+
+    def test_lists_multiply_their_selection(self):
+        # 1 + 100 * (1 + 1 + 100 * (1 + 1 + 100 * 2))
+        self.assertEqual(self.cost_of(self.NESTED), 2030301)
+        self.assertEqual(self.cost_of("{ allOrders { edges { node { customer { name } } } } }"), 301)
+
+    def test_over_limit_operations_never_run(self):
+        response = self.post(self.NESTED)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["errors"][0]["extensions"], {"code": "QUERY_TOO_EXPENSIVE", "cost": 2030301})
+
+    def test_negative_and_huge_sizes_are_clamped(self):
+        self.assertEqual(self.cost_of("{ allOrders(first: -100000000) { edges { node { customer { name } } } } }"), 1)
+        self.assertEqual(self.cost_of("{ allOrders(last: 1000000) { edges { node { customer { name } } } } }"), 301)
+        # A negative sibling no longer pays for an expensive tree
+        response = self.post("{ x: allOrders(first: -100000000) { edges { node { id } } } " + self.NESTED[1:])
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("data", response.json())
+
+    def test_depth_limit(self):
+        nested = "id"
+        for _ in range(4):
+            nested = f"customer {{ orders(first: 1) {{ edges {{ node {{ {nested} }} }} }} }}"
+        response = self.post(f"{{ allOrders(first: 1) {{ edges {{ node {{ {nested} }} }} }} }}")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("exceeds maximum operation depth of 15", response.json()["errors"][0]["message"])
+
+
+# -------------------------------
+# Async View
+# -------------------------------
+class AsyncViewTests(TestCase):
+    """/graphql/async answers exactly like /graphql, in as many queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers, cls.products = seed()
+        cls.order = Order.objects.order_by("pk").first()
+        rebuild_rollups(settle_seconds=0)
+
+    def post(self, path, query, variables=None):
+        body = {"query": query, "variables": variables or {}}
+        post = self.client.post if path == "/graphql" else async_to_sync(self.async_client.post)
+        with CaptureQueriesContext(connection) as queries:
+            response = post(path, body, content_type="application/json")
+        return response.json(), len(queries)
+
+    def assertSameAnswer(self, query, variables=None):
+        expected, sync_queries = self.post("/graphql", query, variables)
+        actual, async_queries = self.post("/graphql/async", query, variables)
+        self.assertNotIn("errors", expected)
+        self.assertEqual(actual, expected)
+        self.assertEqual(async_queries, sync_queries)
+        return actual["data"]
+
+    def test_connections_with_loaded_relations(self):
+        data = self.assertSameAnswer(
+            """{ allOrders(first: 5) { edges { node {
+                id totalAmount customer { name } products { edges { node { name price } } }
+            } } } }"""
+        )
+        self.assertEqual(len(data["allOrders"]["edges"]), 5)
+        self.assertSameAnswer(
+            """{ allCustomers(first: 10) { edges { node {
+                name orders(first: 5) { edges { node { totalAmount products(first: 2) { edges { node { name } } } } } }
+            } } } }"""
+        )
+        self.assertSameAnswer(
+            '{ allProducts(name: "Product", first: 3) { edges { node { name orders { edges { node { customer { email } } } } } } } }'
+        )
+
+    def test_aliased_selections_of_one_relation(self):
+        self.assertSameAnswer(
+            """{
+                a: allOrders(first: 5) { edges { node { customer { name } products { edges { node { name } } } } } }
+                b: allOrders(first: 5) { edges { node { customer { email } products { edges { node { price } } } } } }
+            }"""
+        )
+
+    def test_connection_paging(self):
+        page = "edges { cursor node { name } } pageInfo { hasNextPage hasPreviousPage startCursor endCursor }"
+        for args in (
+            "first: 3, offset: 4",
+            "last: 4",
+            f'first: 2, after: "{offset_to_cursor(5)}"',
+            f'last: 2, before: "{offset_to_cursor(5)}"',
+            f'first: 3, after: "{offset_to_cursor(50)}"',
+            'name: "Customer 1", first: 3',
+        ):
+            with self.subTest(args=args):
+                self.assertSameAnswer(f"{{ allCustomers({args}) {{ {page} }} }}")
+
+    def test_filtered_nested_connections(self):
+        self.assertSameAnswer(
+            "query ($id: ID!) { customer(id: $id) { orders(totalAmount_Gte: 5, first: 1) { edges { node { id } } } } }",
+            {"id": to_global_id("CustomerNode", self.customers[0].pk)},
+        )
+
+    def test_keyset_connections(self):
+        self.assertSameAnswer(
+            "{ allOrdersKeyset(first: 5) { totalCount edges { cursor node { id customer { name } } } pageInfo { hasNextPage } } }"
+        )
+        self.assertSameAnswer("{ allCustomersKeyset(last: 3) { edges { node { name orders { edges { node { id } } } } } } }")
+
+    def test_lists_nodes_and_analytics(self):
+        self.assertSameAnswer("{ customers { name orders(first: 2) { edges { node { id } } } } products { name } }")
+        self.assertSameAnswer("{ orders { totalAmount customer { name } products(first: 2) { edges { node { name } } } } }")
+        self.assertSameAnswer(
+            """{
+                totalCustomers totalOrders totalRevenue
+                revenueByPeriod(granularity: DAY) { bucket revenue }
+                topProducts(limit: 5) { product { name } units revenue }
+                search(term: "Customer 1") { customers { name } products { name } }
+            }"""
+        )
+        self.assertSameAnswer(
+            "query ($id: ID!) { order(id: $id) { totalAmount customer { name } products { edges { node { name } } } } }",
+            {"id": to_global_id("OrderNode", self.order.pk)},
+        )
+        data = self.assertSameAnswer(
+            "query ($id: ID!) { customer(id: $id) { name } }", {"id": to_global_id("CustomerNode", 0)}
+        )
+        self.assertIsNone(data["customer"])
+
+    @override_settings(CRM_METRICS={"SAMPLE_RATE": 1.0}, CRM_QUERY_TRACE={"ENABLED": True})
+    def test_tracing_sees_the_async_orm(self):
+        with self.assertLogs("crm.query_trace", "DEBUG") as logs:
+            _, queries = self.post("/graphql/async", "{ allOrders(first: 5) { edges { node { customer { name } } } } }")
+        self.assertIn(f"query anonymous: {queries} statements", logs.output[-1])
+
+    def test_mutations(self):
+        data, _ = self.post(
+            "/graphql/async",
+            'mutation { createCustomer(input: {name: "Async", email: "async@example.com"}) { success customer { email } } }',
+        )
+        self.assertEqual(data["data"]["createCustomer"], {"success": True, "customer": {"email": "async@example.com"}})
+        self.assertTrue(Customer.objects.filter(email="async@example.com").exists())
+
+    @override_settings(CRM_QUERY_COST={"THROTTLE_BUDGET": 1000, "THROTTLE_WINDOW": 60})
+    def test_shared_cache_calls_stay_off_the_event_loop(self):
+        def off_the_loop(method):
+            def call(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    return method(*args, **kwargs)
+                raise AssertionError(f"cache.{method.__name__}() blocked the event loop")
+            return call
+
+        caches["default"].clear()
+        query = "{ allOrders(first: 2) { edges { node { id } } } }"
+        body = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": query_hash(query)}}}
+        post = async_to_sync(self.async_client.post)
+        with contextlib.ExitStack() as stack:
+            for name in ("get", "set", "add", "incr"):
+                stack.enter_context(mock.patch.object(LocMemCache, name, off_the_loop(getattr(LocMemCache, name))))
+            registered = post("/graphql/async", {**body, "query": query}, content_type="application/json").json()
+            looked_up = post("/graphql/async", body, content_type="application/json").json()
+        self.assertNotIn("errors", looked_up)
+        self.assertEqual(registered, looked_up)
+        # Both operations were charged to the throttle: 1 + 2 * (1 + 1) each
+        self.assertEqual(caches["default"].get("crm:query-cost:ip:127.0.0.1"), 10)
+
+
+# -------------------------------
+# Stock Reservation
+# -------------------------------
+class StockReservationTests(QueryBudgetMixin, TestCase):
+    CREATE_ORDER = """mutation ($input: OrderInput!) {
+        createOrder(input: $input) { success errors { field message } }
+    }"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Buyer", email="buyer@example.com")
+        cls.product = Product.objects.create(name="Last units", price=3, stock=2)
+
+    def create_order(self):
+        data, _ = self.execute_operation(
+            self.CREATE_ORDER, {"input": {"customerId": self.customer.pk, "productIds": [self.product.pk]}}
+        )
+        return data["createOrder"]
+
+    def test_stock_is_never_oversold(self):
+        results = [self.create_order() for _ in range(3)]
+        self.assertEqual([result["success"] for result in results], [True, True, False])
+        self.assertEqual(
+            results[2]["errors"],
+            [{"field": "product_ids", "message": f"Insufficient stock for product IDs: {self.product.pk}"}],
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Order.objects.count(), 2)
+        # The conditional UPDATE itself takes nothing from an empty shelf
+        self.assertEqual(reserve_stock(self.customer.pk, [self.product.pk]), {})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+
+    def test_restock_after_a_lost_race_still_explains_the_failure(self):
+        # The UPDATE found no stock, then another writer restocked before the explanation ran
+        with mock.patch("crm.schemaa.reserve_stock", return_value={}):
+            result = self.create_order()
+        self.assertFalse(result["success"])
+        self.assertEqual(
+            result["errors"], [{"field": "product_ids", "message": "Stock changed while the order was placed; retry it."}]
+        )
+        self.assertFalse(Order.objects.exists())
+
+
+class RestockTests(TestCase):
+    def test_sparse_matches_cost_one_batch_per_chunk(self):
+        Product.objects.bulk_create([
+            Product(pk=1, name="Low", price=1, stock=1),
+            Product(pk=5, name="Plenty", price=1, stock=50),
+            Product(pk=10 ** 7, name="Empty", price=1, stock=0),
+            Product(pk=10 ** 7 + 1, name="Short", price=1, stock=9),
+        ])
+        # One batch: savepoint, locked seek, UPDATE ... RETURNING, release
+        with self.assertNumQueries(4):
+            restocked = restock_low_stock(threshold=10, amount=5, chunk_size=1000)
+        self.assertEqual([(product.pk, product.stock) for product in restocked], [(1, 6), (10 ** 7, 5), (10 ** 7 + 1, 14)])
+
+        # Restocked rows are not revisited, even while still below the threshold
+        restocked = restock_low_stock(threshold=10, amount=1, chunk_size=1)
+        self.assertEqual([(product.pk, product.stock) for product in restocked], [(1, 7), (10 ** 7, 6)])
+        self.assertEqual(Product.objects.get(pk=5).stock, 50)
+
+        with mock.patch("crm.inventory.RETURNING_VENDORS", set()):
+            restocked = restock_low_stock(threshold=10, amount=4, chunk_size=1)
+        self.assertEqual([(product.pk, product.stock) for product in restocked], [(1, 11), (10 ** 7, 10)])
+
+
+# -------------------------------
+# Bulk Creation
+# -------------------------------
+class BulkCreateTests(QueryBudgetMixin, TestCase):
+    BULK_CREATE_ORDERS = """mutation ($input: [OrderInput]!, $reserve: Boolean) {
+        bulkCreateOrders(input: $input, reserveStock: $reserve) {
+            orders { id orderDate } errors { field message } message
+        }
+    }"""
+
+    def test_customers_survive_repeated_races(self):
+        Customer.objects.bulk_create([
+            Customer(name="First", email="first@example.com"),
+            Customer(name="Second", email="second@example.com"),
+        ])
+        rows = [
+            {"name": "First", "email": "first@example.com"},
+            {"name": "Fresh", "email": "fresh@example.com"},
+            {"name": "Second", "email": "second@example.com"},
+        ]
+        # The up-front probe and the first re-probe each miss a row another writer just took
+        stale = [set(), {"first@example.com"}]
+
+        def probe(emails):
+            return stale.pop(0) if stale else existing_emails(emails)
+
+        with mock.patch("crm.bulk.existing_emails", side_effect=probe):
+            created, errors = bulk_create_customers(rows)
+        self.assertEqual([c.email for c in created], ["fresh@example.com"])
+        self.assertEqual(errors, {0: ["Duplicate email: first@example.com"], 2: ["Duplicate email: second@example.com"]})
+
+    def test_historical_order_dates_are_kept_and_rolled_up(self):
+        customers, products = seed(customers=2, orders_per_customer=1)
+        rebuild_rollups(settle_seconds=0)
+        data, _ = self.execute_operation(self.BULK_CREATE_ORDERS, {
+            "input": [{"customerId": customers[0].pk, "productIds": [products[0].pk], "orderDate": "2020-01-01T00:00:00+00:00"}],
+            "reserve": False,
+        })
+        [order] = data["bulkCreateOrders"]["orders"]
+        self.assertEqual(order["orderDate"], "2020-01-01T00:00:00+00:00")
+        self.assertEqual(Order.objects.filter(order_date__year=2020).count(), 1)
+        # The watermark is already past 2020, so the order is folded in at once
+        [bucket] = revenue_by_period("day", end=timezone.now() - timedelta(days=365))
+        self.assertEqual((bucket["order_count"], bucket["revenue"]), (1, products[0].price))
+
+    def test_imported_order_dates_are_parsed_per_row(self):
+        customers, products = seed(customers=1, orders_per_customer=0)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f"{directory.name}/orders.csv"
+        with open(path, "w") as f:
+            f.write("customer_id,product_ids,order_date\n")
+            for order_date in ("2021-03-04T05:06:07+00:00", "2021-03-04 05:06", "not a date", "2021-02-30T00:00:00", ""):
+                f.write(f"{customers[0].pk},{products[1].pk},{order_date}\n")
+        stderr = StringIO()
+        call_command("crm_import", "orders", path, "--no-reserve-stock", stdout=StringIO(), stderr=stderr)
+        self.assertEqual(
+            stderr.getvalue().splitlines(),
+            ["row 3: Invalid order date: not a date", "row 4: Invalid order date: 2021-02-30T00:00:00"],
+        )
+        dates = sorted(Order.objects.values_list("order_date", flat=True))
+        self.assertEqual(dates[:2], [
+            datetime(2021, 3, 4, 5, 6, tzinfo=dt_timezone.utc), datetime(2021, 3, 4, 5, 6, 7, tzinfo=dt_timezone.utc),
+        ])
+        self.assertEqual(dates[2].year, timezone.now().year)
+
+    def test_an_interrupted_import_resumes_after_its_last_committed_batch(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f"{directory.name}/products.ndjson"
+        with open(path, "w") as f:
+            for i in range(5):
+                f.write(json.dumps({"name": f"Imported {i}", "price": "1.00", "stock": i}) + "\n")
+
+        calls = []
+
+        def crash_after_inserting(rows):
+            calls.append(rows)
+            result = bulk_create_products(rows)
+            if len(calls) == 2:
+                raise RuntimeError("killed")
+            return result
+
+        with mock.patch.dict("crm.management.commands.crm_import.IMPORTERS", {"products": crash_after_inserting}):
+            with self.assertRaises(RuntimeError):
+                call_command("crm_import", "products", path, "--batch-size", "2", stdout=StringIO())
+        # The second batch rolled back together with its checkpoint
+        self.assertEqual(ImportCheckpoint.objects.get().offset, 2)
+        self.assertEqual(Product.objects.count(), 2)
+
+        stdout = StringIO()
+        call_command("crm_import", "products", path, "--batch-size", "2", stdout=stdout)
+        self.assertIn("Resuming at row 2", stdout.getvalue())
+        self.assertEqual(sorted(Product.objects.values_list("name", flat=True)), [f"Imported {i}" for i in range(5)])
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_rejecting_every_order_says_so(self):
+        data, _ = self.execute_operation(self.BULK_CREATE_ORDERS, {
+            "input": [{"customerId": 999, "productIds": [999]}],
+        })
+        result = data["bulkCreateOrders"]
+        self.assertEqual((result["orders"], result["message"]), ([], "No orders created."))
+        self.assertEqual(len(result["errors"]), 1)
+
+
+# -------------------------------
+# Chunked Deletion
+# -------------------------------
+class DeletionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers, cls.products = seed(customers=6, orders_per_customer=5)
+        rebuild_rollups(settle_seconds=0)
+        reconcile_counters()
+
+    def test_cascades_across_chunks(self):
+        doomed = Customer.objects.filter(pk__in=[c.pk for c in self.customers[:4]])
+        chunks = []
+        counts = delete_customers(doomed, chunk_size=3, progress=chunks.append)
+        self.assertEqual(
+            counts, {"customers": 4, "orders": 20, "order_lines": 40, "rollups": 8}
+        )
+        self.assertEqual([chunk["customers"] for chunk in chunks], [3, 4])
+        self.assertEqual(Customer.objects.count(), 2)
+        self.assertFalse(Order.products.through.objects.exclude(order__customer__in=self.customers[4:]).exists())
+        self.assertFalse(CustomerRevenueRollup.objects.filter(customer__in=self.customers[:4]).exists())
+        self.assertEqual(read_counters(), computed_counters())
+
+    def test_inactive_customers_skip_anyone_with_orders(self):
+        old = timezone.now() - timedelta(days=400)
+        idle = Customer.objects.create(name="Idle", email="idle@example.com")
+        Customer.objects.filter(pk__in=[idle.pk, self.customers[0].pk]).update(created_at=old)
+        self.assertEqual(delete_customers(inactive_customers())["customers"], 1)
+        self.assertFalse(Customer.objects.filter(pk=idle.pk).exists())
+        self.assertTrue(Customer.objects.filter(pk=self.customers[0].pk).exists())
+
+
+# -------------------------------
+# Order Reminders
+# -------------------------------
+class RecordingSender:
+    def __init__(self, fail_first=()):
+        self.sent = []
+        self.failing = set(fail_first)
+
+    def send(self, reminder):
+        if reminder.email in self.failing:
+            self.failing.discard(reminder.email)
+            raise ConnectionError("try again")
+        self.sent.append(reminder)
+
+    def close(self):
+        pass
+
+
+@override_settings(CRM_REMINDERS={"RATE_LIMIT": None, "RETRY_BACKOFF": 0})
+class OrderReminderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers, cls.products = seed(customers=5, orders_per_customer=3)
+
+    def test_one_reminder_per_customer_retrying_failures(self):
+        sender = RecordingSender(fail_first=[self.customers[0].email])
+        self.assertEqual(send_order_reminders(sender=sender, workers=3), {"sent": 5, "failed": 0})
+        self.assertEqual(sorted(r.customer_id for r in sender.sent), [c.pk for c in self.customers])
+        self.assertEqual({r.order_count for r in sender.sent}, {3})
+
+    def test_reruns_only_send_for_new_orders(self):
+        send_order_reminders(sender=RecordingSender())
+        Order.objects.create(customer=self.customers[2], total_amount=5)
+        sender = RecordingSender()
+        self.assertEqual(send_order_reminders(sender=sender), {"sent": 1, "failed": 0})
+        self.assertEqual([r.customer_id for r in sender.sent], [self.customers[2].pk])
+        self.assertEqual(send_order_reminders(sender=sender), {"sent": 0, "failed": 0})
+
+    def test_failed_sends_wait_for_the_next_run(self):
+        email = self.customers[1].email
+        sender = RecordingSender(fail_first=[email])
+        self.assertEqual(send_order_reminders(sender=sender, max_attempts=1), {"sent": 4, "failed": 1})
+        self.assertFalse(OrderReminder.objects.filter(customer=self.customers[1]).exists())
+        self.assertEqual(send_order_reminders(sender=sender), {"sent": 1, "failed": 0})
+
+
+# -------------------------------
+# NDJSON Export
+# -------------------------------
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(customers=5, products=3, orders_per_customer=1)
+
+    def expected_orders(self):
+        return [
+            {
+                "id": order.pk, "customer_id": order.customer_id, "total_amount": "10.00",
+                "order_date": DjangoJSONEncoder().default(order.order_date),
+                "product_ids": sorted(order.products.values_list("pk", flat=True)),
+            }
+            for order in Order.objects.order_by("pk")
+        ]
+
+    def test_rows_stream_under_wsgi(self):
+        response = self.client.get("/export/orders.ndjson")
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.is_async)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected_orders())
+
+    async def test_rows_stream_from_the_async_orm_under_asgi(self):
+        response = await self.async_client.get("/export/orders.ndjson")
+        self.assertTrue(response.streaming)
+        self.assertTrue(response.is_async)
+        lines = b"".join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], await sync_to_async(self.expected_orders)())
+
+    async def test_one_chunk_per_batch(self):
+        queryset = Customer.objects.exclude(name="Customer 2")
+        fields = ("id", "name")
+        chunks = await sync_to_async(list)(iter_ndjson("customers", queryset, fields, batch_size=2))
+        self.assertEqual([chunk async for chunk in aiter_ndjson("customers", queryset, fields, batch_size=2)], chunks)
+        self.assertEqual([chunk.count("\n") for chunk in chunks], [2, 2])
+        self.assertEqual(json.loads(chunks[1].splitlines()[1])["name"], "Customer 4")
+
+    def test_filters_and_unknown_models(self):
+        response = self.client.get("/export/customers.ndjson", {"name": "Customer 3"})
+        self.assertEqual([json.loads(line)["name"] for line in b"".join(response.streaming_content).splitlines()], ["Customer 3"])
+        self.assertEqual(self.client.get("/export/invoices.ndjson").status_code, 404)
+
+
+# -------------------------------
+# Replica Routing
+# -------------------------------
+@override_settings(CRM_DATABASE_ROUTING={"REPLICAS": ["replica"], "STICKY_SECONDS": 10})
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        # The replica is this test's own connection, so it sees the test's transaction
+        connections["replica"] = connections["default"]
+        self.addCleanup(connections.__delitem__, "replica")
+        self.router = ReplicaRouter()
+
+    def request(self, written=None):
+        request = RequestFactory().post("/graphql")
+        if written is not None:
+            response = HttpResponse()
+            response.set_signed_cookie("crm_written", json.dumps(written), salt=COOKIE_SALT)
+            request.COOKIES["crm_written"] = response.cookies["crm_written"].value
+        return request
+
+    def test_queries_read_the_replica_until_a_write(self):
+        request = self.request()
+        with operation_route(request, "query"):
+            self.assertEqual(self.router.db_for_read(Product), "replica")
+            Product.objects.create(name="Routed", price=1, stock=1)
+            self.assertEqual(self.router.db_for_read(Product), None)
+        # A later query in the same request stays on the primary
+        with operation_route(request, "query"):
+            self.assertEqual(self.router.db_for_read(Product), None)
+
+    def test_mutations_use_the_primary(self):
+        with operation_route(self.request(), "mutation"):
+            self.assertEqual(self.router.db_for_read(Product), None)
+            self.assertEqual(self.router.db_for_write(Product), "default")
+
+    def test_writers_wait_for_the_replica_to_catch_up(self):
+        response = self.client.post(
+            "/graphql", {"query": 'mutation { createProduct(input: {name: "New", price: 1, stock: 1}) { success } }'},
+            content_type="application/json",
+        )
+        request = self.request()
+        request.COOKIES["crm_written"] = response.cookies["crm_written"].value
+        written = get_state(request).written
+        self.assertEqual(written, read_versions("default"))
+        self.assertEqual(choose_replica(get_state(request)), "replica")
+
+        behind = {**written, "crm_product": written["crm_product"] + 1}
+        self.assertIsNone(choose_replica(get_state(self.request(behind))))
+
+
+# -------------------------------
+# Subscriptions
+# -------------------------------
+async def until(predicate, timeout=5):
+    async def poll():
+        while not predicate():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+class HubTests(SimpleTestCase):
+    async def test_publish_reaches_every_subscriber_of_the_topic(self):
+        hub = Hub()
+        async with hub.subscribe("a") as first, hub.subscribe("a") as second, hub.subscribe("b") as other:
+            # Writers publish from their own threads
+            await asyncio.to_thread(hub.publish, "a", [1, 2])
+            await until(lambda: first.queue.qsize() == 2 and second.queue.qsize() == 2)
+            events = aiter(first)
+            self.assertEqual([await anext(events), await anext(events)], [1, 2])
+            self.assertTrue(other.queue.empty())
+        self.assertFalse(hub.has_subscribers("a"))
+
+    async def test_overflow_ends_the_subscriber(self):
+        hub = Hub()
+        async with hub.subscribe("a", maxsize=2) as subscriber:
+            subscriber.offer([1, 2, 3])
+            # The backlog is dropped so the overflow is seen at once
+            self.assertEqual(subscriber.queue.qsize(), 1)
+            subscriber.offer([4])
+            with self.assertRaises(SubscriberOverflow):
+                await anext(aiter(subscriber))
+
+    async def test_a_full_queue_keeps_its_events(self):
+        hub = Hub()
+        async with hub.subscribe("a", maxsize=2) as subscriber:
+            subscriber.offer([1, 2])
+            events = aiter(subscriber)
+            self.assertEqual([await anext(events), await anext(events)], [1, 2])
+            self.assertFalse(subscriber.overflowed)
+
+
+class PublishOnCommitTests(TestCase):
+    def test_nothing_is_fetched_without_subscribers(self):
+        with self.assertNumQueries(0), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            orders_created([1, 2])
+        self.assertEqual(len(callbacks), 1)
+
+
+class SocketSession:
+    """Drives the websocket app through scripted receive and send queues."""
+
+    def __init__(self, path="/graphql", subprotocols=("graphql-transport-ws",)):
+        self.inbox, self.outbox = asyncio.Queue(), asyncio.Queue()
+        scope = {"type": "websocket", "path": path, "subprotocols": list(subprotocols), "client": ("127.0.0.1", 0)}
+        self.inbox.put_nowait({"type": "websocket.connect"})
+        self.app = asyncio.create_task(GraphQLWebSocketApp(schema)(scope, self.inbox.get, self.outbox.put))
+
+    async def send(self, message):
+        await self.inbox.put({"type": "websocket.receive", "text": json.dumps(message)})
+
+    async def receive(self):
+        message = await asyncio.wait_for(self.outbox.get(), 5)
+        if message["type"] == "websocket.send":
+            return json.loads(message["text"])
+        return message
+
+    async def open(self):
+        accept = await self.receive()
+        await self.send({"type": "connection_init"})
+        return accept, await self.receive()
+
+    async def close(self):
+        await self.inbox.put({"type": "websocket.disconnect"})
+        await asyncio.wait_for(self.app, 5)
+
+
+class WebSocketTests(TransactionTestCase):
+    # The socket reads on a thread of its own, so its data must be committed
+    serialized_rollback = True
+
+    async def test_connection_init_and_single_result_operations(self):
+        await sync_to_async(seed)(customers=3)
+        socket = SocketSession()
+        accept, ack = await socket.open()
+        self.assertEqual(accept, {"type": "websocket.accept", "subprotocol": "graphql-transport-ws"})
+        self.assertEqual(ack, {"type": "connection_ack"})
+
+        await socket.send({"type": "ping"})
+        self.assertEqual(await socket.receive(), {"type": "pong"})
+        await socket.send({"id": "1", "type": "subscribe", "payload": {"query": "{ totalOrders allProducts(first: 1) { edges { node { name } } } }"}})
+        self.assertEqual(await socket.receive(), {"id": "1", "type": "next", "payload": {"data": {
+            "totalOrders": 6, "allProducts": {"edges": [{"node": {"name": "Product 0"}}]},
+        }}})
+        self.assertEqual(await socket.receive(), {"id": "1", "type": "complete"})
+        await socket.close()
+
+    @override_settings(CRM_DATABASE_ROUTING={"REPLICAS": ["default"], "STICKY_SECONDS": 10})
+    async def test_operations_are_routed_without_cookies(self):
+        socket = SocketSession()
+        await socket.open()
+        await socket.send({"id": "1", "type": "subscribe", "payload": {"query": "{ totalOrders }"}})
+        self.assertEqual(await socket.receive(), {"id": "1", "type": "next", "payload": {"data": {"totalOrders": 0}}})
+        self.assertEqual(await socket.receive(), {"id": "1", "type": "complete"})
+        await socket.close()
+
+    async def test_subscribing_before_connection_init_closes_the_socket(self):
+        socket = SocketSession()
+        await socket.receive()
+        await socket.send({"id": "1", "type": "subscribe", "payload": {"query": "{ totalOrders }"}})
+        self.assertEqual(await socket.receive(), {"type": "websocket.close", "code": 4401, "reason": "Unauthorized"})
+        await socket.close()
+
+    async def test_other_paths_and_protocols_are_refused(self):
+        for socket in (SocketSession(path="/other"), SocketSession(subprotocols=("graphql-ws",))):
+            self.assertEqual(await socket.receive(), {"type": "websocket.close", "code": 1002})
+            await asyncio.wait_for(socket.app, 5)
+
+    async def test_product_stock_changed_below_threshold(self):
+        plenty, scarce = await sync_to_async(Product.objects.bulk_create)([
+            Product(name="Plenty", price=1, stock=50),
+            Product(name="Scarce", price=1, stock=50),
+        ])
+        socket = SocketSession()
+        await socket.open()
+        await socket.send({"id": "low", "type": "subscribe", "payload": {
+            "query": "subscription { productStockChanged(threshold: 10) { name stock orders { edges { node { id } } } } }",
+        }})
+        await until(lambda: hub.has_subscribers(PRODUCT_STOCK_CHANGED))
+
+        for product, stock in ((plenty, 40), (scarce, 3)):
+            product.stock = stock
+            await sync_to_async(product.save)(update_fields=["stock"])
+        # Published in order, so Plenty would have arrived first
+        self.assertEqual(await socket.receive(), {"id": "low", "type": "next", "payload": {"data": {
+            "productStockChanged": {"name": "Scarce", "stock": 3, "orders": {"edges": []}},
+        }}})
+
+        await socket.send({"id": "low", "type": "complete"})
+        await until(lambda: not hub.has_subscribers(PRODUCT_STOCK_CHANGED))
+        await socket.close()
+
+    @override_settings(CRM_SUBSCRIPTIONS={"QUEUE_SIZE": 2})
+    async def test_a_subscriber_that_falls_behind_is_ended(self):
+        socket = SocketSession()
+        await socket.open()
+        await socket.send({"id": "1", "type": "subscribe", "payload": {
+            "query": "subscription { productStockChanged { name } }",
+        }})
+        await until(lambda: hub.has_subscribers(PRODUCT_STOCK_CHANGED))
+
+        # More events in one go than the queue holds
+        hub.publish(PRODUCT_STOCK_CHANGED, [Product(pk=n, name=f"P{n}", price=1, stock=0) for n in range(3)])
+        self.assertEqual(await socket.receive(), {"id": "1", "type": "error", "payload": [{
+            "message": "Subscriber fell too far behind on product_stock_changed; resubscribe to continue.",
+        }]})
+        await until(lambda: not hub.has_subscribers(PRODUCT_STOCK_CHANGED))
+
+        # The socket stays open for a new subscription
+        await socket.send({"id": "2", "type": "subscribe", "payload": {"query": "{ __typename }"}})
+        self.assertEqual(await socket.receive(), {"id": "2", "type": "next", "payload": {"data": {"__typename": "Query"}}})
+        await socket.close()
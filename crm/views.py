@@ -1,3 +1,513 @@
-from django.shortcuts import render
+import json
+from collections import namedtuple
+from inspect import isawaitable
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, transaction
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    StreamingHttpResponse,
+)
+from django.views.decorators.http import require_GET
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    execute,
+    get_operation_ast,
+    parse,
+    validate,
+    validate_schema,
+)
+
+from .cost import (
+    QueryCostError,
+    acharge_query_cost,
+    charge_query_cost,
+    get_setting as get_cost_setting,
+    get_validation_rules,
+    query_cost,
+)
+from .export import EXPORTS, aiter_ndjson, iter_ndjson
+from .loaders import AsyncContext, BatchExecutionContext
+from .metrics import get_setting as get_metrics_setting, record_operation, record_rejected, registry
+from .query_trace import QueryTraceMiddleware, atrace_queries, trace_queries
+from .persisted_queries import (
+    DocumentCache,
+    PersistedQueryError,
+    aregister_query,
+    aresolve_persisted_query,
+    get_extensions,
+    get_setting,
+    query_hash,
+    register_query,
+    resolve_persisted_query,
+)
+from .response_cache import ResponseCache
+from .routing import aoperation_route, operation_route, remember_writes
+
+# An operation that passed parsing, validation and cost analysis
+PreparedOperation = namedtuple(
+    "PreparedOperation", "query document operation_ast variables operation_name cost"
+)
+
+# -------------------------------
+# GraphQL View
+# -------------------------------
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView with batched loaders, persisted queries, a document cache,
+    query cost limits, an opt-in response cache and read-replica routing.
+
+    Parsed and validated documents are cached by the sha256 of their text,
+    so a repeated operation (sent in full or as a persisted-query hash)
+    goes straight to cost analysis and execution.
+    """
+
+    execution_context_class = BatchExecutionContext
+    document_cache = DocumentCache(get_setting("DOCUMENT_CACHE_SIZE"))
+    response_cache = ResponseCache()
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        remember_writes(request, response)
+        return response
+
+    def get_document(self, query):
+        """Return ``(document, errors)`` for ``query``, parsing and validating on a miss."""
+        key = query_hash(query)
+        document = self.document_cache.get(key)
+        if document is not None:
+            return document, None
+
+        try:
+            document = parse(query)
+        except Exception as e:
+            return None, [e]
+
+        validation_errors = validate(
+            self.schema.graphql_schema,
+            document,
+            self.validation_rules or get_validation_rules(),
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+        if validation_errors:
+            return None, validation_errors
+
+        self.document_cache.set(key, document)
+        return document, None
+
+    def get_client_id(self, request):
+        """Identity the cost throttle is tracked against."""
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return f"user:{user.pk}"
+        return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True or (
+            execution_result and execution_result.errors
+        ):
+            set_rollback()
+
+        return self.encode_response(request, execution_result, id, show_graphiql)
+
+    def encode_response(self, request, execution_result, id=None, show_graphiql=False):
+        """Return ``(body, status_code)`` for an execution result."""
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            # The stock view drops extensions; they carry the query cost
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        operation = self.prepare_operation(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if not isinstance(operation, PreparedOperation):
+            if operation is not None:
+                record_rejected(operation_name, operation.errors)
+            return operation
+        return self.run_operation(request, operation)
+
+    def prepare_operation(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        """
+        Resolve, parse, validate and cost-check an operation without running it.
+
+        Returns a ``PreparedOperation``, or the ``ExecutionResult`` (or None
+        for GraphiQL) to send back instead.
+        """
+        try:
+            query, register = resolve_persisted_query(get_extensions(request, data), query)
+        except PersistedQueryError as e:
+            return error_result(e)
+
+        operation = self.check_operation(request, query, variables, operation_name, show_graphiql)
+        if not isinstance(operation, PreparedOperation):
+            return operation
+        if register:
+            # Only text that parsed and validated is stored under its hash
+            register_query(query)
+        try:
+            charge_query_cost(self.get_client_id(request), operation.cost)
+        except QueryCostError as e:
+            return error_result(e)
+        return operation
+
+    def check_operation(self, request, query, variables, operation_name, show_graphiql=False):
+        """The part of ``prepare_operation`` that needs no shared cache."""
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        document, errors = self.get_document(query)
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        cost = 0
+        if operation_ast is not None:
+            try:
+                cost = query_cost(schema, document, operation_ast, variables)
+            except QueryCostError as e:
+                return error_result(e)
+            except GraphQLError as e:
+                return ExecutionResult(errors=[e])
+
+        return PreparedOperation(query, document, operation_ast, variables, operation_name, cost)
+
+    def run_operation(self, request, operation):
+        operation_ast, operation_name = operation.operation_ast, operation.operation_name
+        if operation_ast is not None:
+            operation_type = operation_ast.operation.value
+            operation_name = operation_name or (operation_ast.name and operation_ast.name.value)
+        else:
+            operation_type = "unknown"
+
+        # Routed first: metrics and tracing wrap the connection the operation reads
+        with operation_route(request, operation_type), record_operation(
+            request, operation_type, operation_name
+        ) as recorded, trace_queries(request, f"{operation_type} {operation_name or 'anonymous'}"):
+            recorded.result = self.execute_operation(request, operation)
+        return recorded.result
+
+    def get_execute_options(self, request, operation):
+        return {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": operation.variables,
+            "operation_name": operation.operation_name,
+            "middleware": self.get_middleware(request),
+            "execution_context_class": self.execution_context_class,
+        }
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        if getattr(request, "crm_query_trace", None) is not None:
+            middleware = [*(middleware or ()), QueryTraceMiddleware()]
+        return middleware
+
+    def execute_operation(self, request, operation):
+        query, document, operation_ast, variables, operation_name, cost = operation
+        schema = self.schema.graphql_schema
+
+        cache_hit = None
+        try:
+            execute_options = self.get_execute_options(request, operation)
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+            elif (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.QUERY
+                and self.response_cache.enabled
+            ):
+                result, cache_hit = self.response_cache.execute(
+                    self.response_cache.request_key(query, document, operation_name, variables),
+                    lambda: execute(schema, document, **execute_options),
+                )
+            else:
+                result = execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        return self.add_extensions(result, cost, cache_hit)
+
+    def add_extensions(self, result, cost, cache_hit=None):
+        result.extensions = {
+            **(result.extensions or {}),
+            "cost": {"requested": cost, "maximum": get_cost_setting("MAX_COST")},
+        }
+        if cache_hit is not None:
+            result.extensions["responseCache"] = {
+                "hit": cache_hit,
+                "hitRatio": round(self.response_cache.hit_ratio, 4),
+            }
+        return result
+
+
+def error_result(e):
+    """A rejected operation's result; ``e`` carries a ``code`` (and maybe a ``cost``)."""
+    extensions = {"code": e.code}
+    if getattr(e, "cost", None) is not None:
+        extensions["cost"] = e.cost
+    return ExecutionResult(errors=[GraphQLError(str(e), extensions=extensions)])
+
+
+# -------------------------------
+# Async GraphQL View
+# -------------------------------
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    CRMGraphQLView as an async view, for ASGI.
+
+    Under ASGI Django gives every in-flight request to a sync view a thread
+    of its own, which sits blocked while its queries run. This view parses,
+    validates, cost-checks and executes query operations on the event
+    loop: with an ``AsyncContext`` the resolvers return awaitables backed
+    by async loaders and the async ORM (crm/loaders.py), so a request
+    waiting on the database blocks no thread of its own. What has no async
+    form still runs through ``sync_to_async``: mutations (they need
+    ``transaction.atomic``), raw-cursor reads (search, table versions) and
+    the execute wrappers that metrics and tracing install on a connection.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            # The cost throttle reads request.user; load it without blocking the loop
+            if hasattr(request, "auser"):
+                request.user = await request.auser()
+
+            if self.batch:
+                # In order: a request's operations share its connection and routing state
+                responses = [await self.get_response_async(request, entry) for entry in data]
+                result = "[{}]".format(",".join(response[0] for response in responses))
+                status_code = max((response[1] for response in responses), default=200)
+            else:
+                result, status_code = await self.get_response_async(request, data)
+
+            response = HttpResponse(status=status_code, content=result, content_type="application/json")
+            if getattr(request, "crm_routing", None) is not None and request.crm_routing.wrote:
+                await sync_to_async(remember_writes)(request, response)
+            return response
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    async def get_response_async(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        operation = await self.aprepare_operation(request, data, query, variables, operation_name)
+        if isinstance(operation, PreparedOperation):
+            execution_result = await self.run_operation_async(request, operation)
+        else:
+            record_rejected(operation_name, operation.errors)
+            execution_result = operation
+
+        return self.encode_response(request, execution_result, id)
+
+    async def aprepare_operation(self, request, data, query, variables, operation_name):
+        """``prepare_operation`` with the persisted-query store and throttle on the async cache API."""
+        try:
+            query, register = await aresolve_persisted_query(get_extensions(request, data), query)
+        except PersistedQueryError as e:
+            return error_result(e)
+
+        operation = self.check_operation(request, query, variables, operation_name)
+        if not isinstance(operation, PreparedOperation):
+            return operation
+        if register:
+            await aregister_query(query)
+        try:
+            await acharge_query_cost(self.get_client_id(request), operation.cost)
+        except QueryCostError as e:
+            return error_result(e)
+        return operation
+
+    async def run_operation_async(self, request, operation):
+        """Queries execute on the event loop; everything else on the request's sync thread."""
+        operation_ast = operation.operation_ast
+        if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+            return await sync_to_async(self.run_operation)(request, operation)
+
+        operation_name = operation.operation_name or (operation_ast.name and operation_ast.name.value)
+        context = AsyncContext(self.get_context(request))
+        async with aoperation_route(request, "query"), record_operation(
+            context, "query", operation_name
+        ) as recorded, atrace_queries(context, f"query {operation_name or 'anonymous'}"):
+            recorded.result = await self.aexecute_operation(context, operation)
+        return recorded.result
+
+    async def aexecute_operation(self, context, operation):
+        schema = self.schema.graphql_schema
+        execute_options = self.get_execute_options(context, operation)
+
+        async def run():
+            result = execute(schema, operation.document, **execute_options)
+            return await result if isawaitable(result) else result
+
+        cache_hit = None
+        try:
+            if self.response_cache.enabled:
+                result, cache_hit = await self.response_cache.aexecute(
+                    self.response_cache.request_key(
+                        operation.query, operation.document, operation.operation_name, operation.variables
+                    ),
+                    run,
+                )
+            else:
+                result = await run()
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        return self.add_extensions(result, operation.cost, cache_hit)
+
+
+# -------------------------------
+# Prometheus Metrics
+# -------------------------------
+def collect_cache_metrics():
+    return [
+        ("crm_graphql_document_cache_hits_total", "counter",
+         "Operations served a parsed and validated document from the cache.",
+         CRMGraphQLView.document_cache.hits),
+        ("crm_graphql_document_cache_misses_total", "counter",
+         "Operations whose document was parsed and validated.",
+         CRMGraphQLView.document_cache.misses),
+        ("crm_graphql_response_cache_hits_total", "counter",
+         "Query responses served from the response cache.",
+         CRMGraphQLView.response_cache.hits),
+        ("crm_graphql_response_cache_misses_total", "counter",
+         "Cacheable query responses that were executed.",
+         CRMGraphQLView.response_cache.misses),
+        ("crm_graphql_response_cache_hit_ratio", "gauge",
+         "Response cache hits over lookups since the process started.",
+         CRMGraphQLView.response_cache.hit_ratio),
+    ]
+
+
+registry.collectors.append(collect_cache_metrics)
+
+
+@require_GET
+def metrics_view(request):
+    if not get_metrics_setting("ENABLED"):
+        raise Http404("Metrics are disabled.")
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# -------------------------------
+# NDJSON Export
+# -------------------------------
+@require_GET
+def export_view(request, model_name):
+    if model_name not in EXPORTS:
+        raise Http404(f"Unknown export '{model_name}'.")
+    model, filterset_class, fields = EXPORTS[model_name]
+
+    queryset = model.objects.all()
+    if request.GET:
+        filterset = filterset_class(request.GET, queryset=queryset)
+        if not filterset.is_valid():
+            return HttpResponseBadRequest(
+                json.dumps(filterset.errors), content_type="application/json"
+            )
+        # Filters across m2m joins can repeat rows; seek over distinct ids instead
+        queryset = model.objects.filter(pk__in=filterset.qs.values("pk"))
+
+    rows = aiter_ndjson if isinstance(request, ASGIRequest) else iter_ndjson
+    response = StreamingHttpResponse(rows(model_name, queryset, fields), content_type="application/x-ndjson")
+    response["Content-Disposition"] = f'attachment; filename="{model_name}.ndjson"'
+    response["Cache-Control"] = "no-store"
+    return response
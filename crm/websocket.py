@@ -0,0 +1,238 @@
+"""
+GraphQL over websockets (the ``graphql-transport-ws`` protocol) for the ASGI app.
+
+Operations go through the same persisted-query, validation and cost
+checks as ``/graphql``. A subscription streams from the in-process hub in
+``crm.pubsub``. Each event is executed on the event loop like an async
+view query, with the relations it was fetched with primed into the
+loaders, and sent as a ``next`` message. A socket's database calls run on
+one thread of its own, as an HTTP request's do. A slow client stalls only
+its own sends: its subscription queues fill and are ended (see
+``SubscriberOverflow``) while other connections carry on. Queries and
+mutations are answered with a single ``next`` and a ``complete``.
+"""
+import asyncio
+import json
+from inspect import isawaitable
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.db import connections
+from graphene_django.views import HttpError
+from graphql import ExecutionResult, OperationType, create_source_event_stream, execute
+
+from .loaders import AsyncContext, BatchExecutionContext, Loaders
+from .pubsub import SubscriberOverflow, get_setting
+from .views import AsyncCRMGraphQLView, PreparedOperation
+
+SUBPROTOCOL = "graphql-transport-ws"
+
+# Close codes from the graphql-transport-ws specification
+BAD_REQUEST = 4400
+UNAUTHORIZED = 4401
+INIT_TIMEOUT = 4408
+SUBSCRIBER_EXISTS = 4409
+TOO_MANY_INITS = 4429
+
+
+class SocketRequest:
+    """Stands in for the HttpRequest the view helpers expect, and is the resolvers' context."""
+
+    method = "POST"
+    user = None
+
+    def __init__(self, scope):
+        client = scope.get("client") or ("", 0)
+        self.scope = scope
+        self.GET = {}
+        self.META = {"REMOTE_ADDR": client[0]}
+
+
+class ProtocolError(Exception):
+    def __init__(self, code, reason):
+        super().__init__(reason)
+        self.code = code
+        self.reason = reason
+
+
+# -------------------------------
+# ASGI Application
+# -------------------------------
+class GraphQLWebSocketApp:
+    def __init__(self, schema, path="/graphql"):
+        self.path = path
+        self.view = AsyncCRMGraphQLView(schema=schema)
+
+    async def __call__(self, scope, receive, send):
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+        if scope["path"].rstrip("/") != self.path or SUBPROTOCOL not in scope.get("subprotocols", ()):
+            await send({"type": "websocket.close", "code": 1002})
+            return
+        await send({"type": "websocket.accept", "subprotocol": SUBPROTOCOL})
+        async with ThreadSensitiveContext():
+            try:
+                await Connection(self.view, scope, send).serve(receive)
+            finally:
+                # The socket's thread goes away with it; so do its connections
+                await sync_to_async(connections.close_all)()
+
+
+class Connection:
+    """One websocket: its handshake state, its running operations and its outbox."""
+
+    def __init__(self, view, scope, send):
+        self.view = view
+        self.scope = scope
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self.closed = False
+        self.acknowledged = False
+        self.operations = {}  # id -> Task
+
+    async def serve(self, receive):
+        init_timer = asyncio.create_task(self.close_unless_acknowledged())
+        try:
+            while not self.closed:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    self.closed = True
+                    break
+                try:
+                    await self.handle(json.loads(message.get("text") or message.get("bytes") or ""))
+                except ProtocolError as e:
+                    await self.close(e.code, e.reason)
+                except (ValueError, TypeError, AttributeError, KeyError):
+                    await self.close(BAD_REQUEST, "Invalid message received")
+        finally:
+            init_timer.cancel()
+            for task in self.operations.values():
+                task.cancel()
+
+    async def handle(self, message):
+        kind = message["type"]
+        if kind == "connection_init":
+            if self.acknowledged:
+                raise ProtocolError(TOO_MANY_INITS, "Too many initialisation requests")
+            self.acknowledged = True
+            await self.send({"type": "connection_ack"})
+        elif kind == "ping":
+            await self.send({"type": "pong"})
+        elif kind == "pong":
+            pass
+        elif kind == "subscribe":
+            if not self.acknowledged:
+                raise ProtocolError(UNAUTHORIZED, "Unauthorized")
+            id, payload = message["id"], message["payload"]
+            if id in self.operations:
+                raise ProtocolError(SUBSCRIBER_EXISTS, f"Subscriber for {id} already exists")
+            if len(self.operations) >= get_setting("MAX_SUBSCRIPTIONS"):
+                await self.send_error(id, "Too many active subscriptions on this connection.")
+                return
+            self.operations[id] = asyncio.create_task(self.run(id, payload))
+        elif kind == "complete":
+            task = self.operations.pop(message["id"], None)
+            if task is not None:
+                task.cancel()
+        else:
+            raise ProtocolError(BAD_REQUEST, f"Unexpected message type {kind!r}")
+
+    async def close_unless_acknowledged(self):
+        await asyncio.sleep(get_setting("CONNECTION_INIT_TIMEOUT"))
+        if not self.acknowledged:
+            await self.close(INIT_TIMEOUT, "Connection initialisation timeout")
+
+    # -------------------------------
+    # Operations
+    # -------------------------------
+    async def run(self, id, payload):
+        try:
+            request = SocketRequest(self.scope)
+            query, variables, operation_name, _ = self.view.get_graphql_params(request, payload)
+            try:
+                operation = await self.view.aprepare_operation(request, payload, query, variables, operation_name)
+            except HttpError as e:
+                await self.send_error(id, str(e))
+                return
+
+            if not isinstance(operation, PreparedOperation):
+                await self.send_errors(id, operation)
+            elif (
+                operation.operation_ast is not None
+                and operation.operation_ast.operation == OperationType.SUBSCRIPTION
+            ):
+                await self.stream(id, operation)
+            else:
+                result = await self.view.run_operation_async(request, operation)
+                await self.send_next(id, result)
+                await self.send({"id": id, "type": "complete"})
+        finally:
+            if self.operations.get(id) is asyncio.current_task():
+                del self.operations[id]
+
+    async def stream(self, id, operation):
+        stream = await create_source_event_stream(
+            self.view.schema.graphql_schema,
+            operation.document,
+            context_value=SocketRequest(self.scope),
+            variable_values=operation.variables,
+            operation_name=operation.operation_name,
+        )
+        if isinstance(stream, ExecutionResult):
+            await self.send_errors(id, stream)
+            return
+
+        try:
+            async for event in stream:
+                result = await self.execute_event(operation, event)
+                await self.send_next(id, result)
+        except SubscriberOverflow as e:
+            await self.send_error(id, str(e))
+            return
+        finally:
+            await stream.aclose()
+        await self.send({"id": id, "type": "complete"})
+
+    async def execute_event(self, operation, event):
+        context = AsyncContext(SocketRequest(self.scope))
+        # Relations fetched with the event answer nested fields without a query
+        context.crm_loaders = Loaders(is_async=True)
+        context.crm_loaders.track([event])
+        result = execute(
+            self.view.schema.graphql_schema,
+            operation.document,
+            root_value=event,
+            context_value=context,
+            variable_values=operation.variables,
+            operation_name=operation.operation_name,
+            middleware=self.view.get_middleware(context),
+            execution_context_class=BatchExecutionContext,
+        )
+        return await result if isawaitable(result) else result
+
+    # -------------------------------
+    # Outbox
+    # -------------------------------
+    async def send(self, message):
+        async with self._send_lock:
+            if not self.closed:
+                await self._send({"type": "websocket.send", "text": json.dumps(message)})
+
+    async def send_next(self, id, result):
+        payload = {"data": result.data}
+        if result.errors:
+            payload["errors"] = [self.view.format_error(e) for e in result.errors]
+        await self.send({"id": id, "type": "next", "payload": payload})
+
+    async def send_errors(self, id, result):
+        errors = [self.view.format_error(e) for e in result.errors or ()]
+        await self.send({"id": id, "type": "error", "payload": errors})
+
+    async def send_error(self, id, message):
+        await self.send({"id": id, "type": "error", "payload": [{"message": message}]})
+
+    async def close(self, code, reason):
+        async with self._send_lock:
+            if not self.closed:
+                self.closed = True
+                await self._send({"type": "websocket.close", "code": code, "reason": reason})
@@ -1,8 +1,13 @@
 import graphene
 from crm.schema import Query as CRMQuery, Mutation as CRMMutation
+from crm.schemaa import (
+    Query as CRMRelayQuery,
+    Mutation as CRMRelayMutation,
+    Subscription as CRMSubscription,
+)
 
 
-class Query(CRMQuery, graphene.ObjectType):
+class Query(CRMQuery, CRMRelayQuery, graphene.ObjectType):
     """
     Root Query class combining all CRM queries.
     Extend this if you add more app-specific queries in the future.
@@ -10,7 +15,7 @@ class Query(CRMQuery, graphene.ObjectType):
     pass
 
 
-class Mutation(CRMMutation, graphene.ObjectType):
+class Mutation(CRMMutation, CRMRelayMutation, graphene.ObjectType):
     """
     Root Mutation class combining all CRM mutations.
     Extend this if you add more app-specific mutations later.
@@ -18,4 +23,11 @@ class Mutation(CRMMutation, graphene.ObjectType):
     pass
 
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+class Subscription(CRMSubscription, graphene.ObjectType):
+    """
+    Root Subscription class, served over websockets by the ASGI app.
+    """
+    pass
+
+
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)